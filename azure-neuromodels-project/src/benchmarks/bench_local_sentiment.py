@@ -0,0 +1,122 @@
+"""
+Local sentiment model vs Text Analytics: throughput and agreement.
+
+    python -m benchmarks.bench_local_sentiment --model functions/analyze_sentiment/models/sentiment_local.npz \
+        --input labeled.jsonl [--cloud-latency-ms 150] [--min-confidence 0.75]
+
+labeled.jsonl holds {"text", "label", "lang"} rows labeled by Text Analytics
+(e.g. exported with train_local_model's Cosmos query). Cloud throughput is measured
+through TextAnalyticsBatcher against the in-process fake with the given latency.
+Results are written to benchmarks/results/local-sentiment-<commit>-<timestamp>.json.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime, timezone
+
+from benchmarks.run_benchmark import FUNCTIONS_DIR, RESULTS_DIR, git_commit  # noqa: F401 (adds functions to sys.path)
+from benchmarks import fakes
+
+BATCH_SIZES = (1, 10, 100, 1000)
+
+
+def load_rows(path: str, limit: int) -> list:
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [r for r in rows if r.get("text") and r.get("label")][:limit]
+
+
+def bench_local(model, texts: list) -> dict:
+    result = {}
+    for batch_size in BATCH_SIZES:
+        started = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            model.predict(texts[i:i + batch_size])
+        elapsed = time.perf_counter() - started
+        result[f"batch_{batch_size}"] = {"docs_per_s": round(len(texts) / elapsed, 1), "ms_per_doc": round(elapsed * 1000 / len(texts), 4)}
+    return result
+
+
+async def bench_cloud(rows: list, latency_ms: float, concurrency: int) -> dict:
+    from analyze_sentiment.text_analytics_batcher import TextAnalyticsBatcher
+    fakes.FakeTextAnalyticsClient.behaviour = fakes.Behaviour(latency_ms, latency_ms * 0.25)
+    batcher = TextAnalyticsBatcher(fakes.FakeTextAnalyticsClient(), max_concurrency=concurrency)
+    documents = [{"id": str(i), "text": r["text"], "language": r.get("lang") or "uk"} for i, r in enumerate(rows)]
+    started = time.perf_counter()
+    await batcher.analyze_sentiment(documents)
+    elapsed = time.perf_counter() - started
+    return {"docs_per_s": round(len(rows) / elapsed, 1), "latency_ms": latency_ms, "concurrency": concurrency, **batcher.stats()}
+
+
+async def bench_local_first(model, rows: list, latency_ms: float, min_confidence: float) -> dict:
+    """
+    local_first: cloud results are replaced by the row labels, so agreement reflects the real
+    cloud labels for escalated messages and the local model for the rest.
+    """
+    from analyze_sentiment.sentiment_backend import SentimentBackend
+    from analyze_sentiment.text_analytics_batcher import TextAnalyticsBatcher
+    from types import SimpleNamespace
+    labels = {str(i): r["label"] for i, r in enumerate(rows)}
+
+    class LabeledCloud(fakes.FakeTextAnalyticsClient):
+        async def analyze_sentiment(self, documents, **kwargs):
+            await self.behaviour.wait()
+            return [SimpleNamespace(is_error=False, id=d["id"], sentiment=labels[d["id"]]) for d in documents]
+
+    fakes.FakeTextAnalyticsClient.behaviour = fakes.Behaviour(latency_ms, latency_ms * 0.25)
+    backend = SentimentBackend("local_first", TextAnalyticsBatcher(LabeledCloud()), model, min_confidence)
+    documents = [{"id": str(i), "text": r["text"], "language": r.get("lang") or "uk"} for i, r in enumerate(rows)]
+    started = time.perf_counter()
+    results = await backend.analyze_sentiment(documents)
+    elapsed = time.perf_counter() - started
+    hits = sum(res.sentiment == r["label"] for res, r in zip(results, rows))
+    return {
+        "docs_per_s": round(len(rows) / elapsed, 1),
+        "agreement": round(hits / len(rows), 4),
+        "escalation_rate": round(backend.metrics["escalated"] / len(rows), 4),
+        "min_confidence": min_confidence,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the local sentiment model against Text Analytics")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--input", required=True, help="JSONL with text/label/lang labeled by Text Analytics")
+    parser.add_argument("--limit", type=int, default=20000)
+    parser.add_argument("--cloud-latency-ms", type=float, default=150)
+    parser.add_argument("--cloud-concurrency", type=int, default=8)
+    parser.add_argument("--min-confidence", type=float, default=0.75)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    from analyze_sentiment.local_model import LocalSentimentModel
+    from analyze_sentiment.train_local_model import evaluate
+    model = LocalSentimentModel.load(args.model)
+    rows = load_rows(args.input, args.limit)
+    texts = [r["text"] for r in rows]
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "rows": len(rows),
+        "local": {**bench_local(model, texts), **evaluate(model, rows)},
+        "cloud": asyncio.run(bench_cloud(rows, args.cloud_latency_ms, args.cloud_concurrency)),
+        "local_first": asyncio.run(bench_local_first(model, rows, args.cloud_latency_ms, args.min_confidence)),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"local-sentiment-{report['commit']}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+"""
+In-process stand-ins for the Azure services used by the functions.
+Each fake has configurable latency and failure rate so the benchmark can
+measure our own overhead (serialization, batching, concurrency) without
+live resources.
+"""
+import time
+import uuid
+import random
+import asyncio
+import threading
+from types import SimpleNamespace
+
+
+class FakeServiceError(Exception):
+    def __init__(self, message="Injected failure", status_code=503):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Behaviour:
+    """
+    Latency (ms, normal distribution clipped at 0) and failure rate of a fake service.
+    """
+
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 5.0, failure_rate: float = 0.0, seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        return delay, fail
+
+    async def wait(self):
+        delay, fail = self._next()
+        await asyncio.sleep(delay)
+        if fail:
+            raise FakeServiceError()
+
+    def wait_sync(self):
+        delay, fail = self._next()
+        time.sleep(delay)
+        if fail:
+            raise FakeServiceError()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "failures": self.failures}
+
+
+# --- Cosmos DB (azure.cosmos.aio) ---
+
+class _AsyncItems:
+    def __init__(self, items, behaviour: Behaviour):
+        self._items = items
+        self._behaviour = behaviour
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self._behaviour.wait()
+        for item in self._items:
+            yield item
+
+    def by_page(self, continuation_token=None):
+        return _AsyncPages(self._items, self._behaviour)
+
+
+class _AsyncPages:
+    def __init__(self, items, behaviour: Behaviour, page_size: int = 100):
+        self._items = items
+        self._behaviour = behaviour
+        self._page_size = page_size
+        self.continuation_token = None
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for i in range(0, len(self._items), self._page_size):
+            await self._behaviour.wait()
+            self.continuation_token = str(i + self._page_size) if i + self._page_size < len(self._items) else None
+            yield _AsyncItems(self._items[i:i + self._page_size], Behaviour(0, 0))
+
+
+class _ChangeFeed:
+    """
+    Change feed over the container's items in insertion order; the continuation
+    token (the pager's continuation_token, opaque in the real SDK) is an offset.
+    """
+
+    def __init__(self, container, page_size: int = 100):
+        self._container = container
+        self._page_size = page_size
+
+    def by_page(self, continuation_token=None):
+        return _ChangeFeedPages(self._container, self._page_size, int(continuation_token or 0))
+
+
+class _ChangeFeedPages:
+    def __init__(self, container, page_size: int, offset: int):
+        self._container = container
+        self._page_size = page_size
+        self.continuation_token = str(offset) if offset else None
+
+    def __aiter__(self):
+        return self._iterate(int(self.continuation_token or 0))
+
+    async def _iterate(self, offset):
+        items = list(self._container.items.values())
+        while offset < len(items):
+            await self._container.behaviour.wait()
+            page = items[offset:offset + self._page_size]
+            offset += len(page)
+            self.continuation_token = str(offset)
+            yield _AsyncItems(page, Behaviour(0, 0))
+
+
+class FakeCosmosContainer:
+    """
+    Dict-backed container. query_items() ignores the SQL text and applies
+    `query_filter` (a predicate over items) so each target can shape results.
+    """
+
+    def __init__(self, behaviour: Behaviour = None, items: list = None, query_filter=None):
+        self.behaviour = behaviour or Behaviour()
+        self.items = {item["id"]: item for item in (items or [])}
+        self.query_filter = query_filter or (lambda item, parameters: True)
+        self.request_charge = 0.0
+        self.client_connection = SimpleNamespace(last_response_headers={"x-ms-request-charge": "1.0"})
+
+    def _charge(self, ru: float, response_hook=None):
+        self.request_charge += ru
+        self.client_connection.last_response_headers = {"x-ms-request-charge": str(ru)}
+        if response_hook:
+            response_hook(self.client_connection.last_response_headers, None)
+
+    async def read(self, **kwargs):
+        await self.behaviour.wait()
+        return {"id": "fake"}
+
+    async def create_item(self, body, **kwargs):
+        await self.behaviour.wait()
+        self._charge(5.0)
+        self.items[body["id"]] = dict(body, _etag=str(uuid.uuid4()))
+        return self.items[body["id"]]
+
+    async def upsert_item(self, body, **kwargs):
+        await self.behaviour.wait()
+        self._charge(10.0)
+        self.items[body["id"]] = dict(body, _etag=str(uuid.uuid4()))
+        return self.items[body["id"]]
+
+    async def replace_item(self, item, body, **kwargs):
+        await self.behaviour.wait()
+        self._charge(10.0)
+        self.items[item] = dict(body, _etag=str(uuid.uuid4()))
+        return self.items[item]
+
+    async def read_item(self, item, partition_key, **kwargs):
+        await self.behaviour.wait()
+        self._charge(1.0)
+        if item not in self.items:
+            from azure.cosmos.exceptions import CosmosResourceNotFoundError
+            raise CosmosResourceNotFoundError(message="Not found")
+        return self.items[item]
+
+    async def patch_item(self, item, partition_key, patch_operations, **kwargs):
+        await self.behaviour.wait()
+        self._charge(10.0, kwargs.get("response_hook"))
+        doc = self.items.setdefault(item, {"id": item})
+        for op in patch_operations:
+            target = doc
+            parts = [p for p in op["path"].split("/") if p]
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = op.get("value")
+        return doc
+
+    async def execute_item_batch(self, batch_operations, partition_key, **kwargs):
+        await self.behaviour.wait()
+        self._charge(5.0 * len(batch_operations), kwargs.get("response_hook"))
+        results = []
+        for operation, args, *rest in batch_operations:
+            body = args[0] if args else None
+            if operation in ("create", "upsert") and body is not None:
+                self.items[body["id"]] = dict(body)
+            elif operation == "patch":
+                item_id, ops = args[0], args[1]
+                doc = self.items.setdefault(item_id, {"id": item_id})
+                for op in ops:
+                    target = doc
+                    parts = [p for p in op["path"].split("/") if p]
+                    for part in parts[:-1]:
+                        target = target.setdefault(part, {})
+                    target[parts[-1]] = op.get("value")
+            results.append({"statusCode": 200})
+        return results
+
+    def query_items(self, query, parameters=None, **kwargs):
+        params = {p["name"]: p["value"] for p in (parameters or [])}
+        matched = [item for item in self.items.values() if self.query_filter(item, params)]
+        limit = params.get("@max_items") or params.get("@top")
+        if limit:
+            matched = matched[:limit]
+        return _AsyncItems(matched, self.behaviour)
+
+    def query_items_change_feed(self, **kwargs):
+        return _ChangeFeed(self)
+
+
+class FakeCosmosClient:
+    """
+    Drop-in for azure.cosmos.aio.CosmosClient; every client shares the same containers.
+    """
+    containers = {}
+    default_behaviour = Behaviour()
+
+    def __init__(self, endpoint=None, credential=None, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def close(self):
+        pass
+
+    def get_database_client(self, name):
+        return self
+
+    def get_container_client(self, name):
+        if name not in self.containers:
+            self.containers[name] = FakeCosmosContainer(self.default_behaviour)
+        return self.containers[name]
+
+
+# --- Azure AI Search REST endpoint ---
+
+class FakeSearchService:
+    """
+    Stand-in for SearchClient.search(): returns `top` documents with descending scores.
+    """
+
+    def __init__(self, behaviour: Behaviour = None, documents: list = None, top: int = 3):
+        self.behaviour = behaviour or Behaviour()
+        self.documents = documents or [
+            {"id": f"doc-{i}", "content": f"CoolAir model X{i} air conditioner: {i + 2} kW, inverter, A++ class.",
+             "source": f"https://kb.example/doc-{i}"}
+            for i in range(10)
+        ]
+        self.top = top
+
+    async def search(self, search_query: str) -> dict:
+        await self.behaviour.wait()
+        start = hash(search_query) % len(self.documents)
+        docs = [self.documents[(start + i) % len(self.documents)] for i in range(self.top)]
+        return {"value": [dict(doc, **{"@search.score": 10.0 - i}) for i, doc in enumerate(docs)]}
+
+
+# --- OpenAI chat completions ---
+
+class _Completions:
+    def __init__(self, behaviour: Behaviour, answer: str):
+        self.behaviour = behaviour
+        self.answer = answer
+
+    async def create(self, model, messages, **kwargs):
+        await self.behaviour.wait()
+        message = SimpleNamespace(content=self.answer)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class FakeOpenAI:
+    """
+    Stand-in for openai.AsyncOpenAI: client.chat.completions.create(...).
+    """
+
+    def __init__(self, behaviour: Behaviour = None, answer: str = None):
+        self.behaviour = behaviour or Behaviour(latency_ms=800, jitter_ms=200)
+        answer = answer or "Для кімнати 20 м² радимо інверторний кондиціонер CoolAir X2 потужністю 2.5 кВт."
+        self.chat = SimpleNamespace(completions=_Completions(self.behaviour, answer))
+
+
+# --- Text Analytics (azure.ai.textanalytics.aio) ---
+
+class FakeTextAnalyticsClient:
+    """
+    Drop-in for TextAnalyticsClient: detect_language, analyze_sentiment, extract_key_phrases.
+    """
+    behaviour = Behaviour(latency_ms=150, jitter_ms=40)
+
+    def __init__(self, endpoint=None, credential=None, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def close(self):
+        pass
+
+    @staticmethod
+    def _text(doc):
+        return doc["text"] if isinstance(doc, dict) else str(doc)
+
+    async def detect_language(self, documents, **kwargs):
+        await self.behaviour.wait()
+        return [
+            SimpleNamespace(is_error=False, id=doc.get("id") if isinstance(doc, dict) else str(i),
+                            primary_language=SimpleNamespace(iso6391_name="uk" if any("а" <= c <= "я" for c in self._text(doc).lower()) else "en"))
+            for i, doc in enumerate(documents)
+        ]
+
+    async def analyze_sentiment(self, documents, **kwargs):
+        await self.behaviour.wait()
+        labels = ("positive", "neutral", "negative")
+        results = []
+        for i, doc in enumerate(documents):
+            label = labels[len(self._text(doc)) % 3]
+            scores = {name: 0.8 if name == label else 0.1 for name in labels}
+            results.append(SimpleNamespace(
+                is_error=False, id=doc.get("id") if isinstance(doc, dict) else str(i), sentiment=label,
+                confidence_scores=SimpleNamespace(**scores),
+            ))
+        return results
+
+    async def extract_key_phrases(self, documents, **kwargs):
+        await self.behaviour.wait()
+        return [
+            SimpleNamespace(is_error=False, id=doc.get("id") if isinstance(doc, dict) else str(i),
+                            key_phrases=[w for w in self._text(doc).split() if len(w) > 5][:3])
+            for i, doc in enumerate(documents)
+        ]
+
+
+# --- Kusto ingest / query ---
+
+class FakeKustoConnectionStringBuilder:
+    @classmethod
+    def with_aad_application_key_authentication(cls, *args, **kwargs):
+        return cls()
+
+
+class FakeIngestClient:
+    """
+    Drop-in for QueuedIngestClient / ManagedStreamingIngestClient.
+    """
+    behaviour = Behaviour(latency_ms=50, jitter_ms=10)
+    ingested_bytes = 0
+    ingested_calls = 0
+
+    def __init__(self, kcsb=None, *args, **kwargs):
+        pass
+
+    @classmethod
+    def from_dm_kcsb(cls, kcsb, *args, **kwargs):
+        return cls(kcsb)
+
+    def ingest_from_stream(self, stream, ingestion_properties=None, **kwargs):
+        self.behaviour.wait_sync()
+        data = stream.read() if hasattr(stream, "read") else getattr(stream, "stream").read()
+        type(self).ingested_bytes += len(data)
+        type(self).ingested_calls += 1
+        return SimpleNamespace(status="Queued")
+
+    def close(self):
+        pass
+
+
+class _Row(dict):
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return dict.__getitem__(self, key)
+
+
+class FakeKustoClient:
+    """
+    Drop-in for azure.kusto.data.KustoClient.execute(): returns canned rows shaped like the dashboard metrics.
+    """
+    behaviour = Behaviour(latency_ms=250, jitter_ms=60)
+
+    def __init__(self, kcsb=None):
+        pass
+
+    def execute(self, database, query, properties=None):
+        self.behaviour.wait_sync()
+        rows = [_Row(label=label, value=i * 10, hour=f"2025-07-0{1 + i % 9}T00:00:00Z", p50=120.0, p95=480.0)
+                for i, label in enumerate(("positive", "neutral", "negative", "mixed"))]
+        tables = max(1, query.count("\n;\n") + 1)
+        return SimpleNamespace(primary_results=[rows for _ in range(tables)])
+
+    def close(self):
+        pass
@@ -0,0 +1,165 @@
+"""
+Cold-start profile of the function entry modules.
+
+Each entry module is imported in a fresh interpreter with `python -X importtime`
+(no fakes, real SDKs), so the numbers are what a new worker pays before the first
+invocation. Reports total import time per function, the heaviest top-level
+packages and modules, and fails on regressions against a saved baseline:
+
+    python -m benchmarks.profile_imports
+    python -m benchmarks.profile_imports --runs 5 --top 15
+    python -m benchmarks.profile_imports --compare benchmarks/results/imports-<old>.json --max-regression-ms 50
+
+Results are written as JSON to benchmarks/results/imports-<commit>-<timestamp>.json.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timezone
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "functions")
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# Модулі, які завантажує хост для кожної функції (scriptFile з function.json)
+ENTRY_MODULES = {
+    "ask": "ask",
+    "ask_bulk": "ask_bulk",
+    "analyze_sentiment": "analyze_sentiment.analyze_sentiment_function",
+    "analyze_sentiment_http": "analyze_sentiment.analyze_sentiment_http_function",
+    "analytics_proxy": "analytics_proxy",
+    "warmup": "warmup",
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Рядки `import time: self [us] | cumulative | imported package` -> [(module, self_us, cumulative_us)].
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def profile_module(module: str) -> dict:
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=FUNCTIONS_DIR, capture_output=True, text=True)
+    rows = parse_importtime(completed.stderr)
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "import failed"
+        return {"ok": False, "error": error}
+    by_module = {name: self_us for name, self_us, _ in rows}
+    by_package = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    return {"ok": True, "total_us": sum(by_module.values()), "modules": len(rows),
+            "by_module": by_module, "by_package": dict(by_package)}
+
+
+def median(values: list):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def profile_entry(module: str, runs: int, top: int) -> dict:
+    """
+    Медіана з runs запусків (перший запуск ще й прогріває кеш байткоду і файлової системи).
+    """
+    samples = [profile_module(module) for _ in range(runs)]
+    failed = next((s for s in samples if not s["ok"]), None)
+    if failed:
+        return failed
+    sample = sorted(samples, key=lambda s: s["total_us"])[len(samples) // 2]
+    heaviest = lambda items: [{"name": k, "ms": round(v / 1000, 1)}
+                              for k, v in sorted(items.items(), key=lambda kv: -kv[1])[:top]]
+    return {
+        "ok": True,
+        "total_ms": round(median([s["total_us"] for s in samples]) / 1000, 1),
+        "modules": sample["modules"],
+        "top_packages": heaviest(sample["by_package"]),
+        "top_modules": heaviest(sample["by_module"]),
+    }
+
+
+def compare(current: dict, baseline_path: str, max_regression_ms: float) -> list:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    regressions = []
+    for name, result in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old or not old.get("ok") or not result.get("ok"):
+            continue
+        delta = result["total_ms"] - old["total_ms"]
+        marker = ""
+        if delta > max_regression_ms:
+            regressions.append(name)
+            marker = "  <-- regression"
+        print(f"  {name}: {old['total_ms']} -> {result['total_ms']} ms ({delta:+.1f} ms){marker}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time (cold start) profile of the function entry modules")
+    parser.add_argument("--function", default="all", choices=tuple(ENTRY_MODULES) + ("all",))
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per entry module (median is reported)")
+    parser.add_argument("--top", type=int, default=10, help="Heaviest packages/modules to list")
+    parser.add_argument("--output", default=None,
+                        help="Result JSON path (default: benchmarks/results/imports-<commit>-<ts>.json)")
+    parser.add_argument("--compare", default=None, help="Baseline result JSON to compare against")
+    parser.add_argument("--max-regression-ms", type=float, default=50,
+                        help="Exit with status 1 if any function got slower than the baseline by more than this")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from benchmarks.run_benchmark import remove_orphan_bytecode
+    for path in remove_orphan_bytecode(FUNCTIONS_DIR):
+        print(f"Removed orphaned bytecode {path}")
+    names = tuple(ENTRY_MODULES) if args.function == "all" else (args.function,)
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "results": {},
+    }
+    for name in names:
+        result = profile_entry(ENTRY_MODULES[name], max(1, args.runs), args.top)
+        report["results"][name] = result
+        if not result["ok"]:
+            print(f"{name:>22}: FAILED ({result['error']})")
+            continue
+        packages = ", ".join(f"{p['name']} {p['ms']}" for p in result["top_packages"][:5])
+        print(f"{name:>22}: {result['total_ms']} ms, {result['modules']} modules; heaviest: {packages}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"imports-{report['commit']}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {output}")
+    if args.compare and compare(report, args.compare, args.max_regression_ms):
+        sys.exit(1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Offline benchmark / load test for the function entry points.
+
+Replaces Cosmos DB, AI Search, OpenAI, Text Analytics and Kusto with
+in-process fakes (see fakes.py) and drives the real handlers:
+
+    ask                -> ask.main (blocking JSON mode)
+    ask_bulk           -> ask.bulk.run_bulk over --requests questions (latency per unique question)
+    sentiment          -> analyze_and_update_sentiment (query mode)
+    sentiment_cf       -> process_change_feed (change feed mode with checkpoints)
+    analytics          -> analytics_proxy.main
+    analytics_batch    -> analytics_proxy.main with ?metrics=<all dashboard metrics>
+
+Usage (from src/):
+
+    python -m benchmarks.run_benchmark --target ask --requests 500 --concurrency 50
+    python -m benchmarks.run_benchmark --target all --llm-latency-ms 300 --failure-rate 0.02
+    python -m benchmarks.run_benchmark --target ask --compare benchmarks/results/<old>.json
+
+Results are written as JSON to benchmarks/results/<commit>-<timestamp>.json.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import importlib
+import tracemalloc
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "functions")
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+sys.path.insert(0, FUNCTIONS_DIR)
+
+from benchmarks import fakes  # noqa: E402
+
+TARGETS = ("ask", "ask_bulk", "sentiment", "sentiment_cf", "analytics", "analytics_batch")
+
+# Фіктивні налаштування: модулі функцій читають їх під час імпорту
+FAKE_ENV = {
+    "COSMOSDB_ENDPOINT": "https://fake-cosmos.local:443/",
+    "COSMOSDB_KEY": "fake-key",
+    "COSMOSDB_DATABASE": "neuromodels",
+    "COSMOSDB_CONTAINER": "dialog_events",
+    "SEARCH_SERVICE_ENDPOINT": "https://fake-search.local",
+    "SEARCH_API_KEY": "fake-key",
+    "SEARCH_INDEX_NAME": "kb",
+    "OPENAI_API_KEY": "fake-key",
+    "TEXT_ANALYTICS_ENDPOINT": "https://fake-language.local/",
+    "TEXT_ANALYTICS_KEY": "fake-key",
+    "KUSTO_CLUSTER": "https://fake-kusto.local",
+    "KUSTO_INGEST_URI": "https://ingest-fake-kusto.local",
+    "KUSTO_DB": "neuromodels",
+    "KUSTO_CLIENT_ID": "fake",
+    "KUSTO_CLIENT_SECRET": "fake",
+    "KUSTO_TENANT_ID": "fake",
+    "KUSTO_INGEST_CLIENT_ID": "fake",
+    "KUSTO_INGEST_CLIENT_SECRET": "fake",
+    "KUSTO_INGEST_TENANT_ID": "fake",
+    "ANSWER_CACHE_L2": "none",
+}
+
+QUESTIONS = [
+    "Який кондиціонер підійде для кімнати 20 м²?",
+    "Скільки коштує встановлення спліт-системи?",
+    "Does the X3 model support heating in winter?",
+    "Яка гарантія на інверторні моделі?",
+    "How often should I clean the filters?",
+    "Чи є доставка по Львову?",
+]
+
+METRICS = ("sentiment", "sentiment_time", "languages", "top_phrases", "top_users",
+           "latency_p50_p95", "latency_by_stage")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, -(-p * len(values) // 100) - 1))
+    return round(values[int(idx)], 2)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def remove_orphan_bytecode(root: str = FUNCTIONS_DIR) -> list:
+    """
+    Видаляє __pycache__/*.pyc модулів, чиї .py вже видалено з дерева (напр. після перенесення
+    чи видалення модуля), щоб прогін не залежав від залишків попередніх версій коду.
+    """
+    removed = []
+    for directory, _, files in os.walk(root):
+        if os.path.basename(directory) != "__pycache__":
+            continue
+        for name in files:
+            source = os.path.join(os.path.dirname(directory), name.split(".", 1)[0] + ".py")
+            if name.endswith(".pyc") and not os.path.exists(source):
+                os.remove(os.path.join(directory, name))
+                removed.append(os.path.relpath(os.path.join(directory, name), root))
+    return removed
+
+
+def events_query_filter(item, params):
+    """
+    Емуляція WHERE-умов запитів до dialog_events: історія користувача або необроблені повідомлення.
+    """
+    if item.get("step") not in ("question", "answer"):
+        return False
+    if "@user_id" in params:
+        return item.get("user_id") == params["@user_id"]
+    return not (item.get("meta") or {}).get("sentiment")
+
+
+def install_fakes(args):
+    """
+    Підміняє фабрики клієнтів у модулях функцій на фейки з заданою латентністю / відсотком помилок.
+    """
+    os.environ.update({k: v for k, v in FAKE_ENV.items() if k not in os.environ})
+    behaviour = lambda latency: fakes.Behaviour(latency, latency * 0.25, args.failure_rate, args.seed)  # noqa: E731
+
+    fakes.FakeCosmosClient.default_behaviour = behaviour(args.cosmos_latency_ms)
+    fakes.FakeCosmosClient.containers = {
+        FAKE_ENV["COSMOSDB_CONTAINER"]: fakes.FakeCosmosContainer(fakes.FakeCosmosClient.default_behaviour,
+                                                                  query_filter=events_query_filter),
+    }
+    fakes.FakeTextAnalyticsClient.behaviour = behaviour(args.text_analytics_latency_ms)
+    fakes.FakeIngestClient.behaviour = behaviour(args.kusto_latency_ms)
+    fakes.FakeKustoClient.behaviour = behaviour(args.kusto_latency_ms)
+    search = fakes.FakeSearchService(behaviour(args.search_latency_ms))
+    llm = fakes.FakeOpenAI(behaviour(args.llm_latency_ms))
+
+    import ask
+    from ask import cosmos_pool, search_client
+    cosmos_pool.CosmosClient = fakes.FakeCosmosClient
+    search_client.get_client = lambda: search
+    ask._openai_client = llm
+
+    from analyze_sentiment import analyze_sentiment_core as core
+    core.CosmosClient = fakes.FakeCosmosClient
+    core.TextAnalyticsClient = fakes.FakeTextAnalyticsClient
+    from analyze_sentiment import kusto_ingest
+    kusto_ingest.QueuedIngestClient = fakes.FakeIngestClient
+    kusto_ingest.ManagedStreamingIngestClient = fakes.FakeIngestClient
+    kusto_ingest.KustoConnectionStringBuilder = fakes.FakeKustoConnectionStringBuilder
+
+    # analytics_proxy/__init__ реекспортує функцію main, тож модуль беремо через import_module
+    proxy = importlib.import_module("analytics_proxy.main")
+    proxy.KustoClient = fakes.FakeKustoClient
+    proxy.KustoConnectionStringBuilder = fakes.FakeKustoConnectionStringBuilder
+
+    return {
+        "cosmos": fakes.FakeCosmosClient.default_behaviour,
+        "search": search.behaviour,
+        "llm": llm.behaviour,
+        "text_analytics": fakes.FakeTextAnalyticsClient.behaviour,
+        "kusto_ingest": fakes.FakeIngestClient.behaviour,
+        "kusto_query": fakes.FakeKustoClient.behaviour,
+    }
+
+
+def seed_unprocessed_messages(count: int):
+    container = fakes.FakeCosmosClient.containers[FAKE_ENV["COSMOSDB_CONTAINER"]]
+    now = datetime.now(timezone.utc).isoformat()
+    for i in range(count):
+        step = "question" if i % 2 == 0 else "answer"
+        item_id = str(uuid.uuid4())
+        container.items[item_id] = {
+            "id": item_id, "dialog_id": f"bench-dialog-{i // 2}", "user_id": f"bench-user-{i % 50}",
+            "step": step, "content": QUESTIONS[i % len(QUESTIONS)], "timestamp": now, "_ts": int(time.time()),
+            "meta": {"stages_ms": {"search": 120.0, "llm": 900.0, "total": 1100.0}} if step == "answer" else {},
+        }
+
+
+def make_http_request(method: str, url: str, body: dict = None, params: dict = None):
+    import azure.functions as func
+    return func.HttpRequest(
+        method=method, url=url, params=params or {},
+        body=json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b"",
+        headers={"Content-Type": "application/json"},
+    )
+
+
+async def run_async_target(call, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                status = await call(i)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def run_sync_target(call, requests: int, concurrency: int):
+    latencies, statuses = [], {}
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            status = call(i)
+        except Exception as e:
+            status = type(e).__name__
+        return (time.perf_counter() - started) * 1000, str(status)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ms, status in pool.map(one, range(requests)):
+            latencies.append(ms)
+            statuses[status] = statuses.get(status, 0) + 1
+    return latencies, statuses, time.perf_counter() - started
+
+
+async def bench_ask(args):
+    import ask
+    from ask import event_sink
+
+    async def call(i):
+        body = {"user_id": f"bench-user-{i % args.users}", "question": f"{QUESTIONS[i % len(QUESTIONS)]} #{i % args.distinct_questions}"}
+        response = await ask.main(make_http_request("POST", "/api/ask", body))
+        return response.status_code
+
+    result = await run_async_target(call, args.requests, args.concurrency)
+    await event_sink.shutdown()
+    return result
+
+
+async def bench_ask_bulk(args):
+    from ask import bulk, event_sink
+    items = bulk.parse_items([
+        {"question": f"{QUESTIONS[i % len(QUESTIONS)]} #{i % args.distinct_questions}", "user_id": f"bench-user-{i % args.users}"}
+        for i in range(args.requests)
+    ])
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    async for line in bulk.run_bulk(items, args.concurrency):
+        if line["type"] == "result":
+            latencies.append(line["latency_ms"])
+            statuses[line["status"]] = statuses.get(line["status"], 0) + 1
+    elapsed = time.perf_counter() - started
+    await event_sink.shutdown()
+    return latencies, statuses, elapsed
+
+
+async def bench_sentiment(args, change_feed: bool):
+    from analyze_sentiment.analyze_sentiment_core import analyze_and_update_sentiment, process_change_feed
+    seed_unprocessed_messages(args.requests * args.items)
+
+    async def call(i):
+        if change_feed:
+            result = await process_change_feed(batch_size=args.items)
+        else:
+            result = await analyze_and_update_sentiment(max_items=args.items)
+        return "error" if "error" in result else "ok"
+
+    return await run_async_target(call, args.requests, args.concurrency)
+
+
+def bench_analytics(args, batch=False):
+    from analytics_proxy.main import main
+
+    def call(i):
+        if batch:
+            params = {"metrics": ",".join(METRICS)}
+        else:
+            params = {"metric": METRICS[i % len(METRICS)]}
+        return main(make_http_request("GET", "/api/analytics-proxy", params=params)).status_code
+
+    return run_sync_target(call, args.requests, args.concurrency)
+
+
+def run_target(target: str, args) -> dict:
+    if args.alloc:
+        tracemalloc.start()
+    if target == "ask":
+        latencies, statuses, elapsed = asyncio.run(bench_ask(args))
+    elif target == "ask_bulk":
+        latencies, statuses, elapsed = asyncio.run(bench_ask_bulk(args))
+    elif target in ("sentiment", "sentiment_cf"):
+        latencies, statuses, elapsed = asyncio.run(bench_sentiment(args, target == "sentiment_cf"))
+    else:
+        latencies, statuses, elapsed = bench_analytics(args, target == "analytics_batch")
+    result = {
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": round(max(latencies), 2) if latencies else None,
+        "statuses": statuses,
+    }
+    if args.alloc:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["alloc_current_kib"] = round(current / 1024, 1)
+        result["alloc_peak_kib"] = round(peak / 1024, 1)
+        result["alloc_peak_per_request_kib"] = round(peak / 1024 / max(1, len(latencies)), 2)
+    return result
+
+
+def compare(current: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    for target, result in current["results"].items():
+        old = baseline.get("results", {}).get(target)
+        if not old:
+            continue
+        parts = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms", "alloc_peak_kib"):
+            if result.get(key) is not None and old.get(key):
+                parts.append(f"{key} {old[key]} -> {result[key]} ({(result[key] - old[key]) / old[key] * 100:+.1f}%)")
+        print(f"  {target}: " + ", ".join(parts))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the function handlers with faked Azure services")
+    parser.add_argument("--target", default="all", choices=TARGETS + ("all",))
+    parser.add_argument("--requests", type=int, default=200, help="Invocations per target")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50, help="Distinct user_id values for ask")
+    parser.add_argument("--distinct-questions", type=int, default=1000,
+                        help="Distinct question variants for ask (lower -> more answer cache hits)")
+    parser.add_argument("--items", type=int, default=100, help="max_items per sentiment run")
+    parser.add_argument("--cosmos-latency-ms", type=float, default=8)
+    parser.add_argument("--search-latency-ms", type=float, default=120)
+    parser.add_argument("--llm-latency-ms", type=float, default=900)
+    parser.add_argument("--text-analytics-latency-ms", type=float, default=150)
+    parser.add_argument("--kusto-latency-ms", type=float, default=250)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Injected failure rate for every fake (0..1)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--no-alloc", dest="alloc", action="store_false", help="Disable tracemalloc accounting")
+    parser.add_argument("--output", default=None, help="Result JSON path (default: benchmarks/results/<commit>-<ts>.json)")
+    parser.add_argument("--compare", default=None, help="Baseline result JSON to compare against")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    for path in remove_orphan_bytecode():
+        logging.warning(f"Removed orphaned bytecode {path}")
+    services = install_fakes(args)
+
+    targets = TARGETS if args.target == "all" else (args.target,)
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "verbose")},
+        "results": {},
+    }
+    for target in targets:
+        result = run_target(target, args)
+        report["results"][target] = result
+        print(f"{target:>11}: {result['rps']} rps, p50={result['p50_ms']} p95={result['p95_ms']} "
+              f"p99={result['p99_ms']} ms, statuses={result['statuses']}"
+              + (f", alloc_peak={result['alloc_peak_kib']} KiB" if args.alloc else ""))
+    report["service_calls"] = {name: behaviour.stats() for name, behaviour in services.items()}
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{report['commit']}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {output}")
+    if args.compare:
+        compare(report, args.compare)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,182 @@
 import os
 import json
+import re
 import logging
+import time
+import threading
 import azure.functions as func
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import asyncio
-from azure.kusto.data import KustoClient, KustoConnectionStringBuilder
-from azure.kusto.data.exceptions import KustoApiError
+from .metric_cache import MetricCache, ANALYTICS_CACHE_ENABLED, etag_matches, make_etag
+from .settings import get_settings
 
+# Batch-режим (?metrics=a,b,c): скільки запитів у Kusto виконуємо паралельно і скільки метрик приймаємо
+ANALYTICS_BATCH_CONCURRENCY = int(os.environ.get("ANALYTICS_BATCH_CONCURRENCY", "6"))
+ANALYTICS_BATCH_MAX_METRICS = int(os.environ.get("ANALYTICS_BATCH_MAX_METRICS", "20"))
 
-# Kusto (Azure Data Explorer) connection settings
-KUSTO_CLUSTER = os.environ.get("KUSTO_CLUSTER")  # e.g. "https://<cluster>.kusto.windows.net"
-KUSTO_DB = os.environ.get("KUSTO_DB")
-KUSTO_CLIENT_ID = os.environ.get("KUSTO_CLIENT_ID")
-KUSTO_CLIENT_SECRET = os.environ.get("KUSTO_CLIENT_SECRET")
-KUSTO_TENANT_ID = os.environ.get("KUSTO_TENANT_ID")
+
+# azure-kusto-data імпортується при першому запиті: відповіді з кешу і 304 його не потребують
+KustoClient = None
+KustoConnectionStringBuilder = None
+ClientRequestProperties = None
+KustoApiError = None
+
+
+def load_sdk():
+    global KustoClient, KustoConnectionStringBuilder, ClientRequestProperties, KustoApiError
+    if KustoClient is None:
+        from azure.kusto.data import KustoClient
+    if KustoConnectionStringBuilder is None:
+        from azure.kusto.data import KustoConnectionStringBuilder
+    if ClientRequestProperties is None:
+        from azure.kusto.data import ClientRequestProperties
+    if KustoApiError is None:
+        from azure.kusto.data.exceptions import KustoApiError
+
+
+_kusto_client = None
+_kusto_client_lock = threading.Lock()
 
 
 def get_kusto_client():
-    # For hackathon: use client id/secret, but for prod use managed identity
-    kcsb = KustoConnectionStringBuilder.with_aad_application_key_authentication(
-        KUSTO_CLUSTER, KUSTO_CLIENT_ID, KUSTO_CLIENT_SECRET, KUSTO_TENANT_ID
-    )
-    return KustoClient(kcsb)
+    """
+    Один KustoClient на воркер: з'єднання і AAD-токен перевикористовуються між запитами.
+    """
+    global _kusto_client
+    with _kusto_client_lock:
+        load_sdk()
+        if _kusto_client is None:
+            settings = get_settings()
+            # For hackathon: use client id/secret, but for prod use managed identity
+            kcsb = KustoConnectionStringBuilder.with_aad_application_key_authentication(
+                settings.kusto_cluster, settings.kusto_client_id, settings.kusto_client_secret, settings.kusto_tenant_id
+            )
+            _kusto_client = KustoClient(kcsb)
+    return _kusto_client
+
+# Вікно за замовчуванням: зберігання в Kusto — 31 день, тож 30d покриває практично всю історію
+ANALYTICS_DEFAULT_WINDOW = os.environ.get("ANALYTICS_DEFAULT_WINDOW", "30d")
+ANALYTICS_DEFAULT_BIN = os.environ.get("ANALYTICS_DEFAULT_BIN", "1h")
+# Rollup-и погодинні: крок менший за годину з них не отримати
+ROLLUP_GRAIN = timedelta(hours=1)
+WINDOW_PARAMS = ("from", "to", "bin")
+
+_SPAN_RE = re.compile(r"^(\d+)([mhd])$")
+_SPAN_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+# Параметри запиту: значення передаються через ClientRequestProperties, а не підставляються в текст
+QUERY_PARAMETERS = "declare query_parameters(from_time:datetime, to_time:datetime, step:timespan);\n"
+
+
+def parse_span(value: str) -> timedelta:
+    match = _SPAN_RE.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid duration '{value}', expected e.g. 30m, 6h, 7d")
+    return timedelta(**{_SPAN_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def parse_time(value: str, now: datetime) -> datetime:
+    """
+    ISO-дата (2025-07-01, 2025-07-01T10:00:00Z) або тривалість назад від now (7d, 12h).
+    """
+    if _SPAN_RE.match(value.strip()):
+        return now - parse_span(value)
+    parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def parse_window(params: dict) -> dict:
+    """
+    Перевіряє from/to/bin і повертає сирі значення (вони ж — частина ключа кешу).
+    Відносне вікно (from=7d) резолвиться в момент запиту до Kusto. ValueError — некоректні параметри.
+    """
+    window = {
+        "from": str(params.get("from") or ANALYTICS_DEFAULT_WINDOW),
+        "to": str(params.get("to") or ""),
+        "bin": str(params.get("bin") or ANALYTICS_DEFAULT_BIN),
+    }
+    step = parse_span(window["bin"])
+    if step < ROLLUP_GRAIN or step % ROLLUP_GRAIN:
+        raise ValueError(f"'bin' must be a whole number of hours, got '{window['bin']}'")
+    from_time, to_time = resolve_window(window)
+    if from_time >= to_time:
+        raise ValueError("'from' must be earlier than 'to'")
+    return window
+
+
+def resolve_window(window: dict):
+    now = datetime.now(timezone.utc)
+    to_time = parse_time(window["to"], now) if window["to"] else now
+    return parse_time(window["from"], now), to_time
+
+
+def window_properties(window: dict) -> "ClientRequestProperties":
+    from_time, to_time = resolve_window(window)
+    properties = ClientRequestProperties()
+    properties.set_parameter("from_time", f"datetime({from_time.strftime('%Y-%m-%dT%H:%M:%SZ')})")
+    properties.set_parameter("to_time", f"datetime({to_time.strftime('%Y-%m-%dT%H:%M:%SZ')})")
+    properties.set_parameter("step", f"time({window['bin']})")
+    return properties
+
 
 def build_kusto_query(metric):
-    # Map metric to Kusto query
+    # Map metric to Kusto query над погодинними rollup-ами (materialized views DialogMetricsHourly / DialogUsersHourly)
+    rollup = "DialogMetricsHourly | where hour >= bin(from_time, 1h) and hour < to_time"
     if metric == "sentiment":
         # Pie: розподіл sentiment
-        return "DialogMetrics | where metric == 'sentiment' | summarize value=count() by label=value"
+        return f"{rollup} and metric == 'sentiment' | summarize value=sum(value) by label"
     elif metric == "sentiment_time":
-        # Timechart: sentiment by hour and label (всі комбінації, label як string)
+        # Timechart: sentiment by bin and label; make-series заповнює порожні інтервали нулями за один прохід
         return (
-            "let hours = range hour from toscalar(DialogMetrics | where metric == 'sentiment' | summarize min(bin(TimeGenerated, 1h))) "
-            "to toscalar(DialogMetrics | where metric == 'sentiment' | summarize max(bin(TimeGenerated, 1h))) step 1h;\n"
-            "let labels = toscalar(DialogMetrics | where metric == 'sentiment' | summarize make_list(tostring(value)));\n"
-            "hours\n"
-            "| mv-expand label = labels\n"
-            "| extend label = tostring(label)\n"
-            "| join kind=leftouter (\n"
-            "    DialogMetrics | where metric == 'sentiment' | extend label = tostring(value) | summarize value=count() by hour=bin(TimeGenerated, 1h), label\n"
-            ") on hour, label\n"
-            "| project hour, label, value=coalesce(value, 0)\n"
+            f"{rollup} and metric == 'sentiment'\n"
+            "| make-series value=sum(value) default=0 on hour from bin(from_time, step) to to_time step step by label\n"
+            "| mv-expand hour to typeof(datetime), value to typeof(long)\n"
+            "| project hour, label, value\n"
             "| order by hour asc, label asc"
         )
     elif metric == "languages":
         # Pie: розподіл мов
-        return "DialogMetrics | where metric == 'language' | summarize value=count() by label=value"
+        return f"{rollup} and metric == 'language' | summarize value=sum(value) by label"
     elif metric == "top_phrases":
         # Wordcloud: топ-20 ключових слів
-        return "DialogMetrics | where metric == 'keyword' | summarize value=count() by label=tostring(value) | top 20 by value desc"
+        return f"{rollup} and metric == 'keyword' | summarize value=sum(value) by label | top 20 by value desc"
     elif metric == "top_users":
         # Column: топ користувачів
-        return "DialogMetrics | summarize value=count() by label=user_id | top 10 by value desc"
+        return (
+            "DialogUsersHourly | where hour >= bin(from_time, 1h) and hour < to_time\n"
+            "| summarize value=sum(value) by label=user_id | top 10 by value desc"
+        )
+    elif metric == "latency_p50_p95":
+        # Timechart: p50/p95 загального часу відповіді ask по інтервалах bin (t-digest з rollup-ів зливаються)
+        return (
+            f"{rollup} and metric == 'latency' and label == 'total'\n"
+            "| summarize digest=tdigest_merge(digest) by hour=bin(hour, step)\n"
+            "| project hour, p50=percentile_tdigest(digest, 50), p95=percentile_tdigest(digest, 95)\n"
+            "| order by hour asc"
+        )
+    elif metric == "latency_by_stage":
+        # Column: p50/p95 по етапах ask (cosmos_enqueue, history, search, llm, total)
+        return (
+            f"{rollup} and metric == 'latency'\n"
+            "| summarize digest=tdigest_merge(digest) by label\n"
+            "| project label, value=percentile_tdigest(digest, 50), p95=percentile_tdigest(digest, 95)\n"
+            "| order by value desc"
+        )
     else:
         return None
 
-def query_kusto(metric):
+def query_kusto(metric, window=None):
     client = get_kusto_client()
     query = build_kusto_query(metric)
     if not query:
         logging.warning(f"[AnalyticsProxy] Unknown metric: {metric}")
         return []
     try:
-        response = client.execute(KUSTO_DB, query)
+        window = window or parse_window({})
+        response = client.execute(get_settings().kusto_db, QUERY_PARAMETERS + query, window_properties(window))
         rows = response.primary_results[0]
         result = []
         for row in rows:
@@ -72,6 +187,14 @@ def query_kusto(metric):
                     "label": row["label"],
                     "value": row["value"]
                 })
+            elif metric == "latency_p50_p95":
+                result.append({
+                    "hour": str(row["hour"]),
+                    "p50": row["p50"],
+                    "p95": row["p95"]
+                })
+            elif metric == "latency_by_stage":
+                result.append({"label": row["label"], "value": row["value"], "p95": row["p95"]})
             else:
                 # Each row: label, value
                 result.append({"label": row["label"], "value": row["value"]})
@@ -85,39 +208,152 @@ def query_kusto(metric):
         return {"error": f"Exception: {str(e)}"}
 
 
+def is_error(result) -> bool:
+    return isinstance(result, dict) and "error" in result
+
+
+_cache = MetricCache(cacheable=lambda result: not is_error(result))
+
+
+def cached_query(metric, window=None):
+    """
+    Результат метрики через кеш: (result, etag, status). Ключ — метрика плюс сирі from/to/bin.
+    Невідомі метрики не кешуються.
+    """
+    window = window or parse_window({})
+    if not ANALYTICS_CACHE_ENABLED or build_kusto_query(metric) is None:
+        return query_kusto(metric, window), None, "bypass"
+    key = "|".join([metric] + [window[name] for name in WINDOW_PARAMS])
+    entry, status = _cache.get(key, lambda: query_kusto(metric, window))
+    return entry.value, entry.etag, status
+
+
+_batch_pool = ThreadPoolExecutor(max_workers=ANALYTICS_BATCH_CONCURRENCY, thread_name_prefix="analytics-batch")
+
+
+def request_params(req: func.HttpRequest) -> dict:
+    """
+    Параметри з query string; для POST — ще й з JSON-тіла (query string має пріоритет).
+    """
+    params = {}
+    if req.method == "POST":
+        try:
+            body = req.get_json()
+            params.update(body if isinstance(body, dict) else {})
+        except ValueError:
+            pass
+    params.update(req.params)
+    return params
+
+
+def parse_metrics(req: func.HttpRequest) -> list:
+    """
+    Список метрик для batch-режиму: ?metrics=a,b,c або POST {"metrics": [...]}; дублікати відкидаються.
+    """
+    metrics = request_params(req).get("metrics")
+    if isinstance(metrics, str):
+        metrics = metrics.split(",")
+    if not isinstance(metrics, list):
+        return []
+    return list(dict.fromkeys(m.strip() for m in metrics if isinstance(m, str) and m.strip()))
+
+
+def query_metrics(metrics: list, window: dict) -> dict:
+    """
+    Виконує запити кількох метрик паралельно (кожна — через кеш) і повертає результати з часом по кожній.
+    """
+    def run(metric):
+        started = time.perf_counter()
+        result, etag, status = cached_query(metric, window)
+        return metric, result, etag, status, round((time.perf_counter() - started) * 1000, 1)
+
+    response = {"results": {}, "errors": {}, "timings_ms": {}, "cache": {}, "etags": {}}
+    for metric, result, etag, status, elapsed_ms in _batch_pool.map(run, metrics):
+        if is_error(result):
+            response["errors"][metric] = result["error"]
+        else:
+            response["results"][metric] = result
+        response["timings_ms"][metric] = elapsed_ms
+        response["cache"][metric] = status
+        response["etags"][metric] = etag
+    return response
+
+
+def handle_batch(req: func.HttpRequest, metrics: list, window: dict) -> func.HttpResponse:
+    headers = {"Access-Control-Allow-Origin": "*", "Access-Control-Expose-Headers": "ETag"}
+    if len(metrics) > ANALYTICS_BATCH_MAX_METRICS:
+        return func.HttpResponse(
+            json.dumps({"error": f"Too many metrics (max {ANALYTICS_BATCH_MAX_METRICS})"}),
+            mimetype="application/json",
+            status_code=400,
+            headers=headers
+        )
+    started = time.perf_counter()
+    response = query_metrics(metrics, window)
+    etags = response.pop("etags")
+    response["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    response["window"] = window
+    logging.info(f"[AnalyticsProxy] Batch of {len(metrics)} metrics in {response['total_ms']} ms: {response['cache']}")
+    if response["errors"] and not response["results"]:
+        return func.HttpResponse(json.dumps(response), mimetype="application/json", status_code=500, headers=headers)
+    # Спільний ETag — лише коли всі метрики закешовані; змінилась будь-яка — змінився й він
+    if all(etags.values()):
+        headers.update({"ETag": make_etag([etags[m] for m in metrics]), "Cache-Control": "no-cache"})
+        if etag_matches(req.headers.get("If-None-Match"), headers["ETag"]):
+            return func.HttpResponse(status_code=304, headers=headers)
+    return func.HttpResponse(json.dumps(response), mimetype="application/json", status_code=200, headers=headers)
+
+
 def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
         logging.info("[AnalyticsProxy] Function triggered for dashboard analytics.")
-        # Діагностика: логування змінних оточення
-        logging.info(f"KUSTO_CLUSTER={KUSTO_CLUSTER}")
-        logging.info(f"KUSTO_DB={KUSTO_DB}")
-        logging.info(f"KUSTO_CLIENT_ID={KUSTO_CLIENT_ID}")
-        logging.info(f"KUSTO_CLIENT_SECRET={'set' if KUSTO_CLIENT_SECRET else 'empty'}")
-        logging.info(f"KUSTO_TENANT_ID={KUSTO_TENANT_ID}")
+
+        # Вікно часу (from/to/bin) однакове для всіх метрик запиту
+        try:
+            window = parse_window(request_params(req))
+        except ValueError as e:
+            return func.HttpResponse(
+                json.dumps({"error": str(e)}),
+                mimetype="application/json",
+                status_code=400,
+                headers={"Access-Control-Allow-Origin": "*"}
+            )
+
+        # Batch-режим: кілька метрик за один виклик функції
+        metrics = parse_metrics(req)
+        if metrics:
+            return handle_batch(req, metrics, window)
 
         # Get metric from query string
         metric = req.params.get("metric")
         if not metric:
             return func.HttpResponse(
-                json.dumps({"error": "Missing 'metric' parameter"}),
+                json.dumps({"error": "Missing 'metric' or 'metrics' parameter"}),
                 mimetype="application/json",
                 status_code=400,
                 headers={"Access-Control-Allow-Origin": "*"}
             )
-        result = query_kusto(metric)
+        result, etag, status = cached_query(metric, window)
+        logging.info(f"[AnalyticsProxy] metric={metric} cache={status}")
         # Якщо сталася помилка — повертаємо 500 і текст помилки
-        if isinstance(result, dict) and "error" in result:
+        if is_error(result):
             return func.HttpResponse(
                 json.dumps(result),
                 mimetype="application/json",
                 status_code=500,
                 headers={"Access-Control-Allow-Origin": "*"}
             )
+        headers = {"Access-Control-Allow-Origin": "*", "Access-Control-Expose-Headers": "ETag, X-Cache", "X-Cache": status}
+        if etag:
+            # no-cache: браузер зберігає відповідь, але перепитує з If-None-Match і отримує 304, якщо дані не змінились
+            headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+            if etag_matches(req.headers.get("If-None-Match"), etag):
+                return func.HttpResponse(status_code=304, headers=headers)
         return func.HttpResponse(
             json.dumps(result),
             mimetype="application/json",
             status_code=200,
-            headers={"Access-Control-Allow-Origin": "*"}
+            headers=headers
         )
     except Exception as e:
         logging.error(f"[AnalyticsProxy] FATAL: {e}")
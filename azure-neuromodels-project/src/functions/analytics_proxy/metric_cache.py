@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# TTL збігається з 5-хвилинним таймером sentiment: частіше нові дані в Kusto не з'являються
+ANALYTICS_CACHE_TTL_S = float(os.environ.get("ANALYTICS_CACHE_TTL_S", "300"))
+# Скільки ще після TTL віддаємо застарілий результат, поки у фоні йде оновлення
+ANALYTICS_CACHE_STALE_S = float(os.environ.get("ANALYTICS_CACHE_STALE_S", "3600"))
+ANALYTICS_CACHE_ENABLED = os.environ.get("ANALYTICS_CACHE_ENABLED", "true").lower() == "true"
+
+CacheEntry = namedtuple("CacheEntry", ["value", "etag", "fetched_at"])
+
+# Фонові оновлення застарілих метрик (не більше одного на ключ)
+_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="analytics-refresh")
+
+
+def make_etag(value) -> str:
+    payload = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    return '"' + hashlib.sha1(payload).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match or not etag:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+class MetricCache:
+    """
+    Кеш результатів запитів до Kusto по ключу метрики:
+    - свіжий (до TTL) — віддаємо з пам'яті;
+    - застарілий (до TTL + stale) — віддаємо одразу і запускаємо одне фонове оновлення;
+    - відсутній — одночасні однакові запити чекають на один запит у Kusto (coalescing).
+    Помилки не кешуються; якщо фонове оновлення впало, лишається попередній результат.
+    """
+
+    def __init__(self, ttl_s: float = ANALYTICS_CACHE_TTL_S, stale_s: float = ANALYTICS_CACHE_STALE_S, cacheable=None):
+        self.ttl_s = ttl_s
+        self.stale_s = stale_s
+        self.cacheable = cacheable or (lambda value: True)
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "stale": 0, "misses": 0, "coalesced": 0, "refreshes": 0, "refresh_errors": 0}
+
+    def get(self, key: str, loader):
+        """
+        Повертає (CacheEntry, status), status — hit / stale / miss / coalesced.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.monotonic() - entry.fetched_at if entry else None
+            if entry is not None and age < self.ttl_s:
+                self.metrics["hits"] += 1
+                return entry, "hit"
+            if entry is not None and age < self.ttl_s + self.stale_s:
+                self.metrics["stale"] += 1
+                if key not in self._inflight:
+                    self._inflight[key] = _refresher.submit(self._refresh, key, loader)
+                return entry, "stale"
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.metrics["misses"] += 1
+            else:
+                self.metrics["coalesced"] += 1
+        if leader:
+            try:
+                future.set_result(self._load(key, loader))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result(), "miss" if leader else "coalesced"
+
+    def _load(self, key: str, loader) -> CacheEntry:
+        try:
+            value = loader()
+            entry = CacheEntry(value, None, time.monotonic())
+            if self.cacheable(value):
+                entry = entry._replace(etag=make_etag(value))
+                with self._lock:
+                    self._entries[key] = entry
+            return entry
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _refresh(self, key: str, loader) -> CacheEntry:
+        self.metrics["refreshes"] += 1
+        try:
+            entry = self._load(key, loader)
+            if entry.etag is None:
+                self.metrics["refresh_errors"] += 1
+                logging.warning(f"[AnalyticsCache] Refresh of {key} returned an error, keeping stale result")
+            return entry
+        except Exception as e:
+            self.metrics["refresh_errors"] += 1
+            logging.error(f"[AnalyticsCache] Refresh of {key} failed: {e}")
+
+    def stats(self) -> dict:
+        return {**self.metrics, "entries": len(self._entries), "inflight": len(self._inflight)}
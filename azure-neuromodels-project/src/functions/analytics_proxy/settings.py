@@ -0,0 +1,34 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ProxySettings:
+    """
+    Підключення analytics_proxy до Kusto; читається з оточення один раз на воркер через get_settings().
+    """
+    kusto_cluster: str  # e.g. "https://<cluster>.kusto.windows.net"
+    kusto_db: str
+    kusto_client_id: str
+    kusto_client_secret: str
+    kusto_tenant_id: str
+
+    @classmethod
+    def from_env(cls) -> "ProxySettings":
+        return cls(
+            kusto_cluster=os.environ.get("KUSTO_CLUSTER", ""),
+            kusto_db=os.environ.get("KUSTO_DB", ""),
+            kusto_client_id=os.environ.get("KUSTO_CLIENT_ID", ""),
+            kusto_client_secret=os.environ.get("KUSTO_CLIENT_SECRET", ""),
+            kusto_tenant_id=os.environ.get("KUSTO_TENANT_ID", ""),
+        )
+
+
+_settings = None
+
+
+def get_settings() -> ProxySettings:
+    global _settings
+    if _settings is None:
+        _settings = ProxySettings.from_env()
+    return _settings
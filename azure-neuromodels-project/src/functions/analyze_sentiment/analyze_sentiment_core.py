@@ -1,18 +1,21 @@
 import os
 import logging
 import asyncio
+import time
 import traceback
-import requests
-import json
-import base64
+try:
+    import resource
+except ImportError:  # Windows (локальний запуск)
+    resource = None
 from datetime import datetime
-from azure.cosmos.aio import CosmosClient
-from azure.ai.textanalytics.aio import TextAnalyticsClient
-from azure.core.credentials import AzureKeyCredential
-from azure.kusto.data import KustoConnectionStringBuilder
-from azure.kusto.data.helpers import dataframe_from_result_table
-from azure.kusto.ingest import QueuedIngestClient, IngestionProperties
-from azure.kusto.ingest.ingestion_properties import DataFormat
+from .text_analytics_batcher import TextAnalyticsBatcher
+from . import change_feed
+from .result_writer import ResultWriter
+from .result_cache import ContentDeduper, get_store
+from .sentiment_backend import get_backend
+from .kusto_ingest import get_ingestor, KUSTO_INGEST_BATCH_ROWS, KUSTO_INGEST_BATCH_MAX_AGE_S
+from .metric_spool import get_spool
+from .settings import get_settings
 
 # Set up a custom logger with module and function name in format
 logging.basicConfig(
@@ -22,192 +25,398 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-COSMOSDB_ENDPOINT = os.environ.get("COSMOSDB_ENDPOINT")
-COSMOSDB_KEY = os.environ.get("COSMOSDB_KEY")
-COSMOSDB_DATABASE = os.environ.get("COSMOSDB_DATABASE")
-COSMOSDB_CONTAINER = os.environ.get("COSMOSDB_CONTAINER")
-TEXT_ANALYTICS_ENDPOINT = os.environ.get("TEXT_ANALYTICS_ENDPOINT")
-TEXT_ANALYTICS_KEY = os.environ.get("TEXT_ANALYTICS_KEY")
-KUSTO_INGEST_URI = os.environ.get("KUSTO_INGEST_URI")
-KUSTO_DB = os.environ.get("KUSTO_DB")
-KUSTO_TABLE = os.environ.get("KUSTO_TABLE", "DialogMetrics")
-KUSTO_INGEST_CLIENT_ID = os.environ.get("KUSTO_INGEST_CLIENT_ID")
-KUSTO_INGEST_CLIENT_SECRET = os.environ.get("KUSTO_INGEST_CLIENT_SECRET")
-KUSTO_INGEST_TENANT_ID = os.environ.get("KUSTO_INGEST_TENANT_ID")
-
-def build_signature(customer_id, shared_key, date, content_length, method, content_type, resource):
-    x_headers = 'x-ms-date:' + date
-    string_to_hash = f"{method}\n{str(content_length)}\n{content_type}\n{x_headers}\n{resource}"
-    bytes_to_hash = bytes(string_to_hash, encoding="utf-8")
-    decoded_key = base64.b64decode(shared_key)
-    encoded_hash = base64.b64encode(hmac.new(decoded_key, bytes_to_hash, digestmod=hashlib.sha256).digest()).decode()
-    return f"SharedKey {customer_id}:{encoded_hash}"
-
-
-def ingest_data_to_kusto(records):
-    if not (KUSTO_INGEST_URI and KUSTO_DB and KUSTO_TABLE and KUSTO_INGEST_CLIENT_ID and KUSTO_INGEST_CLIENT_SECRET and KUSTO_INGEST_TENANT_ID):
-        logger.error("[Kusto] One or more Kusto env variables are missing!")
+# Скільки повідомлень обробляє один запуск таймера (Text Analytics викликається паралельно)
+SENTIMENT_MAX_ITEMS = int(os.environ.get("SENTIMENT_MAX_ITEMS", "500"))
+# Скільки повідомлень одночасно в пам'яті: кожне вікно аналізується, записується і відправляється в Kusto окремо
+SENTIMENT_WINDOW_SIZE = int(os.environ.get("SENTIMENT_WINDOW_SIZE", "100"))
+# "changefeed" — інкрементально з change feed з checkpoint-ами; "query" — вибірка необроблених запитом
+SENTIMENT_MODE = os.environ.get("SENTIMENT_MODE", "query")
+# Скільки часу може працювати один запуск у режимі change feed (таймер — кожні 5 хв)
+SENTIMENT_TIME_BUDGET_S = float(os.environ.get("SENTIMENT_TIME_BUDGET_S", "240"))
+
+# SDK Cosmos і Text Analytics імпортуються при першому запуску, а не при завантаженні модуля:
+# воркер спільний для всіх функцій, і ask/analytics_proxy не мають платити за них на холодному старті
+CosmosClient = None
+TextAnalyticsClient = None
+AzureKeyCredential = None
+
+
+def load_sdk():
+    global CosmosClient, TextAnalyticsClient, AzureKeyCredential
+    if CosmosClient is None:
+        from azure.cosmos.aio import CosmosClient
+    if TextAnalyticsClient is None:
+        from azure.ai.textanalytics.aio import TextAnalyticsClient
+    if AzureKeyCredential is None:
+        from azure.core.credentials import AzureKeyCredential
+
+
+def config_ready() -> bool:
+    settings = get_settings()
+    if not (settings.cosmos_configured and settings.text_analytics_configured):
+        logger.error("[Config] One or more environment variables are missing!")
         return False
+    load_sdk()
+    return True
+
+
+def ingest_data_to_kusto(records, flush=False):
+    """
+    Спершу дописує записи в локальний durable spool (дешево, не губиться при збої Kusto),
+    потім, якщо набралось KUSTO_INGEST_BATCH_ROWS рядків / минув KUSTO_INGEST_BATCH_MAX_AGE_S
+    або flush=True, відправляє spool у Kusto. Сегменти видаляються лише після успішного ingestion.
+    Повертає статистику replay (з глибиною spool-у), None, якщо відправка ще не потрібна,
+    або False, якщо запис у spool не вдався.
+    """
+    spool = get_spool()
     try:
-        kcsb = KustoConnectionStringBuilder.with_aad_application_key_authentication(
-            KUSTO_INGEST_URI, KUSTO_INGEST_CLIENT_ID, KUSTO_INGEST_CLIENT_SECRET, KUSTO_INGEST_TENANT_ID
-        )
-        ingest_client = QueuedIngestClient(kcsb)
-        # Prepare data as NDJSON
-        ndjson = "\n".join(json.dumps(rec, ensure_ascii=False) for rec in records)
-        from io import BytesIO
-        data_stream = BytesIO(ndjson.encode("utf-8"))
-        ingestion_props = IngestionProperties(
-            database=KUSTO_DB,
-            table=KUSTO_TABLE,
-            data_format=DataFormat.JSON,
-            flush_immediately=True
-        )
-        ingest_client.ingest_from_stream(data_stream, ingestion_properties=ingestion_props)
-        logger.info(f"[Kusto] Ingested {len(records)} records to {KUSTO_DB}.{KUSTO_TABLE}")
-        return True
+        spool.append(records)
     except Exception as e:
-        logger.error(f"[Kusto] Ingestion failed: {e}\n{traceback.format_exc()}")
-        return False
+        logger.error(f"[Spool] Append failed, sending directly: {e}\n{traceback.format_exc()}")
+        ingestor = get_ingestor()
+        return ingestor.ingest(records) if ingestor is not None else False
+    if not (flush or spool.due(KUSTO_INGEST_BATCH_ROWS, KUSTO_INGEST_BATCH_MAX_AGE_S)):
+        return None
+    ingestor = get_ingestor()
+    if ingestor is None:
+        return {"ok": False, "depth": spool.depth()}
+    try:
+        return spool.replay(ingestor.ingest)
+    except Exception as e:
+        logger.error(f"[Kusto] Replay failed: {e}\n{traceback.format_exc()}")
+        return {"ok": False, "depth": spool.depth()}
 
-async def analyze_and_update_sentiment(max_items=100):
-    if not all([COSMOSDB_ENDPOINT, COSMOSDB_KEY, COSMOSDB_DATABASE, COSMOSDB_CONTAINER, TEXT_ANALYTICS_ENDPOINT, TEXT_ANALYTICS_KEY]):
-        logger.error("[Config] One or more environment variables are missing!")
+async def analyze_items(container, items):
+    """
+    Аналізує повідомлення (мова, sentiment, key phrases), оновлює їх у Cosmos DB і відправляє метрики у Kusto.
+    Спільна частина для режиму запиту (query) і режиму change feed.
+    """
+    # Документи без meta патчимо цілим /meta (див. result_writer)
+    missing_meta = {item["id"] for item in items if not isinstance(item.get("meta"), dict)}
+    settings = get_settings()
+    credential = AzureKeyCredential(settings.text_analytics_key)
+    # Одна сесія Text Analytics на весь запуск; повтори 429/5xx робить батчер (адаптивно), а не SDK
+    async with TextAnalyticsClient(settings.text_analytics_endpoint, credential, retry_total=0) as ta_client:
+        batcher = TextAnalyticsBatcher(ta_client)
+        # Однакові тексти (привітання, "Нічого не знайдено.") аналізуємо один раз і кешуємо між запусками
+        deduper = ContentDeduper(get_store())
+        # Sentiment: Text Analytics, локальна модель або local_first (SENTIMENT_BACKEND)
+        backend = get_backend(batcher)
+        started = time.perf_counter()
+        # Detect language (лише для документів без мови або з "en")
+        detect_docs = []
+        detect_items = []
+        for item in items:
+            lang = item.get("meta", {}).get("lang")
+            if not lang or lang == "en":
+                detect_docs.append({"id": item["id"], "text": item["content"]})
+                detect_items.append(item)
+        detect_results = await deduper.through("language", detect_docs, batcher.detect_language)
+        for res, item in zip(detect_results, detect_items):
+            if res is None:
+                continue
+            if not res.is_error:
+                detected_lang = res.primary_language.iso6391_name
+                if "meta" not in item or not isinstance(item["meta"], dict):
+                    item["meta"] = {}
+                item["meta"]["lang"] = detected_lang
+                logger.info(f"[LangDetect] id={item['id']} detected lang={detected_lang}")
+            else:
+                logger.warning(f"[LangDetect] Error for id={item['id']}: {res.error}")
+
+        # Prepare documents for sentiment analysis
+        documents = [
+            {"id": item["id"], "text": item["content"], "language": item.get("meta", {}).get("lang", "uk")}
+            for item in items
+        ]
+        logger.info(f"[Sentiment] Documents to analyze: {len(documents)}")
+        # Sentiment і key phrases для всіх batch-ів одночасно
+        sentiment_results, keyphrases_results = await asyncio.gather(
+            deduper.through("sentiment", documents, backend.analyze_sentiment,
+                            variant="" if backend.model is None else backend.mode),
+            deduper.through("key_phrases", documents, batcher.extract_key_phrases),
+        )
+        logger.info(f"[TextAnalytics] {len(items)} items in {(time.perf_counter() - started) * 1000:.0f} ms, stats={batcher.stats()}, dedup={deduper.stats()}, backend={backend.stats()}")
+
+    processed_count = 0
+    all_metrics = []
+    analyzed_items = []
+    for doc_result, kp_result, item in zip(sentiment_results, keyphrases_results, items):
+        if doc_result is None:
+            # Batch sentiment не вдався — елемент лишається необробленим до наступного запуску
+            continue
+        logger.info(f"[Sentiment] Processing item id={item['id']}")
+        # Формуємо записи для Log Analytics
+        dialog_id = item.get("dialog_id") or item.get("id")
+        user_id = item.get("user_id")
+        message_id = item.get("id")
+        message_type = item.get("step")
+        time_generated = item.get("timestamp")
+        # Латентність етапів ask (meta.stages_ms) — рядки metric='latency' з колонкою stage.
+        # Операційні рядки (latency, admission_*, event_sink_*) без user_id: top_users рахує лише аналітику повідомлень
+        stages_ms = item.get("meta", {}).get("stages_ms") or {}
+        for stage, ms in stages_ms.items():
+            if ms is None:
+                continue
+            all_metrics.append({
+                "TimeGenerated": time_generated,
+                "metric": "latency",
+                "value": ms,
+                "stage": stage,
+                "message_id": message_id,
+                "dialog_id": dialog_id,
+                "message_type": message_type
+            })
+        # Стан admission control ask на момент відповіді: глибина черги, ліміт, скинуті (503) запити
+        admission = item.get("meta", {}).get("admission") or {}
+        for name, value in admission.items():
+            all_metrics.append({
+                "TimeGenerated": time_generated,
+                "metric": f"admission_{name}",
+                "value": value,
+                "message_id": message_id,
+                "dialog_id": dialog_id,
+                "message_type": message_type
+            })
+        # Латентність запису подій ask у Cosmos DB (write-behind сінк) і відставання його буфера
+        event_sink = item.get("meta", {}).get("event_sink") or {}
+        for name, value in event_sink.items():
+            if value is None:
+                continue
+            all_metrics.append({
+                "TimeGenerated": time_generated,
+                "metric": f"event_sink_{name}",
+                "value": value,
+                "message_id": message_id,
+                "dialog_id": dialog_id,
+                "message_type": message_type
+            })
+        if not doc_result.is_error:
+            sentiment = doc_result.sentiment
+            # Оновлюємо CosmosDB: записуємо результат аналізу
+            if "meta" not in item or not isinstance(item["meta"], dict):
+                item["meta"] = {}
+            item["meta"]["sentiment"] = sentiment
+            # Джерело мітки: для навчання локальної моделі беремо лише хмарні мітки
+            item["meta"]["sentiment_source"] = getattr(doc_result, "source", "cloud")
+            if hasattr(doc_result, 'detected_language'):
+                item["meta"]["lang"] = doc_result.detected_language.iso6391_name
+            all_metrics.append({
+                "TimeGenerated": time_generated,
+                "metric": "sentiment",
+                "value": sentiment,
+                "message_id": message_id,
+                "user_id": user_id,
+                "dialog_id": dialog_id,
+                "message_type": message_type
+            })
+            all_metrics.append({
+                "TimeGenerated": time_generated,
+                "metric": "language",
+                "value": doc_result.detected_language.iso6391_name if hasattr(doc_result, 'detected_language') else item.get("meta", {}).get("lang", "uk"),
+                "message_id": message_id,
+                "user_id": user_id,
+                "dialog_id": dialog_id,
+                "message_type": message_type
+            })
+        else:
+            # Відхилений документ позначаємо, щоб режим query не вибирав його (і не дублював його метрики) щоразу
+            if "meta" not in item or not isinstance(item["meta"], dict):
+                item["meta"] = {}
+            item["meta"]["sentiment_error"] = getattr(doc_result.error, "code", None) or str(doc_result.error)
+            logger.warning(f"[Sentiment] Error for id={item['id']}: {doc_result.error}")
+        if kp_result and not kp_result.is_error:
+            if "meta" not in item or not isinstance(item["meta"], dict):
+                item["meta"] = {}
+            item["meta"]["key_phrases"] = kp_result.key_phrases
+            for kw in kp_result.key_phrases:
+                all_metrics.append({
+                    "TimeGenerated": time_generated,
+                    "metric": "keyword",
+                    "value": kw,
+                    "message_id": message_id,
+                    "user_id": user_id,
+                    "dialog_id": dialog_id,
+                    "message_type": message_type
+                })
+        processed_count += 1
+        analyzed_items.append(item)
+
+    # Записуємо у Cosmos DB лише результати аналізу (patch meta) і лише для проаналізованих документів
+    writer = ResultWriter(container)
+    writes = await writer.write(analyzed_items, missing_meta)
+    # Незаписані документи буде вибрано ще раз — їхні рядки відправимо тоді, а не двічі
+    all_metrics = [record for record in all_metrics if record["message_id"] not in writer.failed_ids]
+    # Надсилаємо всі метрики batch-ом у Kusto (Azure Data Explorer)
+    if all_metrics:
+        logger.info(f"[Kusto] Sending {len(all_metrics)} records to Kusto. Example: {all_metrics[0] if all_metrics else 'EMPTY'}")
+        # Kusto-клієнт синхронний — не блокуємо event loop
+        result = await asyncio.to_thread(ingest_data_to_kusto, all_metrics)
+        logger.info(f"[Kusto] ingest_data_to_kusto returned: {result}")
+    else:
+        logger.warning("[Kusto] all_metrics is empty, nothing to send.")
+    logger.info(f"[Sentiment] Processed {processed_count} items.")
+    return {"processed": processed_count, "text_analytics": batcher.stats(), "dedup": deduper.stats(),
+            "sentiment_backend": backend.stats(), "cosmos_writes": writes}
+
+
+def spool_depth_record():
+    """
+    Рядок метрики з глибиною локального spool-у (скільки байтів ще не дійшло до Kusto).
+    """
+    return {
+        "TimeGenerated": datetime.utcnow().isoformat() + "Z",
+        "metric": "spool_depth_bytes",
+        "value": get_spool().depth()["bytes"],
+    }
+
+
+def peak_memory_mb():
+    """
+    Піковий RSS процесу (МБ); None, якщо модуль resource недоступний.
+    """
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+async def iter_pending_windows(container, max_items, window_size=None):
+    """
+    Генератор вікон необроблених повідомлень: читає результати запиту посторінково
+    і віддає їх порціями по window_size, не тримаючи всю вибірку в пам'яті.
+    """
+    window_size = window_size or SENTIMENT_WINDOW_SIZE
+    query = "SELECT * FROM c WHERE (c.step = 'question' OR c.step = 'answer') AND (NOT IS_DEFINED(c.meta.sentiment) OR c.meta.sentiment = null) AND NOT IS_DEFINED(c.meta.sentiment_error) AND NOT IS_DEFINED(c.meta.bulk) OFFSET 0 LIMIT @max_items"
+    params = [{"name": "@max_items", "value": max_items}]
+    window = []
+    async for page in container.query_items(query, parameters=params, max_item_count=window_size).by_page():
+        async for item in page:
+            window.append(item)
+            if len(window) >= window_size:
+                yield window
+                window = []
+    if window:
+        yield window
+
+
+async def analyze_and_update_sentiment(max_items=None, window_size=None):
+    """
+    Обробка необроблених повідомлень вікнами: query page -> аналіз -> patch у Cosmos -> ingest у Kusto.
+    Кожне вікно фіксується окремо, тож збій у пізньому вікні не губить уже оброблені.
+    """
+    max_items = max_items or SENTIMENT_MAX_ITEMS
+    if not config_ready():
         return {"error": "Missing config"}
+    settings = get_settings()
+    summary = {"processed": 0, "read": 0, "windows": 0, "failed_windows": 0}
     try:
-        async with CosmosClient(COSMOSDB_ENDPOINT, COSMOSDB_KEY) as cosmos_client:
-            db = cosmos_client.get_database_client(COSMOSDB_DATABASE)
-            container = db.get_container_client(COSMOSDB_CONTAINER)
-            query = "SELECT * FROM c WHERE (c.step = 'question' OR c.step = 'answer') AND (NOT IS_DEFINED(c.meta.sentiment) OR c.meta.sentiment = null) OFFSET 0 LIMIT @max_items"
-            params = [{"name": "@max_items", "value": max_items}]
-            items = [item async for item in container.query_items(query, parameters=params)]
-            logger.info(f"[Sentiment] Found {len(items)} items to process.")
-            if not items:
+        async with CosmosClient(settings.cosmos_endpoint, settings.cosmos_key) as cosmos_client:
+            db = cosmos_client.get_database_client(settings.cosmos_database)
+            container = db.get_container_client(settings.cosmos_container)
+            async for window in iter_pending_windows(container, max_items, window_size):
+                summary["read"] += len(window)
+                summary["windows"] += 1
+                try:
+                    result = await analyze_items(container, window)
+                    summary["processed"] += result.get("processed", 0)
+                except Exception as e:
+                    summary["failed_windows"] += 1
+                    logger.error(f"[Sentiment] Window {summary['windows']} failed: {e}\n{traceback.format_exc()}")
+            if not summary["read"]:
                 logger.info("[Sentiment] No items to process.")
-                return {"processed": 0}
-            credential = AzureKeyCredential(TEXT_ANALYTICS_KEY)
-            # Detect language
-            async with TextAnalyticsClient(TEXT_ANALYTICS_ENDPOINT, credential) as ta_client:
-                batch_size = 10
-                for i in range(0, len(items), batch_size):
-                    batch_items = items[i:i+batch_size]
-                    detect_docs = []
-                    detect_indices = []
-                    for idx, item in enumerate(batch_items):
-                        lang = item.get("meta", {}).get("lang")
-                        if not lang or lang == "en":
-                            detect_docs.append({"id": item["id"], "text": item["content"]})
-                            detect_indices.append(idx)
-                    if detect_docs:
-                        try:
-                            detect_results = await ta_client.detect_language(documents=detect_docs)
-                            for res, idx in zip(detect_results, detect_indices):
-                                if not res.is_error:
-                                    detected_lang = res.primary_language.iso6391_name
-                                    if "meta" not in batch_items[idx] or not isinstance(batch_items[idx]["meta"], dict):
-                                        batch_items[idx]["meta"] = {}
-                                    batch_items[idx]["meta"]["lang"] = detected_lang
-                                    logger.info(f"[LangDetect] id={batch_items[idx]['id']} detected lang={detected_lang}")
-                                else:
-                                    logger.warning(f"[LangDetect] Error for id={batch_items[idx]['id']}: {res.error}")
-                        except Exception as e:
-                            logger.error(f"[LangDetect] Exception in batch: {e}\n{traceback.format_exc()}")
-
-            # Після аналізу — оновлюємо документи у Cosmos DB, щоб відмітити як оброблені
-            async def update_cosmos_items(container, items):
-                for item in items:
-                    try:
-                        await container.upsert_item(item)
-                        logger.info(f"[Cosmos] Updated item id={item['id']} as processed.")
-                    except Exception as e:
-                        logger.error(f"[Cosmos] Failed to update item id={item['id']}: {e}")
-
-            # Prepare documents for sentiment analysis
-            documents = [
-                {"id": item["id"], "text": item["content"], "language": item.get("meta", {}).get("lang", "uk")}
-                for item in items
-            ]
-            logger.info(f"[Sentiment] Documents to analyze: {[d['id'] for d in documents]}")
-            processed_count = 0
-            all_metrics = []
-            async with TextAnalyticsClient(TEXT_ANALYTICS_ENDPOINT, credential) as ta_client:
-                batch_size = 10
-                for i in range(0, len(documents), batch_size):
-                    batch_docs = documents[i:i+batch_size]
-                    batch_items = items[i:i+batch_size]
-                    logger.info(f"[Sentiment] Sending batch: {[d['id'] for d in batch_docs]}")
-                    try:
-                        sentiment_response = await ta_client.analyze_sentiment(documents=batch_docs)
-                    except Exception as e:
-                        logger.error(f"[Sentiment] Exception in batch: {e}\n{traceback.format_exc()}")
-                        continue
-                    try:
-                        keyphrases_response = await ta_client.extract_key_phrases(documents=batch_docs)
-                    except Exception as e:
-                        logger.error(f"[KeyPhrases] Exception in batch: {e}\n{traceback.format_exc()}")
-                        keyphrases_response = [None] * len(batch_docs)
-                    for doc_result, kp_result, item in zip(sentiment_response, keyphrases_response, batch_items):
-                        logger.info(f"[Sentiment] Processing item id={item['id']}")
-                        logger.info(f"[Sentiment] Raw item: {item}")
-                        # Формуємо записи для Log Analytics
-                        dialog_id = item.get("dialog_id") or item.get("id")
-                        user_id = item.get("user_id")
-                        message_id = item.get("id")
-                        message_type = item.get("step")
-                        time_generated = item.get("timestamp")
-                        if not doc_result.is_error:
-                            sentiment = doc_result.sentiment
-                            # Оновлюємо CosmosDB: записуємо результат аналізу
-                            if "meta" not in item or not isinstance(item["meta"], dict):
-                                item["meta"] = {}
-                            item["meta"]["sentiment"] = sentiment
-                            if hasattr(doc_result, 'detected_language'):
-                                item["meta"]["lang"] = doc_result.detected_language.iso6391_name
-                            all_metrics.append({
-                                "TimeGenerated": time_generated,
-                                "metric": "sentiment",
-                                "value": sentiment,
-                                "message_id": message_id,
-                                "user_id": user_id,
-                                "dialog_id": dialog_id,
-                                "message_type": message_type
-                            })
-                            all_metrics.append({
-                                "TimeGenerated": time_generated,
-                                "metric": "language",
-                                "value": doc_result.detected_language.iso6391_name if hasattr(doc_result, 'detected_language') else item.get("meta", {}).get("lang", "uk"),
-                                "message_id": message_id,
-                                "user_id": user_id,
-                                "dialog_id": dialog_id,
-                                "message_type": message_type
-                            })
-                        if kp_result and not kp_result.is_error:
-                            if "meta" not in item or not isinstance(item["meta"], dict):
-                                item["meta"] = {}
-                            item["meta"]["key_phrases"] = kp_result.key_phrases
-                            for kw in kp_result.key_phrases:
-                                all_metrics.append({
-                                    "TimeGenerated": time_generated,
-                                    "metric": "keyword",
-                                    "value": kw,
-                                    "message_id": message_id,
-                                    "user_id": user_id,
-                                    "dialog_id": dialog_id,
-                                    "message_type": message_type
-                                })
-                        processed_count += 1
-
-            # Оновлюємо всі оброблені документи у Cosmos DB
-            await update_cosmos_items(container, items)
-            # Надсилаємо всі метрики batch-ом у Kusto (Azure Data Explorer)
-            if all_metrics:
-                logger.info(f"[Kusto] Sending {len(all_metrics)} records to Kusto. Example: {all_metrics[0] if all_metrics else 'EMPTY'}")
-                result = ingest_data_to_kusto(all_metrics)
-                logger.info(f"[Kusto] ingest_data_to_kusto returned: {result}")
-            else:
-                logger.warning("[Kusto] all_metrics is empty, nothing to send.")
-            logger.info(f"[Sentiment] Processed {processed_count} items.")
-            return {"processed": processed_count}
+            summary["kusto"] = await asyncio.to_thread(ingest_data_to_kusto, [spool_depth_record()], True)
+            summary["peak_memory_mb"] = peak_memory_mb()
+            logger.info(f"[Sentiment] Run finished: {summary}")
+            return summary
     except Exception as e:
         logger.error(f"[Sentiment] Exception: {e}\n{traceback.format_exc()}")
-        return {"error": str(e)}
+        return {"error": str(e), **summary}
+
+
+async def process_change_feed(time_budget_s=None, batch_size=None):
+    """
+    Інкрементальна обробка: читає change feed від збереженого continuation token,
+    аналізує лише нові питання/відповіді і після кожного обробленого batch-у зберігає checkpoint.
+    Крутиться, поки feed не вичерпано або не вийшов бюджет часу.
+    Після збою наступний запуск продовжує з останнього checkpoint-у (batch, що обробився частково,
+    буде прочитано ще раз, але вже оброблені елементи відсіюються фільтром).
+    """
+    if not config_ready():
+        return {"error": "Missing config"}
+    settings = get_settings()
+    time_budget_s = time_budget_s or SENTIMENT_TIME_BUDGET_S
+    batch_size = batch_size or SENTIMENT_WINDOW_SIZE
+    deadline = time.monotonic() + time_budget_s
+    summary = {"processed": 0, "read": 0, "batches": 0, "caught_up": False}
+    try:
+        async with CosmosClient(settings.cosmos_endpoint, settings.cosmos_key) as cosmos_client:
+            db = cosmos_client.get_database_client(settings.cosmos_database)
+            container = db.get_container_client(settings.cosmos_container)
+            leases = db.get_container_client(change_feed.SENTIMENT_LEASES_CONTAINER)
+            checkpoint = await change_feed.read_checkpoint(leases)
+            continuation = checkpoint.get("continuation")
+            last_ts = checkpoint.get("last_ts")
+            logger.info(f"[ChangeFeed] Starting from {'checkpoint last_ts=' + str(last_ts) if continuation else 'the beginning'}")
+            pending = []
+
+            async def flush():
+                # False — частина batch-у не проаналізована або не записана: checkpoint не рухаємо
+                result = await analyze_items(container, pending)
+                summary["processed"] += result.get("processed", 0)
+                summary["batches"] += 1
+                return result.get("processed", 0) == len(pending) and not result.get("cosmos_writes", {}).get("failed")
+
+            pages = change_feed.iter_change_pages(container, continuation)
+            summary["caught_up"] = True
+            committed = True
+            failed = False
+            async for page_items, token in pages:
+                summary["read"] += len(page_items)
+                pending.extend(item for item in page_items if change_feed.is_pending_message(item))
+                last_ts = max(item.get("_ts", 0) for item in page_items) or last_ts
+                continuation = token
+                committed = False
+                if len(pending) >= batch_size:
+                    if not await flush():
+                        logger.warning("[ChangeFeed] Batch partially failed, keeping previous checkpoint.")
+                        summary["caught_up"] = False
+                        failed = True
+                        break
+                    pending = []
+                    await change_feed.save_checkpoint(leases, continuation, last_ts, summary["processed"])
+                    committed = True
+                if time.monotonic() >= deadline:
+                    logger.warning(f"[ChangeFeed] Time budget {time_budget_s}s exhausted, stopping.")
+                    summary["caught_up"] = False
+                    break
+            await pages.aclose()
+            if failed:
+                # Checkpoint лишається на останньому успішному batch-і: невдалий буде прочитано знову
+                pass
+            elif pending and not await flush():
+                logger.warning("[ChangeFeed] Batch partially failed, keeping previous checkpoint.")
+                summary["caught_up"] = False
+            elif not committed:
+                await change_feed.save_checkpoint(leases, continuation, last_ts, summary["processed"])
+            summary["backlog_lag_s"] = change_feed.backlog_lag_s(last_ts, summary["caught_up"])
+            summary["peak_memory_mb"] = peak_memory_mb()
+            # Кінець запуску: відправляємо spool разом із метриками відставання і глибини spool-у
+            summary["kusto"] = await asyncio.to_thread(ingest_data_to_kusto, [{
+                "TimeGenerated": datetime.utcnow().isoformat() + "Z",
+                "metric": "backlog_lag_s",
+                "value": summary["backlog_lag_s"],
+            }, spool_depth_record()], True)
+            logger.info(f"[ChangeFeed] Run finished: {summary}")
+            return summary
+    except Exception as e:
+        logger.error(f"[ChangeFeed] Exception: {e}\n{traceback.format_exc()}")
+        return {"error": str(e), **summary}
+
+
+async def run_sentiment(max_items=None):
+    """
+    Точка входу таймера: режим обирається через SENTIMENT_MODE.
+    """
+    if SENTIMENT_MODE == "changefeed":
+        return await process_change_feed()
+    return await analyze_and_update_sentiment(max_items=max_items)
@@ -1,7 +1,7 @@
 import logging
 import azure.functions as func
 import asyncio
-from .analyze_sentiment_core import analyze_and_update_sentiment
+from .analyze_sentiment_core import run_sentiment
 
 # Set up a custom logger with module and function name in format
 logging.basicConfig(
@@ -12,5 +12,5 @@ logger = logging.getLogger(__name__)
 
 def main(mytimer: func.TimerRequest) -> None:
     logger.info('Sentiment analysis timer function started.')
-    result = asyncio.run(analyze_and_update_sentiment())
+    result = asyncio.run(run_sentiment())
     logger.info(f'Sentiment analysis result: {result}')
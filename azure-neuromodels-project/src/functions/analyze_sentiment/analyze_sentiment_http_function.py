@@ -1,7 +1,7 @@
 import logging
 import azure.functions as func
 import asyncio
-from .analyze_sentiment_core import analyze_and_update_sentiment
+from .analyze_sentiment_core import analyze_and_update_sentiment, process_change_feed
 
 # Set up a custom logger with module and function name in format
 logging.basicConfig(
@@ -16,6 +16,10 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         max_items = int(req.params.get('max_items', 100))
     except Exception:
         max_items = 100
-    result = asyncio.run(analyze_and_update_sentiment(max_items=max_items))
+    # mode=changefeed — інкрементальна обробка з checkpoint-ами, інакше вибірка необроблених запитом
+    if req.params.get('mode') == 'changefeed':
+        result = asyncio.run(process_change_feed())
+    else:
+        result = asyncio.run(analyze_and_update_sentiment(max_items=max_items))
     logger.info(f'Sentiment analysis result: {result}')
     return func.HttpResponse(str(result), mimetype="application/json")
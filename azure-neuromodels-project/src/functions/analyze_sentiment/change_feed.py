@@ -0,0 +1,79 @@
+import os
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_LEASES_CONTAINER = os.environ.get("SENTIMENT_LEASES_CONTAINER", "leases")
+CHECKPOINT_ID = os.environ.get("SENTIMENT_CHECKPOINT_ID", "sentiment-change-feed")
+# Розмір сторінки change feed (max_item_count)
+CHANGE_FEED_PAGE_SIZE = int(os.environ.get("SENTIMENT_CHANGE_FEED_PAGE_SIZE", "500"))
+
+PROCESSED_STEPS = ("question", "answer")
+
+
+def is_pending_message(item: dict) -> bool:
+    """
+    Питання/відповідь, для яких ще немає sentiment. Change feed віддає і інші події
+    (search_result, документи історії), і наші ж власні оновлення вже оброблених повідомлень.
+    Події bulk ask (meta.bulk) — не діалог користувача, їх не аналізуємо.
+    """
+    if item.get("step") not in PROCESSED_STEPS or not item.get("content"):
+        return False
+    meta = item.get("meta")
+    return not (isinstance(meta, dict) and (meta.get("sentiment") or meta.get("sentiment_error") or meta.get("bulk")))
+
+
+async def read_checkpoint(leases) -> dict:
+    # Імпорт тут, а не на рівні модуля: analyze_sentiment_core імпортує change_feed завжди,
+    # а SDK Cosmos завантажується лише при запуску (load_sdk)
+    from azure.cosmos.exceptions import CosmosResourceNotFoundError
+    try:
+        return await leases.read_item(item=CHECKPOINT_ID, partition_key=CHECKPOINT_ID)
+    except CosmosResourceNotFoundError:
+        return {}
+
+
+async def save_checkpoint(leases, continuation: str, last_ts: int = None, processed: int = 0):
+    doc = {
+        "id": CHECKPOINT_ID,
+        "continuation": continuation,
+        "last_ts": last_ts,
+        "processed": processed,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    await leases.upsert_item(doc)
+    logger.info(f"[ChangeFeed] Checkpoint saved: last_ts={last_ts}, processed={processed}")
+
+
+async def iter_change_pages(container, continuation: str = None, page_size: int = CHANGE_FEED_PAGE_SIZE):
+    """
+    Сторінки change feed від continuation (або від початку, якщо checkpoint-у ще немає).
+    Повертає (items, continuation після цієї сторінки). Закінчується, коли feed вичерпано.
+    Token — непрозорий continuation_token пейджера azure-core, зберігається і повертається в SDK як є:
+    у azure-cosmos 4.7.x це ETag, у новіших — base64-стан по feed range (ETag зі старих checkpoint-ів
+    новіші SDK теж приймають).
+    """
+    if continuation is None:
+        options = {"is_start_from_beginning": True}
+    else:
+        options = {"continuation": continuation}
+    feed = container.query_items_change_feed(max_item_count=page_size, **options)
+    pager = feed.by_page(continuation)
+    async for page in pager:
+        items = [item async for item in page]
+        token = pager.continuation_token or continuation
+        if not items:
+            return
+        yield items, token
+        continuation = token
+
+
+def backlog_lag_s(last_ts: int, caught_up: bool) -> float:
+    """
+    Наскільки обробка відстає від запису: 0, якщо feed вичерпано,
+    інакше вік (секунди) останньої прочитаної зміни.
+    """
+    if caught_up or not last_ts:
+        return 0.0
+    return round(max(0.0, datetime.now(timezone.utc).timestamp() - last_ts), 1)
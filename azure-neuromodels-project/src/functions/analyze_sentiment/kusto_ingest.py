@@ -0,0 +1,148 @@
+import io
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+import traceback
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# "queued" — через черги (дешево, затримка хвилини); "streaming" — managed streaming (секунди, з fallback на queued)
+KUSTO_INGEST_MODE = os.environ.get("KUSTO_INGEST_MODE", "queued")
+# Максимальний розмір одного чанка NDJSON до стиснення (streaming ingestion приймає до 4 МБ)
+KUSTO_INGEST_CHUNK_BYTES = int(os.environ.get(
+    "KUSTO_INGEST_CHUNK_BYTES", str(4 * 1024 * 1024 if KUSTO_INGEST_MODE == "streaming" else 64 * 1024 * 1024)
+))
+# Пороги spool-у: відправляємо, коли набралось стільки рядків або найстаріший чекає довше
+KUSTO_INGEST_BATCH_ROWS = int(os.environ.get("KUSTO_INGEST_BATCH_ROWS", "5000"))
+KUSTO_INGEST_BATCH_MAX_AGE_S = float(os.environ.get("KUSTO_INGEST_BATCH_MAX_AGE_S", "60"))
+# flush_immediately=True створює дрібні екстенти; за замовчуванням покладаємось на batching policy кластера
+KUSTO_FLUSH_IMMEDIATELY = os.environ.get("KUSTO_FLUSH_IMMEDIATELY", "false").lower() == "true"
+
+# SDK ingestion (тягне azure-storage і azure-kusto-data) підвантажується лише при створенні ingestor-а
+KustoConnectionStringBuilder = None
+QueuedIngestClient = None
+ManagedStreamingIngestClient = None
+IngestionProperties = None
+StreamDescriptor = None
+DataFormat = None
+
+
+def load_sdk():
+    global KustoConnectionStringBuilder, QueuedIngestClient, ManagedStreamingIngestClient
+    global IngestionProperties, StreamDescriptor, DataFormat
+    if KustoConnectionStringBuilder is None:
+        from azure.kusto.data import KustoConnectionStringBuilder
+    if QueuedIngestClient is None:
+        from azure.kusto.ingest import QueuedIngestClient
+    if ManagedStreamingIngestClient is None:
+        from azure.kusto.ingest import ManagedStreamingIngestClient
+    if IngestionProperties is None:
+        from azure.kusto.ingest import IngestionProperties
+    if StreamDescriptor is None:
+        from azure.kusto.ingest import StreamDescriptor
+    if DataFormat is None:
+        from azure.kusto.ingest.ingestion_properties import DataFormat
+
+
+def iter_gzip_chunks(records, max_bytes: int = KUSTO_INGEST_CHUNK_BYTES):
+    """
+    Стискає записи в gzip NDJSON чанками, кожен не більше max_bytes до стиснення.
+    Повертає (compressed bytes, raw size, rows) без побудови одного великого рядка.
+    """
+    buffer = io.BytesIO()
+    writer = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=6)
+    raw_size = 0
+    rows = 0
+    for record in records:
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if rows and raw_size + len(line) > max_bytes:
+            writer.close()
+            yield buffer.getvalue(), raw_size, rows
+            buffer = io.BytesIO()
+            writer = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=6)
+            raw_size = 0
+            rows = 0
+        writer.write(line)
+        raw_size += len(line)
+        rows += 1
+    writer.close()
+    if rows:
+        yield buffer.getvalue(), raw_size, rows
+
+
+class KustoIngestor:
+    """
+    Довгоживучий клієнт ingestion у Kusto: один клієнт на воркер, gzip NDJSON чанками
+    обмеженого розміру, queued або streaming режим. Буферизацію робить metric_spool.
+    """
+
+    def __init__(self, mode: str = KUSTO_INGEST_MODE, database: str = None, table: str = None):
+        load_sdk()
+        settings = get_settings()
+        self.mode = mode
+        kcsb = KustoConnectionStringBuilder.with_aad_application_key_authentication(
+            settings.kusto_ingest_uri, settings.kusto_client_id, settings.kusto_client_secret, settings.kusto_tenant_id
+        )
+        if mode == "streaming":
+            self.client = ManagedStreamingIngestClient.from_dm_kcsb(kcsb)
+        else:
+            self.client = QueuedIngestClient(kcsb)
+        self.properties = IngestionProperties(
+            database=database or settings.kusto_db,
+            table=table or settings.kusto_table,
+            data_format=DataFormat.JSON,
+            flush_immediately=KUSTO_FLUSH_IMMEDIATELY,
+        )
+        self.totals = {"rows": 0, "chunks": 0, "raw_bytes": 0, "compressed_bytes": 0, "failed_rows": 0}
+
+    def ingest(self, records: list, stop_on_error: bool = False) -> dict:
+        """
+        Відправляє записи чанками. ok=False, якщо хоча б один чанк не пройшов.
+        З stop_on_error=True зупиняється на першому невдалому чанку, тож rows — це кількість
+        перших записів, що точно відправлені (replay spool-у не повторює їх).
+        """
+        stats = {"ok": True, "rows": 0, "chunks": 0, "raw_bytes": 0, "compressed_bytes": 0}
+        started = time.perf_counter()
+        for compressed, raw_size, rows in iter_gzip_chunks(records):
+            try:
+                descriptor = StreamDescriptor(io.BytesIO(compressed), is_compressed=True, size=raw_size)
+                self.client.ingest_from_stream(descriptor, ingestion_properties=self.properties)
+                stats["rows"] += rows
+                stats["chunks"] += 1
+                stats["raw_bytes"] += raw_size
+                stats["compressed_bytes"] += len(compressed)
+            except Exception as e:
+                stats["ok"] = False
+                self.totals["failed_rows"] += rows
+                logger.error(f"[Kusto] Ingestion of {rows} rows failed: {e}\n{traceback.format_exc()}")
+                if stop_on_error:
+                    break
+        stats["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        stats["compression_ratio"] = round(stats["raw_bytes"] / stats["compressed_bytes"], 2) if stats["compressed_bytes"] else None
+        for key in ("rows", "chunks", "raw_bytes", "compressed_bytes"):
+            self.totals[key] += stats[key]
+        if records:
+            logger.info(f"[Kusto] Ingested to {self.properties.database}.{self.properties.table} ({self.mode}): {stats}")
+        return stats
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def get_ingestor():
+    """
+    Спільний для воркера ingestor; None, якщо змінні Kusto не задані.
+    """
+    global _ingestor
+    if not get_settings().kusto_configured:
+        logger.error("[Kusto] One or more Kusto env variables are missing!")
+        return None
+    with _ingestor_lock:
+        if _ingestor is None:
+            _ingestor = KustoIngestor()
+    return _ingestor
@@ -0,0 +1,79 @@
+"""
+Компактний локальний класифікатор sentiment для uk/en.
+
+Ознаки — хешовані слова, біграми слів і символьні 3/4-грами (стабільний crc32, без словника),
+sublinear tf + L2-нормування. Модель — мультиноміальна логістична регресія:
+весь batch скорингується одним sparse @ dense множенням і softmax.
+Ваги тренуються скриптом train_local_model.py і зберігаються у .npz.
+"""
+import re
+import zlib
+from collections import Counter
+import numpy as np
+from scipy import sparse
+
+DEFAULT_N_FEATURES = 2 ** 18
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def extract_features(text: str) -> list:
+    words = _WORD_RE.findall((text or "").lower())
+    features = [f"w:{w}" for w in words]
+    features.extend(f"b:{a}_{b}" for a, b in zip(words, words[1:]))
+    for w in words:
+        padded = f"<{w}>"
+        for n in (3, 4):
+            features.extend(f"c{n}:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+    return features
+
+
+def vectorize(texts, n_features: int = DEFAULT_N_FEATURES) -> sparse.csr_matrix:
+    """
+    Тексти -> CSR-матриця (len(texts) x n_features) з L2-нормованими рядками.
+    """
+    indices, data, indptr = [], [], [0]
+    for text in texts:
+        counts = Counter(zlib.crc32(f.encode("utf-8")) % n_features for f in extract_features(text))
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.log1p(np.asarray(data, dtype=np.float32)), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(texts), n_features),
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+class LocalSentimentModel:
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels, n_features: int = DEFAULT_N_FEATURES):
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.labels = [str(label) for label in labels]
+        self.n_features = n_features
+
+    @classmethod
+    def load(cls, path: str) -> "LocalSentimentModel":
+        with np.load(path, allow_pickle=False) as f:
+            return cls(f["weights"], f["bias"], f["labels"], int(f["n_features"]))
+
+    def save(self, path: str):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias,
+                            labels=np.array(self.labels), n_features=np.array(self.n_features))
+
+    def predict_proba(self, texts) -> np.ndarray:
+        if not len(texts):
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+        logits = vectorize(texts, self.n_features) @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def predict(self, texts):
+        """
+        Повертає (labels, confidence) для кожного тексту.
+        """
+        probs = self.predict_proba(texts)
+        best = probs.argmax(axis=1)
+        return [self.labels[i] for i in best], probs[np.arange(len(best)), best]
@@ -0,0 +1,313 @@
+"""
+Локальний durable spool для рядків метрик перед ingestion у Kusto.
+
+Рядки дописуються в сегменти (length-prefixed NDJSON: 4 байти довжини big-endian + JSON-рядок),
+активний сегмент процесу — *.open, закриті — *.seg. Replayer забирає закриті сегменти
+(атомарним rename), відправляє їх великими batch-ами і видаляє лише після успішного ingestion;
+при помилці сегменти повертаються і будуть відправлені наступного разу (без уже відправлених чанків).
+
+Каталог може бути спільним для кількох інстансів (/home/data), тому в імені активного сегмента
+є власник (інстанс + pid): закривати чужі *.open можна лише після смерті процесу-власника
+на цьому ж інстансі, інакше живий воркер продовжив би писати в уже відправлений файл.
+
+Ручний drain (з каталогу src/functions):
+    python -m analyze_sentiment.metric_spool [--depth]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import glob
+import socket
+import struct
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# На Azure Functions /home/data — постійне сховище (переживає рестарт воркера)
+KUSTO_SPOOL_DIR = os.environ.get("KUSTO_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "kusto_spool"))
+KUSTO_SPOOL_SEGMENT_BYTES = int(os.environ.get("KUSTO_SPOOL_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+# Скільки рядків максимум в одному виклику ingestion під час replay
+KUSTO_SPOOL_REPLAY_ROWS = int(os.environ.get("KUSTO_SPOOL_REPLAY_ROWS", "50000"))
+KUSTO_SPOOL_FSYNC = os.environ.get("KUSTO_SPOOL_FSYNC", "true").lower() == "true"
+
+_HEADER = struct.Struct(">I")
+
+# Інстанс App Service (на локальному запуску — hostname); pid унікальний лише в межах інстансу
+INSTANCE_ID = hashlib.sha1(
+    (os.environ.get("WEBSITE_INSTANCE_ID") or socket.gethostname()).encode("utf-8")
+).hexdigest()[:12]
+# Мітка запуску процесу: перезапущений воркер у контейнері часто отримує той самий pid,
+# тож власник файлів spool-у — інстанс, pid і ця мітка
+PROCESS_START_ID = uuid.uuid4().hex[:8]
+
+
+def encode_record(record: dict) -> bytes:
+    payload = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    return _HEADER.pack(len(payload)) + payload
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def owner_of(path: str):
+    """
+    (instance, pid, start) з імені *.open ("<ts>-<instance>-<pid>-<start>.open") або *.replaying-<instance>-<pid>-<start>.
+    start — None для імен без мітки запуску ("<instance>-<pid>"). None, якщо ім'я іншого формату.
+    """
+    name = os.path.basename(path)
+    owner = name.rsplit(".replaying-", 1)[1] if ".replaying-" in name else name[:-len(".open")].split("-", 1)[-1]
+    head, _, tail = owner.rpartition("-")
+    instance, _, pid = head.rpartition("-")
+    start = tail
+    if not (instance and pid.isdigit()):
+        instance, pid, start = head, tail, None
+    return (instance, int(pid), start) if instance and pid.isdigit() else None
+
+
+def write_segment(path: str, records: list):
+    """
+    Атомарно перезаписує сегмент (через тимчасовий файл).
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(encode_record(record) for record in records))
+        f.flush()
+        if KUSTO_SPOOL_FSYNC:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_segment(path: str):
+    """
+    Читає записи сегмента. Обрізаний хвіст (збій під час запису) відкидається.
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            (length,) = _HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                logger.warning(f"[Spool] Truncated record at the end of {path}, skipping tail")
+                return
+            try:
+                yield json.loads(payload)
+            except ValueError:
+                logger.warning(f"[Spool] Corrupt record in {path}, skipping tail")
+                return
+
+
+class MetricSpool:
+    def __init__(self, directory: str = KUSTO_SPOOL_DIR, segment_bytes: int = KUSTO_SPOOL_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_path = None
+        self._active_size = 0
+        self.appended_rows = 0
+        self.oldest_unsent = None
+        self.owner = f"{INSTANCE_ID}-{os.getpid()}-{PROCESS_START_ID}"
+
+    def _open_segment(self):
+        name = f"{time.time_ns():020d}-{self.owner}"
+        self._active_path = os.path.join(self.directory, name + ".open")
+        self._active = open(self._active_path, "ab")
+        self._active_size = 0
+
+    def _seal_active(self):
+        if self._active is None:
+            return
+        self._active.close()
+        if self._active_size:
+            os.replace(self._active_path, self._active_path[:-len(".open")] + ".seg")
+        else:
+            os.remove(self._active_path)
+        self._active = None
+        self._active_path = None
+        self._active_size = 0
+
+    def _seal_stale(self):
+        """
+        Закриває сегменти процесів цього інстансу, що вже завершились (рестарт воркера),
+        і повертає сегменти, які вони не встигли відправити. Файли інших інстансів не чіпаємо:
+        з цього інстансу не видно, чи живий їхній власник. Наш pid з іншою міткою запуску —
+        попередній запуск воркера, що отримав той самий pid.
+        """
+        paths = glob.glob(os.path.join(self.directory, "*.open")) + glob.glob(os.path.join(self.directory, "*.replaying-*"))
+        for path in paths:
+            if path == self._active_path or path.endswith(".tmp"):
+                continue
+            owner = owner_of(path)
+            if owner is None or owner[0] != INSTANCE_ID:
+                continue
+            instance, pid, start = owner
+            if f"{instance}-{pid}-{start}" == self.owner or (pid != os.getpid() and process_alive(pid)):
+                continue
+            try:
+                if path.endswith(".open"):
+                    os.replace(path, path[:-len(".open")] + ".seg")
+                    logger.info(f"[Spool] Sealed abandoned segment {os.path.basename(path)}")
+                else:
+                    self._release([path])
+                    logger.info(f"[Spool] Released abandoned replay {os.path.basename(path)}")
+            except FileNotFoundError:
+                pass
+
+    def append(self, records: list):
+        """
+        Дописує рядки в активний сегмент (один write + fsync на виклик).
+        """
+        if not records:
+            return
+        data = b"".join(encode_record(record) for record in records)
+        with self._lock:
+            if self._active is None:
+                self._open_segment()
+            self._active.write(data)
+            self._active.flush()
+            if KUSTO_SPOOL_FSYNC:
+                os.fsync(self._active.fileno())
+            self._active_size += len(data)
+            self.appended_rows += len(records)
+            if self.oldest_unsent is None:
+                self.oldest_unsent = time.monotonic()
+            if self._active_size >= self.segment_bytes:
+                self._seal_active()
+
+    def due(self, max_rows: int, max_age_s: float) -> bool:
+        return self.appended_rows >= max_rows or (
+            self.oldest_unsent is not None and time.monotonic() - self.oldest_unsent >= max_age_s
+        )
+
+    def _claim(self) -> list:
+        """
+        Забирає закриті сегменти (rename у *.replaying), щоб паралельний replayer їх не відправив повторно.
+        """
+        with self._lock:
+            self._seal_active()
+            self.appended_rows = 0
+            self.oldest_unsent = None
+        self._seal_stale()
+        claimed = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.seg"))):
+            target = path[:-len(".seg")] + f".replaying-{self.owner}"
+            try:
+                os.replace(path, target)
+                claimed.append(target)
+            except FileNotFoundError:
+                continue
+        return claimed
+
+    @staticmethod
+    def _release(paths: list):
+        for path in paths:
+            try:
+                os.replace(path, path.rsplit(".replaying-", 1)[0] + ".seg")
+            except FileNotFoundError:
+                pass
+
+    def replay(self, ingest, max_rows: int = KUSTO_SPOOL_REPLAY_ROWS) -> dict:
+        """
+        Відправляє всі закриті сегменти: ingest(records, stop_on_error=True) -> dict з ключами ok і rows
+        (rows — скільки перших записів відправлено до першого невдалого чанка).
+        Сегменти видаляються лише після відправки всіх їхніх рядків; з частково відправленого
+        сегмента вирізаються відправлені рядки, щоб повтор не дублював їх у Kusto.
+        """
+        segments = self._claim()
+        stats = {"ok": True, "rows": 0, "segments": 0, "batches": 0}
+        batch, batch_segments = [], []
+
+        def send():
+            result = ingest(batch, stop_on_error=True)
+            stats["batches"] += 1
+            ok = bool(result and result.get("ok"))
+            sent = len(batch) if ok else min((result or {}).get("rows", 0), len(batch))
+            offset = 0
+            for path, count in batch_segments:
+                if offset + count <= sent:
+                    os.remove(path)
+                    stats["segments"] += 1
+                elif offset < sent:
+                    write_segment(path, batch[sent:offset + count])
+                offset += count
+            stats["rows"] += sent
+            return ok
+
+        for index, path in enumerate(segments):
+            records = list(read_segment(path))
+            batch.extend(records)
+            batch_segments.append((path, len(records)))
+            if len(batch) >= max_rows or index == len(segments) - 1:
+                if not send():
+                    stats["ok"] = False
+                    self._release(segments[index - len(batch_segments) + 1:])
+                    logger.warning(f"[Spool] Replay failed, {len(segments) - stats['segments']} segments kept for retry")
+                    break
+                batch, batch_segments = [], []
+        stats["depth"] = self.depth()
+        if segments:
+            logger.info(f"[Spool] Replay: {stats}")
+        return stats
+
+    def depth(self) -> dict:
+        """
+        Глибина spool-у: скільки сегментів і байтів ще не відправлено.
+        """
+        paths = glob.glob(os.path.join(self.directory, "*"))
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return {"segments": len(paths), "bytes": size}
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_spool() -> MetricSpool:
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = MetricSpool()
+    return _spool
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay spooled metric rows to Kusto.")
+    parser.add_argument("--depth", action="store_true", help="Only print spool depth")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    spool = get_spool()
+    if args.depth:
+        print(json.dumps(spool.depth()))
+        return 0
+    from .kusto_ingest import get_ingestor
+    ingestor = get_ingestor()
+    if ingestor is None:
+        return 1
+    stats = spool.replay(ingestor.ingest)
+    print(json.dumps(stats))
+    return 0 if stats["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
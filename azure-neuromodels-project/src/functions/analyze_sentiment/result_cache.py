@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_CACHE_ENABLED = os.environ.get("SENTIMENT_CACHE_ENABLED", "true").lower() == "true"
+SENTIMENT_CACHE_PATH = os.environ.get("SENTIMENT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "sentiment_cache.sqlite"))
+SENTIMENT_CACHE_SIZE = int(os.environ.get("SENTIMENT_CACHE_SIZE", "50000"))
+
+_SPACE_RE = re.compile(r"\s+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    return _SPACE_RE.sub(" ", (text or "").strip().lower())
+
+
+def content_key(kind: str, text: str, lang: str = "") -> str:
+    """
+    Ключ кешу: тип результату + мова + нормалізований текст.
+    Мова входить у ключ, бо sentiment і key phrases залежать від неї.
+    """
+    raw = f"{kind}|{lang or ''}|{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+# Як зберігати результат Text Analytics у кеші і як відновити об'єкт з тими ж атрибутами
+_SERIALIZERS = {
+    "language": (
+        lambda r: {"lang": r.primary_language.iso6391_name},
+        lambda v: SimpleNamespace(is_error=False, primary_language=SimpleNamespace(iso6391_name=v["lang"])),
+    ),
+    "sentiment": (
+        lambda r: {"sentiment": r.sentiment, "source": getattr(r, "source", "cloud")},
+        lambda v: SimpleNamespace(is_error=False, sentiment=v["sentiment"], source=v.get("source", "cloud")),
+    ),
+    "key_phrases": (
+        lambda r: {"key_phrases": list(r.key_phrases)},
+        lambda v: SimpleNamespace(is_error=False, key_phrases=v["key_phrases"]),
+    ),
+}
+
+
+class SqliteResultStore:
+    """
+    Локальне сховище результатів між запусками таймера (файл у tempdir воркера).
+    Обмежене за кількістю записів: витісняються ті, що найдовше не використовувались.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, last_used REAL)")
+        self._conn.commit()
+
+    def get_many(self, keys) -> dict:
+        keys = list(set(keys))
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # SQLite обмежує кількість параметрів у запиті
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for key, value in self._conn.execute(f"SELECT key, value FROM results WHERE key IN ({placeholders})", chunk):
+                    found[key] = json.loads(value)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE results SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def set_many(self, values: dict):
+        if not values:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (key, value, last_used) VALUES (?, ?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False), now) for key, value in values.items()],
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                evicted = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used ASC LIMIT ?)", (evicted,)
+                )
+                self.evictions += evicted
+            self._conn.commit()
+
+
+class ContentDeduper:
+    """
+    Прокладка перед викликами Text Analytics: однакові тексти в batch-і відправляються один раз,
+    а вже відомі результати беруться з кешу. Метрики рахуються на один запуск.
+    """
+
+    def __init__(self, store: SqliteResultStore = None):
+        self.store = store
+        self.metrics = {"documents": 0, "cache_hits": 0, "merged_duplicates": 0, "api_documents": 0}
+
+    async def through(self, kind: str, documents: list, call, variant: str = ""):
+        """
+        documents — [{"id", "text", "language"?}], call — batch-функція (напр. batcher.analyze_sentiment).
+        variant відокремлює результати різних бекендів (напр. локальної моделі) в кеші.
+        Повертає результати, вирівняні з documents (None — batch не вдався).
+        """
+        to_value, from_value = _SERIALIZERS[kind]
+        cache_kind = f"{kind}:{variant}" if variant else kind
+        keys = [content_key(cache_kind, doc["text"], doc.get("language", "")) for doc in documents]
+        # sqlite3 синхронний — у потоці, щоб не зупиняти паралельні batch-і на event loop
+        cached = await asyncio.to_thread(self.store.get_many, keys) if self.store else {}
+        results = [None] * len(documents)
+        unique = {}
+        for idx, (doc, key) in enumerate(zip(documents, keys)):
+            if key in cached:
+                results[idx] = from_value(cached[key])
+                self.metrics["cache_hits"] += 1
+            elif key in unique:
+                unique[key][1].append(idx)
+                self.metrics["merged_duplicates"] += 1
+            else:
+                unique[key] = (doc, [idx])
+        self.metrics["documents"] += len(documents)
+        self.metrics["api_documents"] += len(unique)
+        if not unique:
+            return results
+        responses = await call([doc for doc, _ in unique.values()])
+        to_store = {}
+        for (key, (_, indices)), response in zip(unique.items(), responses):
+            for idx in indices:
+                results[idx] = response
+            if response is not None and not response.is_error:
+                to_store[key] = to_value(response)
+        if self.store:
+            await asyncio.to_thread(self.store.set_many, to_store)
+        return results
+
+    def stats(self) -> dict:
+        # Text Analytics тарифікується за документ (text record), тому економію рахуємо в документах
+        saved = self.metrics["cache_hits"] + self.metrics["merged_duplicates"]
+        total = self.metrics["documents"]
+        return {
+            **self.metrics,
+            "api_calls_saved": saved,
+            "hit_rate": round(self.metrics["cache_hits"] / total, 3) if total else None,
+            "evictions": self.store.evictions if self.store else 0,
+        }
+
+
+_store = None
+
+
+def get_store():
+    """
+    Спільне для воркера сховище (None, якщо кеш вимкнено або файл недоступний).
+    """
+    global _store
+    if not SENTIMENT_CACHE_ENABLED:
+        return None
+    if _store is None:
+        try:
+            _store = SqliteResultStore(SENTIMENT_CACHE_PATH, SENTIMENT_CACHE_SIZE)
+        except Exception as e:
+            logger.error(f"[SentimentCache] Failed to open {SENTIMENT_CACHE_PATH}: {e}")
+            return None
+    return _store
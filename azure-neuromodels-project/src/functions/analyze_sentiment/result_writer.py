@@ -0,0 +1,94 @@
+import os
+import time
+import asyncio
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Поля meta, які пише конвеєр sentiment
+# sentiment_error — документ, який Text Analytics відхилив: вважається обробленим і більше не вибирається
+RESULT_FIELDS = ("sentiment", "sentiment_source", "sentiment_error", "lang", "key_phrases")
+MAX_TRANSACTIONAL_BATCH = 100
+PARTITION_KEY_FIELD = "user_id"
+# Паралельність одиночних patch (fallback, коли transactional batch не пройшов)
+RESULT_WRITE_CONCURRENCY = int(os.environ.get("SENTIMENT_WRITE_CONCURRENCY", "16"))
+
+
+def build_patch_operations(item: dict, meta_existed: bool = True) -> list:
+    """
+    Patch-операції лише для результатів аналізу замість перезапису всього документа.
+    Якщо в документі не було meta, ставимо /meta цілком (patch не створює батьківський шлях).
+    """
+    meta = item.get("meta") or {}
+    values = {field: meta[field] for field in RESULT_FIELDS if meta.get(field) is not None}
+    if not values:
+        return []
+    if not meta_existed:
+        return [{"op": "set", "path": "/meta", "value": values}]
+    return [{"op": "set", "path": f"/meta/{field}", "value": value} for field, value in values.items()]
+
+
+class ResultWriter:
+    """
+    Пише результати sentiment у Cosmos DB: transactional batch patch-ів на partition key
+    (до 100 операцій), з fallback на паралельні одиночні patch_item під семафором.
+    Рахує RU (через response_hook) і час запису.
+    """
+
+    def __init__(self, container, concurrency: int = RESULT_WRITE_CONCURRENCY):
+        self.container = container
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stats = {"written": 0, "failed": 0, "skipped": 0, "batches": 0, "request_charge": 0.0, "elapsed_ms": 0.0}
+        # Документи, чий результат не записано: їх буде вибрано повторно, тож метрики для них не відправляємо
+        self.failed_ids = set()
+
+    def _on_response(self, headers, *args):
+        try:
+            self.stats["request_charge"] += float(headers.get("x-ms-request-charge", 0))
+        except (TypeError, ValueError):
+            pass
+
+    async def write(self, items: list, missing_meta: set = frozenset()) -> dict:
+        started = time.perf_counter()
+        by_partition = defaultdict(list)
+        for item in items:
+            operations = build_patch_operations(item, item["id"] not in missing_meta)
+            if not operations:
+                self.stats["skipped"] += 1
+                continue
+            by_partition[item.get(PARTITION_KEY_FIELD)].append((item["id"], operations))
+        await asyncio.gather(*(
+            self._write_partition(pk, group[i:i + MAX_TRANSACTIONAL_BATCH])
+            for pk, group in by_partition.items()
+            for i in range(0, len(group), MAX_TRANSACTIONAL_BATCH)
+        ))
+        self.stats["request_charge"] = round(self.stats["request_charge"], 2)
+        self.stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"[Cosmos] Result writes: {self.stats}")
+        return self.stats
+
+    async def _write_partition(self, partition_key, patches: list):
+        if len(patches) > 1:
+            self.stats["batches"] += 1
+            try:
+                batch = [("patch", (item_id, operations)) for item_id, operations in patches]
+                await self.container.execute_item_batch(batch_operations=batch, partition_key=partition_key,
+                                                        response_hook=self._on_response)
+                self.stats["written"] += len(patches)
+                return
+            except Exception as e:
+                # Batch атомарний: якщо впав — пишемо по одному, щоб не втратити решту
+                logger.warning(f"[Cosmos] Patch batch failed for pk={partition_key}, falling back to single patches: {e}")
+        await asyncio.gather(*(self._patch_one(partition_key, item_id, operations) for item_id, operations in patches))
+
+    async def _patch_one(self, partition_key, item_id: str, operations: list):
+        async with self.semaphore:
+            try:
+                await self.container.patch_item(item=item_id, partition_key=partition_key, patch_operations=operations,
+                                                response_hook=self._on_response)
+                self.stats["written"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                self.failed_ids.add(item_id)
+                logger.error(f"[Cosmos] Failed to patch item id={item_id}: {e}")
@@ -0,0 +1,92 @@
+import os
+import time
+import logging
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+# "cloud" — Text Analytics; "local" — локальна модель; "local_first" — локальна модель,
+# невпевнені прогнози (та мови, крім uk/en) доуточнюються в Text Analytics
+SENTIMENT_BACKEND = os.environ.get("SENTIMENT_BACKEND", "cloud")
+SENTIMENT_LOCAL_MODEL_PATH = os.environ.get(
+    "SENTIMENT_LOCAL_MODEL_PATH", os.path.join(os.path.dirname(__file__), "models", "sentiment_local.npz")
+)
+SENTIMENT_LOCAL_MIN_CONFIDENCE = float(os.environ.get("SENTIMENT_LOCAL_MIN_CONFIDENCE", "0.75"))
+LOCAL_LANGUAGES = ("uk", "en")
+
+_model = None
+
+
+def get_local_model():
+    """
+    Лінива загрузка локальної моделі (numpy/scipy імпортуються лише тут).
+    None, якщо файлу моделі немає або завантаження не вдалося.
+    """
+    global _model
+    if _model is None:
+        if not os.path.exists(SENTIMENT_LOCAL_MODEL_PATH):
+            logger.warning(f"[LocalSentiment] Model file {SENTIMENT_LOCAL_MODEL_PATH} not found")
+            return None
+        try:
+            from .local_model import LocalSentimentModel
+            _model = LocalSentimentModel.load(SENTIMENT_LOCAL_MODEL_PATH)
+            logger.info(f"[LocalSentiment] Loaded model {SENTIMENT_LOCAL_MODEL_PATH}, labels={_model.labels}")
+        except Exception as e:
+            logger.error(f"[LocalSentiment] Failed to load model: {e}")
+            return None
+    return _model
+
+
+def _local_result(label: str, confidence: float):
+    return SimpleNamespace(is_error=False, sentiment=label, confidence=float(confidence), source="local")
+
+
+class SentimentBackend:
+    """
+    Спільний інтерфейс для batch-аналізу sentiment: analyze_sentiment(documents) -> результати,
+    вирівняні з documents (як у TextAnalyticsBatcher).
+    """
+
+    def __init__(self, mode: str, batcher, model=None, min_confidence: float = SENTIMENT_LOCAL_MIN_CONFIDENCE):
+        self.mode = mode
+        self.batcher = batcher
+        self.model = model
+        self.min_confidence = min_confidence
+        self.metrics = {"local": 0, "cloud": 0, "escalated": 0, "local_ms": 0.0}
+
+    async def analyze_sentiment(self, documents: list):
+        if self.mode == "cloud" or self.model is None:
+            self.metrics["cloud"] += len(documents)
+            return await self.batcher.analyze_sentiment(documents)
+        started = time.perf_counter()
+        labels, confidence = self.model.predict([doc["text"] for doc in documents])
+        self.metrics["local_ms"] += round((time.perf_counter() - started) * 1000, 1)
+        results = [_local_result(label, conf) for label, conf in zip(labels, confidence)]
+        if self.mode == "local":
+            self.metrics["local"] += len(documents)
+            return results
+        escalate = [
+            idx for idx, (doc, conf) in enumerate(zip(documents, confidence))
+            if conf < self.min_confidence or doc.get("language") not in LOCAL_LANGUAGES
+        ]
+        self.metrics["local"] += len(documents) - len(escalate)
+        if escalate:
+            self.metrics["escalated"] += len(escalate)
+            cloud_results = await self.batcher.analyze_sentiment([documents[idx] for idx in escalate])
+            for idx, result in zip(escalate, cloud_results):
+                # Якщо хмара не відповіла — лишаємо локальний прогноз, а не втрачаємо елемент
+                if result is not None:
+                    results[idx] = result
+        return results
+
+    def stats(self) -> dict:
+        return {"mode": self.mode if self.model is not None else "cloud", **self.metrics}
+
+
+def get_backend(batcher, mode: str = None) -> SentimentBackend:
+    mode = mode or SENTIMENT_BACKEND
+    if mode not in ("cloud", "local", "local_first"):
+        logger.warning(f"[LocalSentiment] Unknown SENTIMENT_BACKEND={mode}, using cloud")
+        mode = "cloud"
+    model = get_local_model() if mode != "cloud" else None
+    return SentimentBackend(mode, batcher, model)
@@ -0,0 +1,62 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class SentimentSettings:
+    """
+    Налаштування підключень аналізу тональності (Cosmos, Text Analytics, Kusto ingestion).
+    Читаються з оточення один раз на воркер через get_settings().
+    """
+    cosmos_endpoint: str
+    cosmos_key: str
+    cosmos_database: str
+    cosmos_container: str
+    text_analytics_endpoint: str
+    text_analytics_key: str
+    kusto_ingest_uri: str
+    kusto_db: str
+    kusto_table: str
+    kusto_client_id: str
+    kusto_client_secret: str
+    kusto_tenant_id: str
+
+    @classmethod
+    def from_env(cls) -> "SentimentSettings":
+        return cls(
+            cosmos_endpoint=os.environ.get("COSMOSDB_ENDPOINT", ""),
+            cosmos_key=os.environ.get("COSMOSDB_KEY", ""),
+            cosmos_database=os.environ.get("COSMOSDB_DATABASE", ""),
+            cosmos_container=os.environ.get("COSMOSDB_CONTAINER", ""),
+            text_analytics_endpoint=os.environ.get("TEXT_ANALYTICS_ENDPOINT", ""),
+            text_analytics_key=os.environ.get("TEXT_ANALYTICS_KEY", ""),
+            kusto_ingest_uri=os.environ.get("KUSTO_INGEST_URI", ""),
+            kusto_db=os.environ.get("KUSTO_DB", ""),
+            kusto_table=os.environ.get("KUSTO_TABLE", "DialogMetrics"),
+            kusto_client_id=os.environ.get("KUSTO_INGEST_CLIENT_ID", ""),
+            kusto_client_secret=os.environ.get("KUSTO_INGEST_CLIENT_SECRET", ""),
+            kusto_tenant_id=os.environ.get("KUSTO_INGEST_TENANT_ID", ""),
+        )
+
+    @property
+    def cosmos_configured(self) -> bool:
+        return all([self.cosmos_endpoint, self.cosmos_key, self.cosmos_database, self.cosmos_container])
+
+    @property
+    def text_analytics_configured(self) -> bool:
+        return bool(self.text_analytics_endpoint and self.text_analytics_key)
+
+    @property
+    def kusto_configured(self) -> bool:
+        return all([self.kusto_ingest_uri, self.kusto_db, self.kusto_table,
+                    self.kusto_client_id, self.kusto_client_secret, self.kusto_tenant_id])
+
+
+_settings = None
+
+
+def get_settings() -> SentimentSettings:
+    global _settings
+    if _settings is None:
+        _settings = SentimentSettings.from_env()
+    return _settings
@@ -0,0 +1,129 @@
+import os
+import random
+import asyncio
+import logging
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Per-request document limits of the Language service (synchronous API)
+DETECT_LANGUAGE_BATCH_SIZE = 1000
+SENTIMENT_BATCH_SIZE = 10
+KEY_PHRASES_BATCH_SIZE = 10
+# Скільки запитів до Text Analytics може бути в польоті одночасно (стеля для адаптивного ліміту)
+TEXT_ANALYTICS_CONCURRENCY = int(os.environ.get("TEXT_ANALYTICS_CONCURRENCY", "8"))
+TEXT_ANALYTICS_MAX_RETRIES = int(os.environ.get("TEXT_ANALYTICS_MAX_RETRIES", "4"))
+TEXT_ANALYTICS_BACKOFF_BASE_S = float(os.environ.get("TEXT_ANALYTICS_BACKOFF_BASE_S", "1"))
+# Після скількох успішних запитів поспіль піднімаємо ліміт на 1
+RECOVERY_SUCCESSES = 10
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _status_code(error):
+    return getattr(error, "status_code", None)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD-ліміт паралельності: на 429 ліміт зменшується вдвічі (мінімум 1),
+    після RECOVERY_SUCCESSES успішних запитів поспіль — збільшується на 1 до max_limit.
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= RECOVERY_SUCCESSES and self.limit < self.max_limit:
+            self.limit += 1
+            self._successes = 0
+
+    def on_throttled(self):
+        self._successes = 0
+        self.limit = max(1, self.limit // 2)
+
+
+class TextAnalyticsBatcher:
+    """
+    Планувальник batch-запитів до Text Analytics: ріже документи за лімітами сервісу,
+    відправляє всі batch-і одночасно під адаптивним лімітом паралельності,
+    повторює 429/5xx з backoff (з урахуванням Retry-After).
+    Результати повертаються вирівняними з вхідними документами; None — batch не вдався.
+    """
+
+    def __init__(self, client, max_concurrency: int = TEXT_ANALYTICS_CONCURRENCY):
+        self.client = client
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.metrics = {"requests": 0, "throttled": 0, "retries": 0, "failed_batches": 0, "documents": 0}
+
+    async def detect_language(self, documents):
+        return await self._run("detect_language", documents, DETECT_LANGUAGE_BATCH_SIZE)
+
+    async def analyze_sentiment(self, documents):
+        return await self._run("analyze_sentiment", documents, SENTIMENT_BATCH_SIZE)
+
+    async def extract_key_phrases(self, documents):
+        return await self._run("extract_key_phrases", documents, KEY_PHRASES_BATCH_SIZE)
+
+    async def _run(self, operation: str, documents, batch_size: int):
+        if not documents:
+            return []
+        batches = [documents[i:i + batch_size] for i in range(0, len(documents), batch_size)]
+        responses = await asyncio.gather(*(self._call(operation, batch) for batch in batches))
+        results = []
+        for batch, response in zip(batches, responses):
+            results.extend(response if response is not None else [None] * len(batch))
+        return results
+
+    async def _call(self, operation: str, batch):
+        method = getattr(self.client, operation)
+        for attempt in range(TEXT_ANALYTICS_MAX_RETRIES + 1):
+            await self.limiter.acquire()
+            try:
+                self.metrics["requests"] += 1
+                response = await method(documents=batch)
+                self.limiter.on_success()
+                self.metrics["documents"] += len(batch)
+                return list(response)
+            except Exception as e:
+                status = _status_code(e)
+                if status == 429:
+                    self.metrics["throttled"] += 1
+                    self.limiter.on_throttled()
+                if status not in RETRY_STATUSES or attempt == TEXT_ANALYTICS_MAX_RETRIES:
+                    self.metrics["failed_batches"] += 1
+                    logger.error(f"[TextAnalytics] {operation} failed for batch {[d['id'] for d in batch]}: {e}\n{traceback.format_exc()}")
+                    return None
+                delay = _retry_after(e) or random.uniform(0, TEXT_ANALYTICS_BACKOFF_BASE_S * (2 ** attempt))
+                logger.warning(f"[TextAnalytics] {operation} got {status}, retry in {delay:.2f}s (limit={self.limiter.limit})")
+            finally:
+                await self.limiter.release()
+            self.metrics["retries"] += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {**self.metrics, "concurrency_limit": self.limiter.limit}
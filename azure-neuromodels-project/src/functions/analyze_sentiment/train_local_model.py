@@ -0,0 +1,110 @@
+"""
+Тренує локальну модель sentiment (local_model.py) на повідомленнях, які вже розмічені Text Analytics.
+
+Запуск з каталогу src/functions (змінні COSMOSDB_* як для функції; потрібні numpy, scipy, scikit-learn):
+    python -m analyze_sentiment.train_local_model [--max-items N] [--output PATH]
+    python -m analyze_sentiment.train_local_model --input labeled.jsonl    # {"text": ..., "label": ..., "lang": ...}
+"""
+import os
+import sys
+import json
+import random
+import asyncio
+import logging
+import argparse
+import numpy as np
+from .local_model import DEFAULT_N_FEATURES, LocalSentimentModel, vectorize
+from .sentiment_backend import LOCAL_LANGUAGES, SENTIMENT_LOCAL_MODEL_PATH
+from .settings import get_settings
+
+
+async def load_from_cosmos(max_items: int) -> list:
+    from azure.cosmos.aio import CosmosClient
+    # Лише хмарні мітки: прогнози самої локальної моделі в навчання не потрапляють
+    query = (
+        "SELECT TOP @top c.content, c.meta.sentiment, c.meta.lang FROM c "
+        "WHERE (c.step = 'question' OR c.step = 'answer') AND IS_DEFINED(c.meta.sentiment) AND c.meta.sentiment != null "
+        "AND (NOT IS_DEFINED(c.meta.sentiment_source) OR c.meta.sentiment_source = 'cloud')"
+    )
+    params = [{"name": "@top", "value": max_items}]
+    settings = get_settings()
+    async with CosmosClient(settings.cosmos_endpoint, settings.cosmos_key) as client:
+        container = client.get_database_client(settings.cosmos_database).get_container_client(settings.cosmos_container)
+        return [
+            {"text": row.get("content"), "label": row.get("sentiment"), "lang": row.get("lang")}
+            async for row in container.query_items(query, parameters=params)
+        ]
+
+
+def load_from_jsonl(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def train(rows: list, n_features: int = DEFAULT_N_FEATURES, test_share: float = 0.2, c: float = 4.0, seed: int = 42):
+    from sklearn.linear_model import LogisticRegression
+    rows = [r for r in rows if r.get("text") and r.get("label") and (r.get("lang") or "uk") in LOCAL_LANGUAGES]
+    random.Random(seed).shuffle(rows)
+    split = int(len(rows) * (1 - test_share))
+    train_rows, test_rows = rows[:split], rows[split:]
+    labels = sorted({r["label"] for r in train_rows})
+    label_index = {label: i for i, label in enumerate(labels)}
+    x_train = vectorize([r["text"] for r in train_rows], n_features)
+    y_train = np.array([label_index[r["label"]] for r in train_rows])
+    classifier = LogisticRegression(C=c, max_iter=1000, multi_class="multinomial", solver="lbfgs")
+    classifier.fit(x_train, y_train)
+    # coef_ для двох класів має форму (1, n_features) — розгортаємо у дві колонки
+    coef, intercept = classifier.coef_, classifier.intercept_
+    if len(labels) == 2:
+        coef, intercept = np.vstack([-coef, coef]) / 2, np.array([-intercept[0], intercept[0]]) / 2
+    model = LocalSentimentModel(coef.T, intercept, labels, n_features)
+    report = evaluate(model, test_rows)
+    report.update({"train_size": len(train_rows), "labels": labels})
+    return model, report
+
+
+def evaluate(model: LocalSentimentModel, rows: list) -> dict:
+    """
+    Згода локальної моделі з хмарними мітками (accuracy) загалом і по мовах.
+    """
+    if not rows:
+        return {"test_size": 0, "agreement": None}
+    predicted, confidence = model.predict([r["text"] for r in rows])
+    hits = [p == r["label"] for p, r in zip(predicted, rows)]
+    by_lang = {}
+    for hit, r in zip(hits, rows):
+        by_lang.setdefault(r.get("lang") or "uk", []).append(hit)
+    return {
+        "test_size": len(rows),
+        "agreement": round(sum(hits) / len(hits), 4),
+        "agreement_by_lang": {lang: round(sum(v) / len(v), 4) for lang, v in by_lang.items()},
+        "mean_confidence": round(float(np.mean(confidence)), 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the local sentiment model from messages labeled by Text Analytics.")
+    parser.add_argument("--input", help="JSONL with text/label/lang instead of reading Cosmos DB")
+    parser.add_argument("--max-items", type=int, default=50000, help="Labeled messages to read from Cosmos DB")
+    parser.add_argument("--output", default=SENTIMENT_LOCAL_MODEL_PATH, help="Where to save the .npz model")
+    parser.add_argument("--features", type=int, default=DEFAULT_N_FEATURES, help="Hashed feature space size")
+    parser.add_argument("--test-share", type=float, default=0.2)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    rows = load_from_jsonl(args.input) if args.input else asyncio.run(load_from_cosmos(args.max_items))
+    logging.info(f"[Train] Loaded {len(rows)} labeled messages")
+    if not rows:
+        logging.error("[Train] Nothing to train on")
+        return 1
+    model, report = train(rows, args.features, args.test_share)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    model.save(args.output)
+    with open(os.path.splitext(args.output)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logging.info(f"[Train] Saved {args.output}: {report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
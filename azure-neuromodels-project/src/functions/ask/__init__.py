@@ -1,131 +1,250 @@
 import os
 import logging
+import time
+import datetime
 import azure.functions as func
-import requests
 import json
+import hashlib
 from typing import List
-import openai
 import uuid
 import asyncio
 import traceback
-from azure.cosmos.aio import CosmosClient
-from azure.cosmos.exceptions import CosmosResourceExistsError, CosmosHttpResponseError
+from . import cosmos_pool
+from . import event_sink
+from . import history_store
+from . import answer_cache
+from . import search_client
+from . import local_index
+from . import admission
+from . import prompt_builder
+from .tracing import Trace
+from .settings import get_settings
 
-async def get_last_user_history(user_id: str, limit: int = 5):
+
+NOT_FOUND_ANSWER = "Нічого не знайдено."
+
+PROMPT_HEADER = (
+    "You are Servantus, a helpful assistant at the 'CoolAir Air Conditioner Store'.\n"
+    "Always use both the provided knowledge base and the dialog history to answer the customer's question as helpfully and contextually as possible.\n"
+    "If the dialog history contains relevant information, you must use it in your answer. If the knowledge base contains relevant information, you must use it in your answer.\n"
+    "If neither the dialog history nor the knowledge base are relevant to the question, politely redirect the conversation to topics related to air conditioners, climate, or store services.\n"
+    "Respond in the same language as the question.\n\n"
+)
+# Зміна шаблону промпта або бюджетів токенів інвалідовує кеш відповідей
+PROMPT_TEMPLATE_HASH = hashlib.sha256((PROMPT_HEADER + prompt_builder.budget_signature()).encode("utf-8")).hexdigest()[:16]
+
+async def get_user_dialog_state(user_id: str, limit: int = 5) -> dict:
     """
-    Повертає останні 5 пар (question, answer) для user_id, впорядковані за часом.
+    Повертає стан діалогу користувача: останні limit пар (question, answer) від найновішої
+    і rolling summary старіших пар.
+    Читає компактний документ історії користувача одним point read; якщо його ще немає
+    (користувач не пройшов backfill), робить обмежений запит по подіях у партиції користувача.
     """
     try:
-        endpoint = os.environ.get("COSMOSDB_ENDPOINT")
-        key = os.environ.get("COSMOSDB_KEY")
-        database_name = os.environ.get("COSMOSDB_DATABASE")
-        container_name = os.environ.get("COSMOSDB_CONTAINER")
-        if not all([endpoint, key, database_name, container_name]):
-            return []
-        async with CosmosClient(endpoint, key) as client:
-            db = client.get_database_client(database_name)
-            container = db.get_container_client(container_name)
-            # Вибираємо останні 50 подій для user_id (щоб знайти пари question-answer)
-            query = f"SELECT * FROM c WHERE c.user_id=@user_id AND (c.step='question' OR c.step='answer') ORDER BY c._ts DESC"
-            params = [{"name": "@user_id", "value": user_id}]
-            items = [item async for item in container.query_items(query, parameters=params)]
-            # Сортуємо за часом, групуємо по dialog_id, але дозволяємо брати пари з різних dialog_id
-            questions = [i for i in items if i.get("step") == "question"]
-            answers = [i for i in items if i.get("step") == "answer"]
-            # Беремо останні N питань і для кожного шукаємо найближчу відповідь за dialog_id
-            history = []
-            for q in questions:
-                # Знаходимо відповідь з таким же dialog_id
-                a = next((a for a in answers if a.get("dialog_id") == q.get("dialog_id")), None)
-                if a:
-                    history.append((q["content"], a["content"]))
-                if len(history) >= limit:
-                    break
-            return history
+        container = await cosmos_pool.get_container()
+        if container is None:
+            return {"history": [], "summary": ""}
+        doc = await history_store.read_history_doc(container, user_id)
+        if doc is None:
+            query = "SELECT TOP @top * FROM c WHERE c.user_id=@user_id AND (c.step='question' OR c.step='answer') ORDER BY c._ts DESC"
+            params = [{"name": "@user_id", "value": user_id}, {"name": "@top", "value": limit * 4}]
+            items = [item async for item in container.query_items(query, parameters=params, partition_key=user_id)]
+            doc = {"turns": history_store.build_turns(items, limit=limit)}
+        turns = doc.get("turns", [])
+        return {
+            "history": [(t["question"], t["answer"]) for t in reversed(turns[-limit:])],
+            "summary": doc.get("summary", ""),
+        }
     except Exception as e:
         logging.error(f"[CosmosDB] Failed to get user history: {e}")
-        return []
+        await cosmos_pool.invalidate(e)
+        return {"history": [], "summary": ""}
 
-async def save_event(event: dict):
+async def get_last_user_history(user_id: str, limit: int = 5):
     """
-    Асинхронно зберігає подію у Cosmos DB. Fail-safe: логування помилок, не кидає виключення.
-    Автоматично генерує id, якщо не вказано.
+    Повертає останні 5 пар (question, answer) для user_id, від найновішої.
+    """
+    return (await get_user_dialog_state(user_id, limit))["history"]
+
+async def append_user_history(user_id: str, dialog_id: str, question: str, answer: str):
+    """
+    Інкрементально оновлює документ історії користувача після збереження відповіді.
+    Пари, що вже не вміщаються в бюджет історії промпта, згортаються в rolling summary,
+    коли їх накопичилось досить (prompt_builder.summary_due).
+    Fail-safe: логування помилок, не кидає виключення.
     """
     try:
-        endpoint = os.environ.get("COSMOSDB_ENDPOINT")
-        key = os.environ.get("COSMOSDB_KEY")
-        database_name = os.environ.get("COSMOSDB_DATABASE")
-        container_name = os.environ.get("COSMOSDB_CONTAINER")
-        logging.info(f"[CosmosDB] endpoint={endpoint}, key={'set' if key else 'MISSING'}, db={database_name}, container={container_name}")
-        if not all([endpoint, key, database_name, container_name]):
-            logging.error(f"[CosmosDB] One or more Cosmos DB environment variables are missing!")
+        container = await cosmos_pool.get_container()
+        if container is None:
             return
-        if "id" not in event:
-            event["id"] = str(uuid.uuid4())
-        logging.info(f"[CosmosDB] Saving event: {json.dumps(event, ensure_ascii=False)[:500]}")
-        async with CosmosClient(endpoint, key) as client:
-            db = client.get_database_client(database_name)
-            container = db.get_container_client(container_name)
-            await container.create_item(event)
-        logging.info("[CosmosDB] Event saved successfully.")
+        doc = await history_store.append_turn(container, user_id, history_store.make_turn(dialog_id, question, answer))
+        turns = doc.get("turns", []) if doc else []
+        overflow = prompt_builder.history_overflow(turns)
+        if prompt_builder.summary_due(overflow, doc_full=len(turns) >= history_store.HISTORY_MAX_TURNS):
+            try:
+                summary = await summarize_history(doc.get("summary", ""), overflow)
+            except (admission.Overloaded, asyncio.TimeoutError) as e:
+                # Пари лишаються в документі — згорнемо після наступної відповіді
+                logging.warning(f"[History] Summary deferred for user_id={user_id}: {e or 'timeout'}")
+                return
+            if summary:
+                await history_store.fold_into_summary(container, user_id, overflow, summary)
+                logging.info(f"[History] Folded {len(overflow)} turns into summary for user_id={user_id}")
+    except Exception as e:
+        logging.error(f"[History] Failed to update user history: {e}")
+        await cosmos_pool.invalidate(e)
+
+_background_tasks = set()
+
+def run_in_background(coro):
+    """
+    Запускає корутину поза шляхом відповіді; тримаємо посилання, щоб задачу не зібрав GC.
+    """
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def save_event(event: dict) -> bool:
+    """
+    Ставить подію в write-behind буфер, який пише у Cosmos DB batch-ами у фоні.
+    Fail-safe: логування помилок, не кидає виключення.
+    Автоматично генерує id, якщо не вказано.
+    """
+    try:
+        return await event_sink.get_sink().put(event)
     except Exception as e:
-        logging.error(f"[CosmosDB] Failed to save event: {e}")
+        logging.error(f"[CosmosDB] Failed to enqueue event: {e}")
         logging.error(traceback.format_exc())
         # Fail-safe: не кидаємо далі
+        return False
 
-def get_search_results(question: str, previous_qa: str = "") -> dict:
+async def get_search_results(question: str, previous_qa: str = "") -> dict:
     """
     Виконує пошук у базі знань. Якщо передано previous_qa, додає його до пошукового запиту.
     """
-    endpoint = os.environ["SEARCH_SERVICE_ENDPOINT"]
-    api_key = os.environ["SEARCH_API_KEY"]
-    index_name = os.environ["SEARCH_INDEX_NAME"]
-    url = f"{endpoint}/indexes/{index_name}/docs/search?api-version=2023-07-01-Preview"
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": api_key
-    }
     if previous_qa:
         search_query = f"Previous dialog: {previous_qa}. Current question: {question}"
     else:
         search_query = question
-    payload = {
-        "search": search_query,
-        "top": 3
-    }
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    return response.json()
+    # Спершу локальний BM25-індекс бази знань; пошуковий сервіс — fallback, якщо індексу немає або збігів замало.
+    # Службові слова шаблону ("Previous dialog", "Current question") у BM25 лише зсувають score
+    if local_index.SEARCH_BACKEND != "remote":
+        result = local_index.search(f"{previous_qa} {question}" if previous_qa else question)
+        if result is not None or local_index.SEARCH_BACKEND == "local":
+            return result or {"value": []}
+    # Однакові одночасні запити до сервісу пошуку діляться одним викликом
+    return await admission.search_flight.do(search_query, lambda: remote_search(search_query))
+
+async def remote_search(search_query: str) -> dict:
+    try:
+        return await search_client.get_client().search(search_query)
+    except Exception as e:
+        if is_rate_limited(e):
+            admission.get_controller().on_throttled()
+        raise
+
+_openai_client = None
 
-def ask_llm(question: str, user_history: str = "", kb_context: str = "") -> str:
+def get_openai_client() -> "openai.AsyncOpenAI":
     """
-    Формує промпт для LLM з окремих компонентів: історія діалогів, знання, питання.
-    user_history: стисла історія діалогів (може бути порожньою)
-    kb_context: релевантні знання з бази (може бути порожнім)
+    Лінивий асинхронний клієнт OpenAI, спільний для всіх викликів на воркері.
+    SDK імпортується тут, а не на старті: відповіді з кешу і холодний старт його не потребують.
     """
-    client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    global _openai_client
+    if _openai_client is None:
+        import openai
+        _openai_client = openai.AsyncOpenAI(api_key=get_settings().openai_api_key, timeout=get_settings().llm_timeout_s)
+    return _openai_client
+
+def is_rate_limited(error: Exception) -> bool:
+    # openai.RateLimitError і SearchError несуть HTTP-статус; так не треба імпортувати SDK заради except
+    return getattr(error, "status_code", None) == 429 or getattr(error, "status", None) == 429
+
+async def ask_llm(prompt: str) -> str:
+    """
+    Повертає повну відповідь LLM (блокуючий режим). Однакові промпти, що генеруються одночасно,
+    отримують одну спільну відповідь.
+    """
+    key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return await admission.llm_flight.do(key, lambda: _ask_llm(prompt))
+
+async def _ask_llm(prompt: str) -> str:
+    return await complete(prompt, max_tokens=256, temperature=0.2)
+
+async def complete(prompt: str, max_tokens: int, temperature: float) -> str:
+    """
+    Один виклик gpt-4o-mini: 429 і латентність віддаються контролеру admission (AIMD-ліміт).
+    """
+    client = get_openai_client()
+    controller = admission.get_controller()
+    started = time.perf_counter()
+    try:
+        response = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+    except Exception as e:
+        if is_rate_limited(e):
+            controller.on_throttled()
+        raise
+    controller.on_latency((time.perf_counter() - started) * 1000)
+    return response.choices[0].message.content.strip()
+
+async def summarize_history(previous_summary: str, turns: List[dict]) -> str:
+    """
+    Згортає старі пари діалогу (разом з попереднім summary) у короткий rolling summary.
+    Фоновий виклик займає місце в admission, як і запит ask, і обмежений ASK_SUMMARY_TIMEOUT_S.
+    """
+    dialog = prompt_builder.TURN_SEPARATOR.join(prompt_builder.format_turn(t["question"], t["answer"]) for t in turns)
     prompt = (
-        "You are Servantus, a helpful assistant at the 'CoolAir Air Conditioner Store'.\n"
-        "Always use both the provided knowledge base and the dialog history to answer the customer's question as helpfully and contextually as possible.\n"
-        "If the dialog history contains relevant information, you must use it in your answer. If the knowledge base contains relevant information, you must use it in your answer.\n"
-        "If neither the dialog history nor the knowledge base are relevant to the question, politely redirect the conversation to topics related to air conditioners, climate, or store services.\n"
-        "Respond in the same language as the question.\n\n"
-    )
-    if user_history:
-        prompt += "[Dialog history]\n" + user_history.strip() + "\n\n"
-    if kb_context:
-        prompt += "[Knowledge base]\n" + kb_context.strip() + "\n\n"
-    prompt += f"Customer question: {question}\nServantus's answer:"
-    logging.info(f"[LLM prompt] {prompt}...")
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=256,
-        temperature=0.2,
+        "Summarize the conversation between a customer and Servantus, an assistant at the 'CoolAir Air Conditioner Store'.\n"
+        "Keep facts that may matter for future questions: the customer's needs, chosen models, prices, promises made.\n"
+        "Write at most 5 short sentences in the language of the conversation.\n\n"
     )
-    return response.choices[0].message.content.strip()
+    if previous_summary:
+        prompt += "[Previous summary]\n" + previous_summary.strip() + "\n\n"
+    prompt += "[Conversation]\n" + dialog + "\n\nSummary:"
+    controller = admission.get_controller()
+    await controller.acquire()
+    try:
+        return await asyncio.wait_for(
+            complete(prompt, max_tokens=prompt_builder.SUMMARY_TOKEN_BUDGET, temperature=0.0),
+            get_settings().summary_timeout_s,
+        )
+    finally:
+        await controller.release()
+
+async def with_timeout(coro, timeout: float, stage: str, default=None):
+    """
+    Виконує корутину з таймаутом етапу. Якщо default не None, при таймауті повертає його
+    замість виключення (для етапів, без яких відповідь все одно можна сформувати).
+    """
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        logging.warning(f"[Timeout] Stage '{stage}' exceeded {timeout}s")
+        if default is not None:
+            return default
+        raise
+
+def make_event(dialog_id: str, step: str, user_id: str, content: str, source=None, score=None, latency_ms=None) -> dict:
+    return {
+        "dialog_id": dialog_id,
+        "step": step,
+        "user_id": user_id,
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "content": content,
+        "meta": {
+            "source": source,
+            "score": score,
+            "latency_ms": latency_ms
+        }
+    }
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request.')
     try:
         req_body = req.get_json()
@@ -139,102 +258,219 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse(
             "Missing 'user_id' or 'question' in request.", status_code=400
         )
+    dialog_id = req_body.get("dialog_id") or str(uuid.uuid4())
+
+    # Admission control: понад адаптивний ліміт запит чекає в черзі, після дедлайну — швидкий 503
+    trace = Trace()
+    controller = admission.get_controller()
     try:
-        import datetime
-        dialog_id = req_body.get("dialog_id") or str(uuid.uuid4())
-        # 1. Зберігаємо подію question
-        event_question = {
-            "dialog_id": dialog_id,
-            "step": "question",
-            "user_id": user_id,
-            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
-            "content": question,
-            "meta": {
-                "source": None,
-                "score": None,
-                "latency_ms": None
-            }
-        }
-        logging.info("[CosmosDB] Calling save_event for question...")
-        asyncio.run(save_event(event_question))
-
-        # 2. Додаємо історію користувача до контексту
-        user_history = asyncio.run(get_last_user_history(user_id, limit=5))
-        history_text = ""
-        previous_qa = ""
-        if user_history:
-            history_text = "\n\n---\n\n".join([
-                f"User: {q}\nServantus: {a}" for q, a in reversed(user_history)
-            ])
-            # Беремо останню пару (question, answer) для пошукового запиту
-            last_qa = user_history[-1]  # (q, a)
-            previous_qa = f"{last_qa[0]} {last_qa[1]}"
-
-        # 3. Пошук у базі знань з урахуванням попереднього діалогу
-        search_results = get_search_results(question, previous_qa=previous_qa)
-        docs = search_results.get("value", [])
-        if not docs:
+        with trace.stage("admission"):
+            await controller.acquire()
+    except admission.Overloaded as e:
+        return func.HttpResponse(
+            json.dumps({"error": "Service is overloaded, please retry later.", "retry_after_s": e.retry_after}),
+            status_code=503,
+            mimetype="application/json",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    try:
+        return await handle_question(user_id, question, dialog_id, trace=trace)
+    finally:
+        await controller.release()
+
+
+async def retrieve_context(user_id: str, question: str, dialog_id: str, trace: Trace = None,
+                           with_history: bool = True, events: list = None):
+    """
+    Спільна частина обох режимів: зберігає питання, читає історію, шукає в базі знань.
+    Незалежні етапи (збереження питання, історія, перший пошук) виконуються одночасно,
+    тож критичний шлях ≈ історія + пошук, а не сума всіх запитів.
+    with_history=False — без історії користувача (bulk); якщо передано events, події
+    складаються туди для пакетного запису замість write-behind буфера.
+    Повертає None, якщо в базі знань нічого не знайдено.
+    """
+    trace = trace or Trace()
+    settings = get_settings()
+
+    async def emit(event: dict):
+        if events is not None:
+            events.append(event)
+            return
+        logging.info(f"[CosmosDB] Calling save_event for {event['step']}...")
+        # Лише постановка в чергу сінку; сам запис у Cosmos DB міряє event_sink (meta.event_sink)
+        with trace.stage("cosmos_enqueue", accumulate=True):
+            await save_event(event)
+
+    # 1. Ставимо подію question у буфер, паралельно читаємо історію і робимо пошук лише за питанням
+    await emit(make_event(dialog_id, "question", user_id, question))
+    if with_history:
+        history_task = asyncio.ensure_future(trace.timed(
+            "history",
+            with_timeout(get_user_dialog_state(user_id, limit=5), settings.history_timeout_s, "history", default={"history": [], "summary": ""})
+        ))
+    plain_search_task = asyncio.ensure_future(trace.timed(
+        "search", with_timeout(get_search_results(question), settings.search_timeout_s, "search")
+    ))
+
+    # 2. Додаємо історію користувача до контексту
+    dialog_state = await history_task if with_history else {"history": [], "summary": ""}
+    user_history = dialog_state["history"]
+    # Текст історії (summary + пари) — лише для оцінки, чи історія змінює промпт для кешу
+    history_text = "\n".join([dialog_state["summary"]] + [f"{q}\n{a}" for q, a in user_history]).strip()
+    previous_qa = ""
+    if user_history:
+        # Беремо останню пару (question, answer) для пошукового запиту
+        last_qa = user_history[-1]  # (q, a)
+        previous_qa = f"{last_qa[0]} {last_qa[1]}"
+
+    # 3. Пошук у базі знань з урахуванням попереднього діалогу.
+    # Без історії використовуємо вже запущений пошук; якщо контекстний пошук впав —
+    # відкочуємось на результат пошуку лише за питанням.
+    if previous_qa:
+        try:
+            search_results = await trace.timed("search", with_timeout(
+                get_search_results(question, previous_qa=previous_qa), settings.search_timeout_s, "search_with_history"
+            ))
+            plain_search_task.cancel()
+        except Exception as e:
+            logging.warning(f"[Search] Search with history failed, using plain search: {e}")
+            search_results = await plain_search_task
+    else:
+        search_results = await plain_search_task
+    docs = search_results.get("value", [])
+    if not docs:
+        return None
+    if search_results.get("@search.backend") == "local":
+        # Локальний індекс уже відібрав top-N за нормованим порогом
+        relevant_docs = docs
+    else:
+        # Вибираємо всі документи з score >= 80% від максимального
+        max_score = max(doc.get("@search.score", 0) for doc in docs)
+        threshold = max_score * 0.8
+        relevant_docs = [doc for doc in docs if doc.get("@search.score", 0) >= threshold]
+
+    # 4. Зберігаємо події search_result для кожного документа (запис у фоні)
+    for doc in relevant_docs:
+        await emit(make_event(
+            dialog_id, "search_result", user_id, doc.get("content", ""),
+            source=doc.get("source") or doc.get("metadata_storage_path"),
+            score=doc.get("@search.score"),
+            latency_ms=trace.stages_ms.get("search"),
+        ))
+
+    # 5. Формуємо промпт у межах бюджету токенів
+    kb_context = "\n\n---\n\n".join(doc.get("content", "") for doc in relevant_docs)
+    source_urls = [doc.get("source", "") or doc.get("metadata_storage_path", "") for doc in relevant_docs if doc.get("source", "") or doc.get("metadata_storage_path", "")]
+    prompt = prompt_builder.build(PROMPT_HEADER, question, user_history, dialog_state["summary"], relevant_docs)
+    return {
+        "history_text": history_text,
+        "relevant_docs": relevant_docs,
+        "prompt": prompt,
+        "trace": trace,
+        "source_urls": source_urls,
+        "snippet": kb_context,
+    }
+
+
+async def lookup_cached_answer(question: str, context: dict):
+    """
+    Шукає відповідь у кеші. Повертає (key, answer): key=None, якщо кеш пропускаємо
+    (вимкнений або історія діалогу суттєво змінює промпт), answer=None при промаху.
+    """
+    cache = answer_cache.get_cache()
+    if cache is None:
+        return None, None
+    if answer_cache.history_is_material(question, context["history_text"]):
+        cache.skip()
+        return None, None
+    key = answer_cache.make_key(question, context["relevant_docs"], PROMPT_TEMPLATE_HASH)
+    cached = await cache.get(key)
+    logging.info(f"[AnswerCache] {'hit' if cached else 'miss'} stats={cache.stats()}")
+    return key, cached["answer"] if cached else None
+
+
+async def store_cached_answer(key: str, answer: str):
+    cache = answer_cache.get_cache()
+    if key is None or cache is None or not answer:
+        return
+    await cache.set(key, {"answer": answer})
+
+
+def make_answer_event(user_id: str, dialog_id: str, answer: str, ttft_ms: float,
+                      cache_hit: bool = False, prompt_tokens: dict = None, trace: Trace = None) -> dict:
+    """
+    Подія answer з часом до першого токена і часом етапів.
+    latency_ms — загальний час запиту, meta.stages_ms — розбивка по етапах.
+    """
+    stages_ms = trace.snapshot() if trace else {}
+    event_answer = make_event(dialog_id, "answer", user_id, answer, latency_ms=stages_ms.get("total"))
+    event_answer["meta"]["stages_ms"] = stages_ms
+    event_answer["meta"]["ttft_ms"] = round(ttft_ms, 1) if ttft_ms is not None else None
+    event_answer["meta"]["cache_hit"] = cache_hit
+    event_answer["meta"]["prompt_tokens"] = prompt_tokens
+    event_answer["meta"]["admission"] = admission.get_controller().report()
+    event_answer["meta"]["event_sink"] = event_sink.get_sink().report()
+    return event_answer
+
+
+async def save_answer(user_id: str, dialog_id: str, question: str, answer: str, ttft_ms: float,
+                      cache_hit: bool = False, prompt_tokens: dict = None, trace: Trace = None):
+    """
+    Зберігає подію answer і оновлює історію користувача.
+    """
+    event_answer = make_answer_event(user_id, dialog_id, answer, ttft_ms, cache_hit, prompt_tokens, trace)
+    logging.info("[CosmosDB] Calling save_event for answer...")
+    await save_event(event_answer)
+    if trace:
+        trace.log(dialog_id)
+    run_in_background(append_user_history(user_id, dialog_id, question, answer))
+
+
+async def handle_question(user_id: str, question: str, dialog_id: str, trace: Trace = None) -> func.HttpResponse:
+    """
+    Блокуючий режим: повертає відповідь цілком після завершення генерації LLM.
+    """
+    try:
+        context = await retrieve_context(user_id, question, dialog_id, trace)
+        if context is None:
             return func.HttpResponse(
                 json.dumps({
-                    "answer": "Нічого не знайдено.",
+                    "answer": NOT_FOUND_ANSWER,
                     "source_documents": [],
                     "search_snippet": ""
                 }),
                 mimetype="application/json"
             )
-        # Вибираємо всі документи з score >= 80% від максимального
-        max_score = max(doc.get("@search.score", 0) for doc in docs)
-        threshold = max_score * 0.8
-        relevant_docs = [doc for doc in docs if doc.get("@search.score", 0) >= threshold]
 
-        # 4. Зберігаємо події search_result для кожного документа
-        for doc in relevant_docs:
-            event_search = {
-                "dialog_id": dialog_id,
-                "step": "search_result",
-                "user_id": user_id,
-                "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
-                "content": doc.get("content", ""),
-                "meta": {
-                    "source": doc.get("source") or doc.get("metadata_storage_path"),
-                    "score": doc.get("@search.score"),
-                    "latency_ms": None
-                }
-            }
-            logging.info("[CosmosDB] Calling save_event for search_result...")
-            asyncio.run(save_event(event_search))
-
-        # 5. Формуємо компоненти для промпта
-        kb_context = "\n\n---\n\n".join(doc.get("content", "") for doc in relevant_docs)
-        source_urls = [doc.get("source", "") or doc.get("metadata_storage_path", "") for doc in relevant_docs if doc.get("source", "") or doc.get("metadata_storage_path", "")]
-        snippet = kb_context
-
-        user_answer = ask_llm(question, user_history=history_text, kb_context=kb_context)
+        started = time.perf_counter()
+        cache_key, user_answer = await lookup_cached_answer(question, context)
+        cache_hit = user_answer is not None
+        if not cache_hit:
+            with context["trace"].stage("llm"):
+                user_answer = await with_timeout(
+                    ask_llm(context["prompt"].text), get_settings().llm_timeout_s, "llm"
+                )
+            await store_cached_answer(cache_key, user_answer)
+        # У блокуючому режимі перший токен користувач бачить разом з останнім
+        ttft_ms = (time.perf_counter() - started) * 1000
+        logging.info(f"[LLM] mode=blocking ttft_ms={ttft_ms:.0f} cache_hit={cache_hit}")
 
         # 6. Зберігаємо подію answer
-        event_answer = {
-            "dialog_id": dialog_id,
-            "step": "answer",
-            "user_id": user_id,
-            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
-            "content": user_answer,
-            "meta": {
-                "source": None,
-                "score": None,
-                "latency_ms": None
-            }
-        }
-        logging.info("[CosmosDB] Calling save_event for answer...")
-        asyncio.run(save_event(event_answer))
+        await save_answer(user_id, dialog_id, question, user_answer, ttft_ms, cache_hit=cache_hit,
+                          prompt_tokens=context["prompt"].section_tokens, trace=context["trace"])
 
         return func.HttpResponse(
             json.dumps({
                 "answer": user_answer,
-                "source_documents": source_urls,
-                "search_snippet": snippet
+                "source_documents": context["source_urls"],
+                "search_snippet": context["snippet"]
             }),
             mimetype="application/json"
         )
+    except asyncio.TimeoutError:
+        return func.HttpResponse(
+            "Error: upstream timeout", status_code=504
+        )
     except Exception as e:
         logging.error(f"Error: {e}")
         return func.HttpResponse(
@@ -0,0 +1,181 @@
+import os
+import math
+import asyncio
+import logging
+from .metrics import LatencyHistogram
+
+ASK_ADMISSION_ENABLED = os.environ.get("ASK_ADMISSION_ENABLED", "true").lower() == "true"
+# Межі адаптивного ліміту одночасних запитів ask на воркер
+ASK_ADMISSION_MIN_LIMIT = int(os.environ.get("ASK_ADMISSION_MIN_LIMIT", "2"))
+ASK_ADMISSION_MAX_LIMIT = int(os.environ.get("ASK_ADMISSION_MAX_LIMIT", "64"))
+ASK_ADMISSION_INITIAL_LIMIT = int(os.environ.get("ASK_ADMISSION_INITIAL_LIMIT", "16"))
+# Скільки запит може чекати в черзі, перш ніж отримає 503; довша черга відхиляється одразу
+ASK_ADMISSION_QUEUE_TIMEOUT_S = float(os.environ.get("ASK_ADMISSION_QUEUE_TIMEOUT_S", "2"))
+ASK_ADMISSION_MAX_QUEUE = int(os.environ.get("ASK_ADMISSION_MAX_QUEUE", "100"))
+# Якщо медіана латентності upstream перевищує baseline у стільки разів — ліміт зменшується
+ASK_ADMISSION_LATENCY_TOLERANCE = float(os.environ.get("ASK_ADMISSION_LATENCY_TOLERANCE", "2.0"))
+ASK_SINGLEFLIGHT_ENABLED = os.environ.get("ASK_SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+# Baseline — мінімальна латентність, що повільно "спливає" вгору, щоб пристосуватись до стабільно повільнішого upstream
+BASELINE_DRIFT = 0.001
+MAX_RETRY_AFTER_S = 30
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(f"Overloaded ({reason}), retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Адаптивний ліміт одночасних запитів: на 429 від upstream ліміт зменшується вдвічі,
+    при зростанні латентності відносно baseline — на 10%, інакше раз на limit відповідей росте на 1.
+    Запити понад ліміт чекають у FIFO-черзі не довше ASK_ADMISSION_QUEUE_TIMEOUT_S, після чого
+    (або одразу, якщо черга переповнена) отримують Overloaded з оцінкою Retry-After.
+    """
+
+    def __init__(self, enabled: bool = ASK_ADMISSION_ENABLED, initial_limit: int = ASK_ADMISSION_INITIAL_LIMIT,
+                 min_limit: int = ASK_ADMISSION_MIN_LIMIT, max_limit: int = ASK_ADMISSION_MAX_LIMIT,
+                 queue_timeout_s: float = ASK_ADMISSION_QUEUE_TIMEOUT_S, max_queue: int = ASK_ADMISSION_MAX_QUEUE):
+        self.enabled = enabled
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.queue_timeout_s = queue_timeout_s
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.loop = asyncio.get_running_loop()
+        self._condition = asyncio.Condition()
+        self.latency = LatencyHistogram(window=64)
+        self.baseline_ms = None
+        self._since_adjust = 0
+        self._shed_unreported = 0
+        self.metrics = {"admitted": 0, "queued": 0, "shed_timeout": 0, "shed_queue_full": 0, "throttled": 0,
+                        "max_queue_depth": 0, "decreases": 0, "increases": 0}
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self):
+        if not self.enabled or (self._has_capacity() and not self.waiting):
+            self.in_flight += 1
+            self.metrics["admitted"] += 1
+            return
+        if self.waiting >= self.max_queue:
+            self._shed("queue_full")
+        self.waiting += 1
+        self.metrics["queued"] += 1
+        self.metrics["max_queue_depth"] = max(self.metrics["max_queue_depth"], self.waiting)
+        try:
+            async with self._condition:
+                await asyncio.wait_for(self._condition.wait_for(self._has_capacity), self.queue_timeout_s)
+                self.in_flight += 1
+                self.metrics["admitted"] += 1
+        except asyncio.TimeoutError:
+            self._shed("timeout")
+        finally:
+            self.waiting -= 1
+
+    async def release(self):
+        self.in_flight -= 1
+        if self.waiting:
+            async with self._condition:
+                self._condition.notify(max(1, int(self.limit) - self.in_flight))
+
+    def _shed(self, reason: str):
+        self.metrics[f"shed_{reason}"] += 1
+        self._shed_unreported += 1
+        retry_after = self.retry_after()
+        logging.warning(f"[Admission] Shedding request ({reason}): queue={self.waiting} in_flight={self.in_flight} "
+                        f"limit={int(self.limit)} retry_after={retry_after}s")
+        raise Overloaded(retry_after, reason)
+
+    def retry_after(self) -> int:
+        """
+        Оцінка, коли звільниться місце: черга / ліміт * середня латентність upstream.
+        """
+        avg_s = (self.latency.percentile(50) or 1000) / 1000
+        return max(1, min(MAX_RETRY_AFTER_S, math.ceil(avg_s * (self.waiting + 1) / max(1, int(self.limit)))))
+
+    def on_throttled(self):
+        self.metrics["throttled"] += 1
+        self.metrics["decreases"] += 1
+        self.limit = max(self.min_limit, self.limit / 2)
+        self._since_adjust = 0
+
+    def on_latency(self, ms: float):
+        self.latency.observe(ms)
+        self.baseline_ms = ms if self.baseline_ms is None else min(self.baseline_ms * (1 + BASELINE_DRIFT), ms)
+        self._since_adjust += 1
+        if self._since_adjust < int(self.limit):
+            return
+        self._since_adjust = 0
+        if self.latency.percentile(50) > self.baseline_ms * ASK_ADMISSION_LATENCY_TOLERANCE:
+            self.limit = max(self.min_limit, self.limit * 0.9)
+            self.metrics["decreases"] += 1
+        elif self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self.metrics["increases"] += 1
+
+    def report(self) -> dict:
+        """
+        Знімок для meta події answer (звідти — у Kusto): поточна черга, ліміт і скинуті з попереднього звіту запити.
+        """
+        shed, self._shed_unreported = self._shed_unreported, 0
+        return {"queue_depth": self.waiting, "in_flight": self.in_flight, "limit": int(self.limit), "shed": shed}
+
+    def stats(self) -> dict:
+        return {**self.metrics, "limit": int(self.limit), "in_flight": self.in_flight, "queue_depth": self.waiting,
+                "baseline_ms": round(self.baseline_ms, 1) if self.baseline_ms else None,
+                "latency_p50_ms": self.latency.percentile(50)}
+
+
+class Singleflight:
+    """
+    Один виклик на ключ: одночасні однакові запити чекають на спільний результат (або виключення).
+    Спільна задача захищена shield — таймаут одного з очікувачів не скасовує її для інших.
+    """
+
+    def __init__(self, name: str, enabled: bool = ASK_SINGLEFLIGHT_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self._calls = {}
+        self.metrics = {"calls": 0, "shared": 0}
+
+    async def do(self, key: str, factory):
+        if not self.enabled:
+            return await factory()
+        self.metrics["calls"] += 1
+        task = self._calls.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            self.metrics["shared"] += 1
+            logging.info(f"[Singleflight] {self.name}: joined in-flight call, metrics={self.metrics}")
+        else:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Якщо всі очікувачі вже пішли (таймаут), виключення не має лишитись "неотриманим"
+        if not task.cancelled():
+            task.exception()
+
+
+_controller = None
+search_flight = Singleflight("search")
+llm_flight = Singleflight("llm")
+
+
+def get_controller() -> AdmissionController:
+    """
+    Контролер для поточного event loop (asyncio.Condition прив'язана до loop).
+    """
+    global _controller
+    if _controller is None or _controller.loop is not asyncio.get_running_loop():
+        _controller = AdmissionController()
+    return _controller
@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+from . import cosmos_pool
+
+# L1: LRU у пам'яті воркера
+L1_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_L1_SIZE", "512"))
+L1_TTL_S = float(os.environ.get("ANSWER_CACHE_L1_TTL_S", "600"))
+# L2: спільне сховище — "cosmos" (контейнер ANSWER_CACHE_CONTAINER), "sqlite" (локальний файл) або "none"
+L2_BACKEND = os.environ.get("ANSWER_CACHE_L2", "none")
+L2_TTL_S = int(os.environ.get("ANSWER_CACHE_L2_TTL_S", "86400"))
+L2_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_L2_SIZE", "10000"))
+L2_CONTAINER = os.environ.get("ANSWER_CACHE_CONTAINER", "answer_cache")
+L2_SQLITE_PATH = os.environ.get("ANSWER_CACHE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "answer_cache.sqlite"))
+ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+
+# Питання з меншою кількістю змістовних слів вважаємо уточненням до попереднього діалогу
+MIN_STANDALONE_WORDS = 3
+# Частка слів питання, що вже зустрічались в історії, після якої історія суттєво впливає на відповідь
+HISTORY_OVERLAP_THRESHOLD = 0.5
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_question(question: str) -> str:
+    """
+    Нормалізує питання для ключа кешу: регістр, пробіли, пунктуація.
+    """
+    return " ".join(_WORD_RE.findall(question.lower()))
+
+
+def doc_fingerprint(doc: dict) -> str:
+    """
+    Ідентифікатор і версія документа бази знань. Якщо індекс не віддає дату зміни,
+    версією слугує хеш вмісту — оновлений документ дає новий ключ.
+    """
+    doc_id = doc.get("id") or doc.get("source") or doc.get("metadata_storage_path") or ""
+    version = doc.get("metadata_storage_last_modified") or hashlib.sha1(doc.get("content", "").encode("utf-8")).hexdigest()[:12]
+    return f"{doc_id}@{version}"
+
+
+def make_key(question: str, docs: List[dict], template_hash: str) -> str:
+    parts = [normalize_question(question), template_hash] + sorted(doc_fingerprint(d) for d in docs)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def history_is_material(question: str, history_text: str) -> bool:
+    """
+    Чи змінює історія діалогу промпт настільки, що кешована відповідь може бути хибною.
+    Короткі уточнення ("а ціна?") і питання, що повторюють слова з історії, — так.
+    """
+    if not history_text:
+        return False
+    words = [w for w in _WORD_RE.findall(question.lower()) if len(w) > 2]
+    if len(words) < MIN_STANDALONE_WORDS:
+        return True
+    history_words = set(_WORD_RE.findall(history_text.lower()))
+    overlap = sum(1 for w in words if w in history_words) / len(words)
+    return overlap >= HISTORY_OVERLAP_THRESHOLD
+
+
+class LRUCache:
+    """
+    Простий LRU з TTL для кешу в пам'яті воркера.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float, metrics: dict):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.metrics = metrics
+        self._data = OrderedDict()
+
+    def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            self.metrics["expired"] += 1
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value):
+        self._data[key] = (value, time.monotonic() + self.ttl_s)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteStore:
+    """
+    Локальна заміна спільного сховища (для тестів і локального запуску).
+    sqlite3 синхронний, тому всі звернення (і відкриття файлу) виконуються в потоці через asyncio.to_thread,
+    щоб не блокувати event loop воркера.
+    """
+
+    def __init__(self, path: str, ttl_s: int, max_entries: int, metrics: dict):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, value TEXT, expires REAL, created REAL)")
+            self._conn.commit()
+        return self._conn
+
+    async def get(self, key: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: dict):
+        await asyncio.to_thread(self._set, key, value)
+
+    def _get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connect().execute("SELECT value, expires FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._connect()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, value, expires, created) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + self.ttl_s, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE expires < ?", (now,))
+            count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count > self.max_entries:
+                evicted = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY created ASC LIMIT ?)", (evicted,)
+                )
+                self.metrics["evictions"] += evicted
+            self._conn.commit()
+
+
+class CosmosStore:
+    """
+    Спільний між воркерами кеш у контейнері Cosmos DB (partition key /id, TTL на рівні документа).
+    """
+
+    def __init__(self, container_name: str, ttl_s: int):
+        self.container_name = container_name
+        self.ttl_s = ttl_s
+
+    async def get(self, key: str) -> Optional[dict]:
+        container = await cosmos_pool.get_container(self.container_name)
+        if container is None:
+            return None
+        from azure.cosmos.exceptions import CosmosResourceNotFoundError
+        try:
+            item = await container.read_item(item=key, partition_key=key)
+        except CosmosResourceNotFoundError:
+            return None
+        return item.get("value")
+
+    async def set(self, key: str, value: dict):
+        container = await cosmos_pool.get_container(self.container_name)
+        if container is None:
+            return
+        await container.upsert_item({"id": key, "value": value, "ttl": self.ttl_s})
+
+
+class AnswerCache:
+    """
+    Дворівневий кеш відповідей: L1 (LRU у пам'яті) → L2 (спільне сховище).
+    """
+
+    def __init__(self, l2_backend: str = L2_BACKEND):
+        self.metrics = {"hits_l1": 0, "hits_l2": 0, "misses": 0, "skipped": 0, "sets": 0, "evictions": 0, "expired": 0, "errors": 0}
+        self.l1 = LRUCache(L1_MAX_ENTRIES, L1_TTL_S, self.metrics)
+        if l2_backend == "sqlite":
+            self.l2 = SqliteStore(L2_SQLITE_PATH, L2_TTL_S, L2_MAX_ENTRIES, self.metrics)
+        elif l2_backend == "cosmos":
+            self.l2 = CosmosStore(L2_CONTAINER, L2_TTL_S)
+        else:
+            self.l2 = None
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = self.l1.get(key)
+        if value is not None:
+            self.metrics["hits_l1"] += 1
+            return value
+        if self.l2 is not None:
+            try:
+                value = await self.l2.get(key)
+            except Exception as e:
+                self.metrics["errors"] += 1
+                logging.warning(f"[AnswerCache] L2 get failed: {e}")
+            if value is not None:
+                self.metrics["hits_l2"] += 1
+                self.l1.set(key, value)
+                return value
+        self.metrics["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: dict):
+        self.metrics["sets"] += 1
+        self.l1.set(key, value)
+        if self.l2 is not None:
+            try:
+                await self.l2.set(key, value)
+            except Exception as e:
+                self.metrics["errors"] += 1
+                logging.warning(f"[AnswerCache] L2 set failed: {e}")
+
+    def skip(self):
+        self.metrics["skipped"] += 1
+
+    def stats(self) -> dict:
+        lookups = self.metrics["hits_l1"] + self.metrics["hits_l2"] + self.metrics["misses"]
+        hits = self.metrics["hits_l1"] + self.metrics["hits_l2"]
+        return {**self.metrics, "l1_size": len(self.l1), "hit_rate": round(hits / lookups, 3) if lookups else 0.0}
+
+
+_cache = None
+
+
+def get_cache() -> Optional[AnswerCache]:
+    global _cache
+    if not ENABLED:
+        return None
+    if _cache is None:
+        _cache = AnswerCache()
+    return _cache
@@ -0,0 +1,71 @@
+"""
+Будує документи історії користувачів (step='history') з існуючих подій у контейнері.
+
+Запуск з каталогу src/functions (потрібні ті самі змінні COSMOSDB_*, що й для функції):
+    python -m ask.backfill_history [--user USER_ID] [--turns N] [--concurrency N]
+"""
+import sys
+import asyncio
+import logging
+import argparse
+from . import cosmos_pool
+from . import history_store
+
+
+async def backfill_user(container, user_id: str, max_turns: int) -> int:
+    # Запит у межах однієї партиції: дешевший за cross-partition скан
+    # Події bulk ask (meta.bulk) до історії користувача не входять
+    query = "SELECT TOP @top * FROM c WHERE (c.step='question' OR c.step='answer') AND NOT IS_DEFINED(c.meta.bulk) ORDER BY c._ts DESC"
+    params = [{"name": "@top", "value": max_turns * 4}]
+    items = [item async for item in container.query_items(query, parameters=params, partition_key=user_id)]
+    turns = history_store.build_turns(items, limit=max_turns)
+    await history_store.write_turns(container, user_id, turns)
+    return len(turns)
+
+
+async def list_users(container) -> list:
+    query = "SELECT DISTINCT VALUE c.user_id FROM c WHERE c.step='question' AND NOT IS_DEFINED(c.meta.bulk)"
+    return [user_id async for user_id in container.query_items(query) if user_id]
+
+
+async def run(user_ids: list = None, max_turns: int = history_store.HISTORY_MAX_TURNS, concurrency: int = 8) -> dict:
+    container = await cosmos_pool.get_container()
+    if container is None:
+        return {"error": "Missing config"}
+    try:
+        if not user_ids:
+            user_ids = await list_users(container)
+        logging.info(f"[Backfill] Building history documents for {len(user_ids)} users...")
+        semaphore = asyncio.Semaphore(concurrency)
+        stats = {"users": 0, "turns": 0, "failed": 0}
+
+        async def one(user_id):
+            async with semaphore:
+                try:
+                    stats["turns"] += await backfill_user(container, user_id, max_turns)
+                    stats["users"] += 1
+                except Exception as e:
+                    stats["failed"] += 1
+                    logging.error(f"[Backfill] Failed for user_id={user_id}: {e}")
+
+        await asyncio.gather(*(one(user_id) for user_id in user_ids))
+        logging.info(f"[Backfill] Done: {stats}")
+        return stats
+    finally:
+        await cosmos_pool.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill per-user history documents from dialog events.")
+    parser.add_argument("--user", action="append", dest="users", help="Only this user_id (can be repeated)")
+    parser.add_argument("--turns", type=int, default=history_store.HISTORY_MAX_TURNS, help="Turns to keep per user")
+    parser.add_argument("--concurrency", type=int, default=8, help="Users processed in parallel")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s')
+    result = asyncio.run(run(args.users, args.turns, args.concurrency))
+    print(result)
+    return 1 if "error" in result or result.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+Bulk-режим ask: прогін сотень питань за один виклик — прогрів кешу відповідей після оновлення
+бази знань і регресійна оцінка відповідей.
+
+Вхід — JSON-масив, об'єкт {"questions": [...], "concurrency": N, "cache": "use|refresh|off"}
+або JSON lines; елемент — рядок питання або об'єкт {"question", "id"?, "user_id"?}.
+Однакові питання (після нормалізації, як у ключі кешу) виконуються один раз.
+Пошук і LLM викликаються паралельно, але не більше concurrency одночасно; кожне питання проходить
+admission control, тож bulk ділить адаптивний ліміт з інтерактивними запитами і сповільнюється на 429.
+Результати віддаються NDJSON у порядку завершення, останній рядок — summary з throughput і латентністю.
+Події (question, search_result, answer) пишуться у Cosmos DB пачками, без історії користувача,
+з позначкою meta.bulk: sentiment, Kusto і top_users їх не враховують.
+
+CLI (з каталогу src/functions, змінні оточення як для функції):
+    python -m ask.bulk questions.jsonl [--output results.ndjson] [--concurrency 8] [--cache refresh]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import argparse
+from . import admission
+from . import answer_cache
+from . import cosmos_pool
+from . import event_sink
+from . import search_client
+from .metrics import LatencyHistogram
+from .tracing import Trace
+from .settings import get_settings
+from . import (
+    NOT_FOUND_ANSWER, PROMPT_TEMPLATE_HASH, ask_llm, is_rate_limited, lookup_cached_answer,
+    make_answer_event, retrieve_context, store_cached_answer, with_timeout,
+)
+
+ASK_BULK_CONCURRENCY = int(os.environ.get("ASK_BULK_CONCURRENCY", "8"))
+ASK_BULK_MAX_CONCURRENCY = int(os.environ.get("ASK_BULK_MAX_CONCURRENCY", "32"))
+# HTTP-маршрут віддає одне буферизоване тіло, а front-end обриває запит через ~230 с:
+# більші прогони — через CLI
+ASK_BULK_HTTP_MAX_QUESTIONS = int(os.environ.get("ASK_BULK_HTTP_MAX_QUESTIONS", "100"))
+# Скільки разів повторюємо питання, відхилене admission control або upstream (429)
+ASK_BULK_MAX_RETRIES = int(os.environ.get("ASK_BULK_MAX_RETRIES", "3"))
+ASK_BULK_BACKOFF_BASE_S = float(os.environ.get("ASK_BULK_BACKOFF_BASE_S", "1"))
+# Події накопичуються і пишуться у Cosmos DB пачками такого розміру
+ASK_BULK_EVENT_BATCH = int(os.environ.get("ASK_BULK_EVENT_BATCH", "200"))
+ASK_BULK_USER_ID = os.environ.get("ASK_BULK_USER_ID", "bulk")
+# use — брати відповідь з кешу; refresh — завжди питати LLM і перезаписати кеш (оцінка); off — без кешу
+CACHE_MODES = ("use", "refresh", "off")
+MAX_BACKOFF_S = 30
+
+
+def load_payload(text: str):
+    """
+    Тіло запиту / файл -> (елементи, опції). ValueError — некоректний вхід.
+    """
+    text = (text or "").strip()
+    if not text:
+        raise ValueError("No questions provided")
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError:
+        payload = None
+    if isinstance(payload, list):
+        return payload, {}
+    if isinstance(payload, dict):
+        if "questions" in payload:
+            if not isinstance(payload["questions"], list):
+                raise ValueError("'questions' must be an array")
+            return payload["questions"], {k: v for k, v in payload.items() if k != "questions"}
+        return [payload], {}
+    items = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_no}: invalid JSON ({e.msg})")
+    return items, {}
+
+
+def parse_items(items: list, user_id: str = None) -> list:
+    """
+    Елементи -> [{"index", "id", "question", "user_id"}]. ValueError — елемент без питання.
+    """
+    parsed = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"question": item}
+        question = item.get("question") if isinstance(item, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            raise ValueError(f"Item {index}: missing 'question'")
+        parsed.append({
+            "index": index,
+            "id": str(item.get("id", index)),
+            "question": question.strip(),
+            "user_id": item.get("user_id") or user_id or ASK_BULK_USER_ID,
+        })
+    return parsed
+
+
+def dedupe(items: list) -> list:
+    """
+    Групує однакові питання (той самий user_id і нормалізований текст) в одну задачу.
+    """
+    jobs = {}
+    for item in items:
+        key = (item["user_id"], answer_cache.normalize_question(item["question"]))
+        if key in jobs:
+            jobs[key]["duplicates"].append(item["id"])
+        else:
+            jobs[key] = {**item, "duplicates": []}
+    return list(jobs.values())
+
+
+def parse_options(options: dict, params=None):
+    """
+    (concurrency, cache_mode) з опцій тіла або query string (тіло має пріоритет; 0 і "" — теж значення,
+    а не "не задано"). ValueError — некоректні значення, зокрема concurrency < 1.
+    """
+    params = params or {}
+    concurrency = options.get("concurrency")
+    if concurrency is None:
+        concurrency = params.get("concurrency")
+    if concurrency is None:
+        concurrency = ASK_BULK_CONCURRENCY
+    try:
+        concurrency = int(concurrency)
+    except (TypeError, ValueError):
+        raise ValueError("'concurrency' must be an integer")
+    if concurrency < 1:
+        raise ValueError("'concurrency' must be at least 1")
+    cache_mode = options.get("cache")
+    if cache_mode is None:
+        cache_mode = params.get("cache")
+    if cache_mode is None:
+        cache_mode = "use"
+    if cache_mode not in CACHE_MODES:
+        raise ValueError(f"'cache' must be one of: {', '.join(CACHE_MODES)}")
+    return min(concurrency, ASK_BULK_MAX_CONCURRENCY), cache_mode
+
+
+async def answer_job(job: dict, cache_mode: str, events: list) -> dict:
+    """
+    Одне питання без історії користувача: пошук -> кеш -> LLM. Події складаються в events.
+    """
+    trace = Trace()
+    dialog_id = str(uuid.uuid4())
+    context = await retrieve_context(job["user_id"], job["question"], dialog_id, trace, with_history=False, events=events)
+    if context is None:
+        return {"status": "not_found", "answer": NOT_FOUND_ANSWER, "source_documents": [], "cache_hit": False,
+                "dialog_id": dialog_id, "stages_ms": trace.snapshot()}
+    started = time.perf_counter()
+    cache_key, answer = None, None
+    if cache_mode == "use":
+        cache_key, answer = await lookup_cached_answer(job["question"], context)
+    elif cache_mode == "refresh" and answer_cache.get_cache() is not None:
+        cache_key = answer_cache.make_key(job["question"], context["relevant_docs"], PROMPT_TEMPLATE_HASH)
+    cache_hit = answer is not None
+    if not cache_hit:
+        with trace.stage("llm"):
+            answer = await with_timeout(ask_llm(context["prompt"].text), get_settings().llm_timeout_s, "llm")
+        await store_cached_answer(cache_key, answer)
+    event = make_answer_event(job["user_id"], dialog_id, answer, (time.perf_counter() - started) * 1000,
+                              cache_hit=cache_hit, prompt_tokens=context["prompt"].section_tokens, trace=trace)
+    events.append(event)
+    return {"status": "ok", "answer": answer, "source_documents": context["source_urls"], "cache_hit": cache_hit,
+            "dialog_id": dialog_id, "stages_ms": event["meta"]["stages_ms"]}
+
+
+async def run_job(job: dict, cache_mode: str, events: list, semaphore: asyncio.Semaphore, counters: dict) -> dict:
+    """
+    Питання з повторами: Overloaded від admission control — чекаємо Retry-After,
+    429 від upstream — експоненційний backoff з jitter (ліміт контролера при цьому вже зменшено).
+    Події невдалої спроби, яку буде повторено, відкидаються, щоб не дублювати question/search_result.
+    """
+    async with semaphore:
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            controller = admission.get_controller()
+            try:
+                await controller.acquire()
+            except admission.Overloaded as e:
+                if attempt >= ASK_BULK_MAX_RETRIES:
+                    result = {"status": "error", "error": f"overloaded ({e.reason})"}
+                    break
+                attempt += 1
+                counters["retries"] += 1
+                await asyncio.sleep(e.retry_after)
+                continue
+            attempt_events = []
+            try:
+                result = await answer_job(job, cache_mode, attempt_events)
+                events.extend(attempt_events)
+                break
+            except Exception as e:
+                if is_rate_limited(e) and attempt < ASK_BULK_MAX_RETRIES:
+                    attempt += 1
+                    counters["retries"] += 1
+                    delay = min(MAX_BACKOFF_S, ASK_BULK_BACKOFF_BASE_S * 2 ** attempt)
+                    await asyncio.sleep(random.uniform(delay / 2, delay))
+                    continue
+                logging.error(f"[Bulk] Question id={job['id']} failed: {e}")
+                events.extend(attempt_events)
+                result = {"status": "error", "error": str(e) or "upstream timeout"}
+                break
+            finally:
+                await controller.release()
+    return {
+        "type": "result", "id": job["id"], "index": job["index"], "question": job["question"],
+        **result, "duplicates": job["duplicates"], "attempts": attempt + 1,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+async def run_bulk(items: list, concurrency: int = ASK_BULK_CONCURRENCY, cache_mode: str = "use"):
+    """
+    Асинхронний генератор рядків NDJSON: result для кожного унікального питання в порядку
+    завершення, наприкінці — summary.
+    """
+    started = time.perf_counter()
+    jobs = dedupe(items)
+    semaphore = asyncio.Semaphore(concurrency)
+    counters = {"retries": 0}
+    events = []
+    sink = event_sink.get_sink()
+    written = {"written": 0, "failed": 0}
+
+    async def write_events():
+        batch = events[:]
+        del events[:]
+        for event in batch:
+            event.setdefault("meta", {})["bulk"] = True
+        if batch:
+            stats = await sink.write_many(batch)
+            for key in written:
+                written[key] += stats[key]
+
+    latency = LatencyHistogram(window=max(1, len(jobs)))
+    statuses = {"ok": 0, "not_found": 0, "error": 0}
+    cache_hits = 0
+    tasks = [asyncio.ensure_future(run_job(job, cache_mode, events, semaphore, counters)) for job in jobs]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            latency.observe(result["latency_ms"])
+            statuses[result["status"]] += 1
+            cache_hits += bool(result.get("cache_hit"))
+            yield result
+            if len(events) >= ASK_BULK_EVENT_BATCH:
+                await write_events()
+        await write_events()
+    finally:
+        for task in tasks:
+            task.cancel()
+    elapsed = time.perf_counter() - started
+    summary = {
+        "type": "summary",
+        "questions": len(items),
+        "unique": len(jobs),
+        "duplicates": len(items) - len(jobs),
+        **statuses,
+        "cache_hits": cache_hits,
+        "retries": counters["retries"],
+        "concurrency": concurrency,
+        "cache": cache_mode,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(jobs) / elapsed, 2) if elapsed else None,
+        "latency_ms": {k: v for k, v in latency.snapshot().items() if k != "buckets"},
+        "events": written,
+        "admission": admission.get_controller().stats(),
+    }
+    logging.info(f"[Bulk] {summary}")
+    yield summary
+
+
+async def run_cli(args) -> int:
+    with open(args.input, encoding="utf-8") if args.input != "-" else sys.stdin as f:
+        items, options = load_payload(f.read())
+    items = parse_items(items, args.user_id)
+    overrides = {"concurrency": args.concurrency, "cache": args.cache}
+    concurrency, cache_mode = parse_options({**options, **{k: v for k, v in overrides.items() if v is not None}})
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    summary = None
+    try:
+        async for line in run_bulk(items, concurrency, cache_mode):
+            out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            out.flush()
+            summary = line
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        await event_sink.shutdown()
+        await search_client.close()
+        await cosmos_pool.close()
+    if args.output:
+        print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary and not summary["error"] else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer many questions through the ask pipeline and stream NDJSON results.")
+    parser.add_argument("input", help="JSON array or JSON lines file with questions ('-' for stdin)")
+    parser.add_argument("--output", default=None, help="NDJSON results file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=None, help=f"Questions in flight (default {ASK_BULK_CONCURRENCY})")
+    parser.add_argument("--cache", choices=CACHE_MODES, default=None, help="Answer cache mode (default use)")
+    parser.add_argument("--user-id", default=None, help=f"user_id for items without one (default {ASK_BULK_USER_ID})")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        return asyncio.run(run_cli(args))
+    except ValueError as e:
+        logging.error(f"[Bulk] {e}")
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import time
+import asyncio
+import logging
+from .settings import get_settings
+
+# Як часто (в секундах) перевіряємо, що пул-клієнт ще живий
+HEALTH_CHECK_INTERVAL_S = float(os.environ.get("COSMOSDB_HEALTH_CHECK_INTERVAL_S", "60"))
+
+# Помилки транспорту, після яких клієнт вважаємо зламаним і перестворюємо (помилки azure-core додає load_sdk)
+CONNECTION_ERRORS = (ConnectionError, asyncio.TimeoutError)
+
+# SDK Cosmos імпортується при створенні першого клієнта: відповіді з кешу і холодний старт його не потребують
+CosmosClient = None
+
+
+def load_sdk():
+    global CosmosClient, CONNECTION_ERRORS
+    if CosmosClient is None:
+        from azure.cosmos.aio import CosmosClient
+    from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+    CONNECTION_ERRORS = (ServiceRequestError, ServiceResponseError, ConnectionError, asyncio.TimeoutError)
+
+_client = None
+_database = None
+_container = None
+_extra_containers = {}
+_client_loop = None
+_last_health_check = 0.0
+_lock = None
+_lock_loop = None
+
+
+def _get_lock() -> asyncio.Lock:
+    """
+    asyncio.Lock прив'язаний до event loop, тому створюємо його заново для кожного нового loop.
+    """
+    global _lock, _lock_loop
+    loop = asyncio.get_running_loop()
+    if _lock is None or _lock_loop is not loop:
+        _lock = asyncio.Lock()
+        _lock_loop = loop
+    return _lock
+
+
+def _drop():
+    global _client, _database, _container, _client_loop, _last_health_check
+    _client = None
+    _database = None
+    _container = None
+    _extra_containers.clear()
+    _client_loop = None
+    _last_health_check = 0.0
+
+
+async def _create():
+    global _client, _database, _container, _client_loop, _last_health_check
+    settings = get_settings()
+    if not settings.cosmos_configured:
+        logging.error("[CosmosPool] One or more Cosmos DB environment variables are missing!")
+        return None
+    database_name, container_name = settings.cosmos_database, settings.cosmos_container
+    load_sdk()
+    client = CosmosClient(settings.cosmos_endpoint, settings.cosmos_key)
+    await client.__aenter__()
+    _client = client
+    _database = client.get_database_client(database_name)
+    _container = _database.get_container_client(container_name)
+    _client_loop = asyncio.get_running_loop()
+    _last_health_check = time.monotonic()
+    logging.info(f"[CosmosPool] Created Cosmos client for db={database_name}, container={container_name}")
+    return _container
+
+
+async def get_container(container_name: str = None):
+    """
+    Повертає спільний для воркера handle контейнера Cosmos DB
+    (COSMOSDB_CONTAINER або інший контейнер тієї ж бази, якщо передано container_name).
+    Клієнт створюється ліниво при першому виклику і перевикористовується між запитами.
+    Якщо клієнт створено в іншому event loop або health check не пройшов — перестворюємо.
+    Повертає None, якщо змінні оточення не задані.
+    """
+    container = await _get_main_container()
+    if container is None or not container_name:
+        return container
+    if container_name not in _extra_containers:
+        _extra_containers[container_name] = _database.get_container_client(container_name)
+    return _extra_containers[container_name]
+
+
+async def _get_main_container():
+    loop = asyncio.get_running_loop()
+    if _container is not None and _client_loop is loop and not _health_check_due():
+        return _container
+    async with _get_lock():
+        if _container is not None and _client_loop is not loop:
+            # aiohttp-сесія старого клієнта належить іншому loop, закрити її тут не можна
+            logging.warning("[CosmosPool] Event loop changed, recreating Cosmos client.")
+            _drop()
+        if _container is not None and _health_check_due():
+            await _health_check()
+        if _container is None:
+            return await _create()
+        return _container
+
+
+def _health_check_due() -> bool:
+    return time.monotonic() - _last_health_check > HEALTH_CHECK_INTERVAL_S
+
+
+async def _health_check():
+    global _last_health_check
+    try:
+        await _container.read()
+        _last_health_check = time.monotonic()
+    except Exception as e:
+        logging.warning(f"[CosmosPool] Health check failed, reconnecting: {e}")
+        await _close_client()
+
+
+async def _close_client():
+    client = _client
+    _drop()
+    if client is not None:
+        try:
+            await client.close()
+        except Exception as e:
+            logging.warning(f"[CosmosPool] Failed to close broken client: {e}")
+
+
+async def invalidate(error: Exception = None):
+    """
+    Скидає пул-клієнт, якщо помилка свідчить про зламане з'єднання.
+    Наступний виклик get_container() створить новий клієнт.
+    """
+    if error is not None and not isinstance(error, CONNECTION_ERRORS):
+        return
+    if _client_loop is not asyncio.get_running_loop():
+        _drop()
+        return
+    logging.warning(f"[CosmosPool] Invalidating Cosmos client after error: {error}")
+    await _close_client()
+
+
+async def close():
+    """
+    Закриває пул-клієнт (для shutdown-хуків і CLI-скриптів).
+    """
+    await _close_client()
@@ -0,0 +1,251 @@
+import os
+import time
+import uuid
+import atexit
+import asyncio
+import logging
+from collections import defaultdict
+from . import cosmos_pool
+from .metrics import LatencyHistogram
+
+# Скидаємо буфер, коли набралось стільки подій або минув інтервал
+FLUSH_BATCH_SIZE = int(os.environ.get("EVENT_SINK_BATCH_SIZE", "50"))
+FLUSH_INTERVAL_S = float(os.environ.get("EVENT_SINK_FLUSH_INTERVAL_S", "1.0"))
+# Максимум подій у пам'яті; при переповненні put() чекає PUT_TIMEOUT_S, потім подія відкидається
+MAX_QUEUE_SIZE = int(os.environ.get("EVENT_SINK_MAX_QUEUE", "1000"))
+PUT_TIMEOUT_S = float(os.environ.get("EVENT_SINK_PUT_TIMEOUT_S", "0.5"))
+WRITE_TIMEOUT_S = float(os.environ.get("EVENT_SINK_WRITE_TIMEOUT_S", "5"))
+SHUTDOWN_FLUSH_TIMEOUT_S = float(os.environ.get("EVENT_SINK_SHUTDOWN_FLUSH_TIMEOUT_S", "10"))
+# Ліміт операцій у transactional batch Cosmos DB
+MAX_TRANSACTIONAL_BATCH = 100
+PARTITION_KEY_FIELD = "user_id"
+
+
+class EventSink:
+    """
+    Write-behind буфер подій діалогу (question, search_result, answer).
+    Події складаються в обмежену чергу, а фонова задача пише їх у Cosmos DB
+    transactional batch-ами по partition key — поза шляхом відповіді користувачу.
+    """
+
+    def __init__(self, batch_size: int = FLUSH_BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL_S,
+                 max_queue: int = MAX_QUEUE_SIZE, put_timeout: float = PUT_TIMEOUT_S):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.counters = {"queued": 0, "flushed": 0, "failed": 0, "dropped": 0, "batches": 0}
+        # Час запису однієї пачки партиції в Cosmos DB (batch або fallback по одній) — справжня ціна запису,
+        # на відміну від put(), який лише ставить подію в чергу
+        self.write_latency = LatencyHistogram(window=256)
+        self._flush_lock = asyncio.Lock()
+        # Фонова задача спить, доки немає подій; _full будить її раніше за інтервал
+        self._nonempty = asyncio.Event()
+        self._full = asyncio.Event()
+        self._closed = False
+        self._task = self.loop.create_task(self._run())
+
+    async def put(self, event: dict) -> bool:
+        """
+        Додає подію в буфер. Якщо буфер повний — чекає put_timeout (backpressure),
+        після чого відкидає подію. Повертає True, якщо подію прийнято.
+        """
+        if self._closed:
+            logging.error("[EventSink] Sink is closed, event dropped.")
+            self.counters["dropped"] += 1
+            return False
+        if "id" not in event:
+            event["id"] = str(uuid.uuid4())
+        try:
+            await asyncio.wait_for(self.queue.put(event), self.put_timeout)
+        except asyncio.TimeoutError:
+            self.counters["dropped"] += 1
+            logging.error(f"[EventSink] Queue is full ({self.queue.qsize()}), event id={event['id']} dropped.")
+            return False
+        self.counters["queued"] += 1
+        self._nonempty.set()
+        if self.queue.qsize() >= self.batch_size:
+            self._full.set()
+        return True
+
+    async def write_many(self, events: list) -> dict:
+        """
+        Пише пачку подій напряму, минаючи чергу (bulk ask): подій багато, а відкидати їх
+        при переповненні буфера не можна. Групування по partition key і transactional batch — як у flush.
+        """
+        for event in events:
+            event.setdefault("id", str(uuid.uuid4()))
+        flushed, failed = self.counters["flushed"], self.counters["failed"]
+        await self._write(events)
+        return {"written": self.counters["flushed"] - flushed, "failed": self.counters["failed"] - failed}
+
+    def stats(self) -> dict:
+        """
+        Лічильники сінку; pending — скільки подій ще не записано (відставання).
+        """
+        write_latency = {k: v for k, v in self.write_latency.snapshot().items() if k != "buckets"}
+        return {**self.counters, "pending": self.queue.qsize(), "write_latency_ms": write_latency}
+
+    def report(self) -> dict:
+        """
+        Знімок для meta події answer (звідти — у Kusto): латентність запису в Cosmos DB і відставання буфера.
+        """
+        return {"write_p50_ms": self.write_latency.percentile(50), "write_p95_ms": self.write_latency.percentile(95),
+                "pending": self.queue.qsize()}
+
+    async def _run(self):
+        while True:
+            # Чекаємо першу подію, потім добираємо до batch_size, але не довше flush_interval
+            if self.queue.empty():
+                self._nonempty.clear()
+                await self._nonempty.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"[EventSink] Flush loop error: {e}")
+
+    def _drain(self, limit: int) -> list:
+        events = []
+        while len(events) < limit:
+            try:
+                events.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return events
+
+    async def flush(self):
+        """
+        Записує все, що є в буфері, у Cosmos DB.
+        """
+        async with self._flush_lock:
+            written = 0
+            while not self.queue.empty():
+                events = self._drain(self.batch_size)
+                try:
+                    await self._write(events)
+                except Exception:
+                    # Клієнт Cosmos недоступний: повертаємо події в буфер до наступного flush
+                    self._requeue(events)
+                    raise
+                finally:
+                    for _ in events:
+                        self.queue.task_done()
+                written += len(events)
+            if written:
+                logging.info(f"[EventSink] Flushed {written} events. Stats: {self.stats()}")
+
+    def _requeue(self, events: list):
+        for event in events:
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.counters["failed"] += 1
+                logging.error(f"[EventSink] Queue is full, event id={event['id']} lost after a failed flush.")
+
+    async def _write(self, events: list):
+        container = await cosmos_pool.get_container()
+        if container is None:
+            self.counters["failed"] += len(events)
+            logging.error(f"[EventSink] Cosmos DB container is not available, {len(events)} events lost!")
+            return
+        by_partition = defaultdict(list)
+        for event in events:
+            by_partition[event.get(PARTITION_KEY_FIELD)].append(event)
+        await asyncio.gather(*(
+            self._write_partition(container, pk, group[i:i + MAX_TRANSACTIONAL_BATCH])
+            for pk, group in by_partition.items()
+            for i in range(0, len(group), MAX_TRANSACTIONAL_BATCH)
+        ))
+
+    async def _write_partition(self, container, partition_key, events: list):
+        started = time.perf_counter()
+        try:
+            await self._write_partition_once(container, partition_key, events)
+        finally:
+            self.write_latency.observe((time.perf_counter() - started) * 1000)
+
+    async def _write_partition_once(self, container, partition_key, events: list):
+        self.counters["batches"] += 1
+        try:
+            operations = [("create", (event,)) for event in events]
+            await asyncio.wait_for(
+                container.execute_item_batch(batch_operations=operations, partition_key=partition_key),
+                WRITE_TIMEOUT_S,
+            )
+            self.counters["flushed"] += len(events)
+            return
+        except Exception as e:
+            # Batch атомарний: якщо впав — пробуємо по одній, щоб не втратити решту подій
+            logging.warning(f"[EventSink] Transactional batch failed for pk={partition_key}, falling back to single writes: {e}")
+            await cosmos_pool.invalidate(e)
+        results = await asyncio.gather(*(
+            asyncio.wait_for(container.upsert_item(event), WRITE_TIMEOUT_S) for event in events
+        ), return_exceptions=True)
+        for event, result in zip(events, results):
+            if isinstance(result, Exception):
+                self.counters["failed"] += 1
+                logging.error(f"[EventSink] Failed to save event id={event['id']}: {result}")
+            else:
+                self.counters["flushed"] += 1
+
+    async def close(self):
+        """
+        Зупиняє фонову задачу і дописує залишок буфера (flush-on-shutdown).
+        """
+        self._closed = True
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await self.flush()
+
+
+_sink = None
+
+
+def get_sink() -> EventSink:
+    """
+    Повертає сінк подій для поточного event loop (створює ліниво).
+    """
+    global _sink
+    loop = asyncio.get_running_loop()
+    if _sink is None or _sink.loop is not loop or _sink.loop.is_closed():
+        _sink = EventSink()
+    return _sink
+
+
+async def shutdown():
+    if _sink is not None:
+        await _sink.close()
+
+
+def _flush_on_exit():
+    if _sink is None or _sink.loop.is_closed():
+        return
+    pending = _sink.queue.qsize()
+    if pending:
+        logging.info(f"[EventSink] Flushing {pending} events on shutdown...")
+    try:
+        if not _sink.loop.is_running():
+            _sink.loop.run_until_complete(_sink.close())
+            return
+        # У хості Functions loop воркера ще крутиться в іншому потоці: віддаємо close() йому і чекаємо
+        try:
+            asyncio.get_running_loop()
+            logging.error("[EventSink] Cannot block the running event loop to flush on shutdown.")
+            return
+        except RuntimeError:
+            pass
+        asyncio.run_coroutine_threadsafe(_sink.close(), _sink.loop).result(timeout=SHUTDOWN_FLUSH_TIMEOUT_S)
+    except Exception as e:
+        logging.error(f"[EventSink] Flush on shutdown failed: {e}")
+
+
+atexit.register(_flush_on_exit)
@@ -0,0 +1,128 @@
+import os
+import asyncio
+import logging
+import datetime
+from typing import List, Optional
+
+# Скільки останніх пар (question, answer) тримаємо в документі історії користувача
+HISTORY_MAX_TURNS = int(os.environ.get("HISTORY_MAX_TURNS", "10"))
+HISTORY_STEP = "history"
+# Скільки разів повторюємо read-modify-write при конфлікті ETag
+MAX_UPDATE_RETRIES = 5
+
+
+def history_doc_id(user_id: str) -> str:
+    return f"history_{user_id}"
+
+
+def build_turns(items: list, limit: int = HISTORY_MAX_TURNS) -> List[dict]:
+    """
+    Будує пари (question, answer) з подій, відсортованих за часом за спаданням (найновіші першими).
+    Пара складається за dialog_id; повертає не більше limit пар у хронологічному порядку.
+    """
+    # Для кожного dialog_id беремо найновішу відповідь — один прохід замість вкладеного пошуку
+    answers = {}
+    for item in items:
+        if item.get("step") == "answer" and item.get("dialog_id") not in answers:
+            answers[item.get("dialog_id")] = item
+    turns = []
+    for item in items:
+        if item.get("step") != "question":
+            continue
+        answer = answers.get(item.get("dialog_id"))
+        if answer:
+            turns.append(make_turn(item.get("dialog_id"), item["content"], answer["content"], answer.get("timestamp")))
+        if len(turns) >= limit:
+            break
+    turns.reverse()
+    return turns
+
+
+def make_turn(dialog_id: str, question: str, answer: str, timestamp: str = None) -> dict:
+    return {
+        "dialog_id": dialog_id,
+        "question": question,
+        "answer": answer,
+        "timestamp": timestamp or datetime.datetime.utcnow().isoformat() + "Z",
+    }
+
+
+def make_history_doc(user_id: str, turns: List[dict]) -> dict:
+    return {
+        "id": history_doc_id(user_id),
+        "user_id": user_id,
+        "step": HISTORY_STEP,
+        "turns": turns,
+        "updated": datetime.datetime.utcnow().isoformat() + "Z",
+    }
+
+
+async def read_history_doc(container, user_id: str) -> Optional[dict]:
+    """
+    Точкове читання документа історії (id + partition key). None, якщо документа ще немає.
+    """
+    # SDK вже завантажено: container створив cosmos_pool
+    from azure.cosmos.exceptions import CosmosResourceNotFoundError
+    try:
+        return await container.read_item(item=history_doc_id(user_id), partition_key=user_id)
+    except CosmosResourceNotFoundError:
+        return None
+
+
+async def update_history_doc(container, user_id: str, update, max_turns: int = HISTORY_MAX_TURNS) -> Optional[dict]:
+    """
+    Read-modify-write документа історії з оптимістичним блокуванням по ETag.
+    update(doc) змінює документ на місці; turns обрізаються до max_turns останніх.
+    """
+    from azure.core import MatchConditions
+    from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceExistsError
+    for attempt in range(MAX_UPDATE_RETRIES):
+        doc = await read_history_doc(container, user_id)
+        is_new = doc is None
+        if is_new:
+            doc = make_history_doc(user_id, [])
+        update(doc)
+        doc["turns"] = doc.get("turns", [])[-max_turns:]
+        doc["updated"] = datetime.datetime.utcnow().isoformat() + "Z"
+        try:
+            if is_new:
+                return await container.create_item(doc)
+            return await container.replace_item(
+                item=doc["id"], body=doc, etag=doc["_etag"], match_condition=MatchConditions.IfNotModified
+            )
+        except (CosmosAccessConditionFailedError, CosmosResourceExistsError):
+            logging.info(f"[History] Concurrent update for user_id={user_id}, retry {attempt + 1}")
+            await asyncio.sleep(0.05 * (attempt + 1))
+    logging.error(f"[History] Gave up updating history for user_id={user_id} after {MAX_UPDATE_RETRIES} retries")
+    return None
+
+
+async def append_turn(container, user_id: str, turn: dict, max_turns: int = HISTORY_MAX_TURNS) -> Optional[dict]:
+    """
+    Інкрементально додає нову пару в документ історії користувача.
+    """
+    return await update_history_doc(
+        container, user_id, lambda doc: doc.setdefault("turns", []).append(turn), max_turns=max_turns
+    )
+
+
+async def write_turns(container, user_id: str, turns: List[dict]) -> dict:
+    """
+    Повністю перезаписує документ історії (використовується backfill-скриптом).
+    """
+    return await container.upsert_item(make_history_doc(user_id, turns))
+
+
+
+async def fold_into_summary(container, user_id: str, folded_turns: List[dict], summary: str) -> Optional[dict]:
+    """
+    Прибирає згорнуті пари з документа історії і зберігає новий rolling summary.
+    """
+    folded = {(t.get("dialog_id"), t.get("timestamp")) for t in folded_turns}
+
+    def update(doc):
+        doc["turns"] = [t for t in doc.get("turns", []) if (t.get("dialog_id"), t.get("timestamp")) not in folded]
+        doc["summary"] = summary
+        doc["summary_turns"] = doc.get("summary_turns", 0) + len(folded_turns)
+
+    return await update_history_doc(container, user_id, update)
@@ -0,0 +1,274 @@
+"""
+Локальний BM25-індекс бази знань (L1 перед пошуковим сервісом).
+
+Snapshot — каталог версії з масивами numpy, які відкриваються через mmap (старт воркера не читає їх цілком):
+    terms.npy              відсортований словник (пошук термів — np.searchsorted)
+    indptr/indices.npy     CSR-матриця терм x документ
+    weights.npy            готові BM25-ваги (idf * насичений tf з нормуванням за довжиною)
+    tf.npy                 сирі частоти (для інкрементальної перебудови)
+    docs.json              документи у формі відповіді пошукового сервісу + fingerprint
+    manifest.json          параметри BM25, кількість документів, версія
+Файл CURRENT у корені вказує на активну версію; його атомарно перемикає sync_search_index.
+"""
+import os
+import re
+import json
+import time
+import shutil
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+
+# "remote" — лише пошуковий сервіс; "local_first" — спершу локальний індекс, сервіс — fallback; "local" — лише індекс
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "remote")
+LOCAL_SEARCH_INDEX_PATH = os.environ.get(
+    "LOCAL_SEARCH_INDEX_PATH", os.path.join(os.path.dirname(__file__), "search_index")
+)
+LOCAL_SEARCH_TOP = int(os.environ.get("LOCAL_SEARCH_TOP", "3"))
+# Нормований score (0..1, частка максимально можливого BM25 для цього запиту), нижче якого документ
+# вважаємо нерелевантним; якщо таких не лишилось — промах, йдемо в пошуковий сервіс
+LOCAL_SEARCH_MIN_SCORE = float(os.environ.get("LOCAL_SEARCH_MIN_SCORE", "0.3"))
+# Як часто воркер перевіряє, чи не з'явилась нова версія snapshot
+LOCAL_SEARCH_RELOAD_S = float(os.environ.get("LOCAL_SEARCH_RELOAD_S", "60"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Службові поля відповіді сервісу не зберігаємо в snapshot
+_SKIP_FIELDS = ("@search.score", "@search.highlights", "@search.captions", "@search.rerankerScore")
+
+
+def tokenize(text: str) -> list:
+    return [token for token in _WORD_RE.findall((text or "").lower()) if len(token) > 1]
+
+
+def document_text(doc: dict) -> str:
+    return " ".join(filter(None, [doc.get("title") or doc.get("metadata_storage_name"), doc.get("content")]))
+
+
+class LocalSearchIndex:
+    def __init__(self, path: str, manifest: dict, terms, indptr, indices, weights, tf, docs: list):
+        from scipy import sparse
+        self.path = path
+        self.manifest = manifest
+        self.terms = terms
+        self.docs = docs
+        self.tf = tf
+        # copy=False: матриця працює прямо поверх mmap-масивів
+        self.matrix = sparse.csr_matrix((weights, indices, indptr), shape=(len(terms), len(docs)), copy=False)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalSearchIndex":
+        import numpy as np
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(os.path.join(path, "docs.json"), encoding="utf-8") as f:
+            docs = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                  for name in ("terms", "indptr", "indices", "weights", "tf")}
+        return cls(path, manifest, docs=docs, **arrays)
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    def lookup(self, tokens: list):
+        """
+        Токени -> (рядки словника, кількість входжень у запиті); невідомі терми відкидаються.
+        """
+        import numpy as np
+        counts = Counter(tokens)
+        if not counts or not len(self.terms):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.array(list(counts.keys()))
+        positions = np.searchsorted(self.terms, query)
+        positions[positions >= len(self.terms)] = 0
+        found = self.terms[positions] == query
+        weights = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        return positions[found], weights[found]
+
+    def search(self, query: str, top: int = LOCAL_SEARCH_TOP) -> dict:
+        """
+        BM25 top-N у формі відповіді пошукового сервісу: {"value": [{..., "@search.score": ...}]}.
+        Сирий BM25 залежить від довжини запиту і корпусу, тому score нормується на максимально можливий
+        для цього запиту (сума найбільших ваг кожного терму) — 1.0 означає найкращий можливий збіг.
+        """
+        import numpy as np
+        rows, query_tf = self.lookup(tokenize(query))
+        if not len(rows):
+            return {"value": []}
+        # Score документа — сума ваг термів запиту: один sparse-зріз рядків і зважена сума
+        scores = np.asarray(self.matrix[rows].T @ query_tf).ravel()
+        top = min(top, int(np.count_nonzero(scores)))
+        if top <= 0:
+            return {"value": []}
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        ideal = float(np.asarray(self.matrix[rows].max(axis=1).todense()).ravel() @ query_tf)
+        return {"value": [{**self.docs[i], "@search.score": round(float(scores[i]) / ideal, 6)} for i in best]}
+
+    def doc_term_counts(self) -> dict:
+        """
+        fingerprint -> Counter термів документа, відновлені з tf-матриці (для інкрементальної перебудови).
+        """
+        from scipy import sparse
+        by_doc = sparse.csr_matrix((self.tf, self.matrix.indices, self.matrix.indptr), shape=self.matrix.shape).T.tocsr()
+        counts = {}
+        for j, doc in enumerate(self.docs):
+            start, end = by_doc.indptr[j], by_doc.indptr[j + 1]
+            counts[doc["fingerprint"]] = Counter(
+                {str(self.terms[t]): int(c) for t, c in zip(by_doc.indices[start:end], by_doc.data[start:end])}
+            )
+        return counts
+
+
+def _clean(doc: dict, fingerprint: str) -> dict:
+    return {**{k: v for k, v in doc.items() if k not in _SKIP_FIELDS}, "fingerprint": fingerprint}
+
+
+def build_snapshot(documents: list, root: str = LOCAL_SEARCH_INDEX_PATH, fingerprint=None, keep: int = 2,
+                   force: bool = False) -> dict:
+    """
+    Будує нову версію snapshot з документів пошукового індексу і перемикає на неї CURRENT.
+    Документи з незмінним fingerprint не токенізуються повторно (терми беруться з попередньої версії);
+    якщо набір fingerprint-ів не змінився — нова версія не створюється.
+    """
+    import numpy as np
+    from scipy import sparse
+    from .answer_cache import doc_fingerprint
+    fingerprint = fingerprint or doc_fingerprint
+    started = time.perf_counter()
+    previous = load_current(root)
+    docs = [_clean(doc, fingerprint(doc)) for doc in documents]
+    fingerprints = [doc["fingerprint"] for doc in docs]
+    stats = {"docs": len(docs), "reused": 0, "tokenized": 0, "removed": 0, "changed": True}
+    if previous is not None:
+        old = previous.doc_term_counts()
+        stats["removed"] = len(set(old) - set(fingerprints))
+        if not force and sorted(old) == sorted(fingerprints):
+            stats.update(changed=False, version=previous.version, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+            return stats
+    else:
+        old = {}
+
+    doc_counts = []
+    for doc in docs:
+        counts = old.get(doc["fingerprint"])
+        if counts is None:
+            counts = Counter(tokenize(document_text(doc)))
+            stats["tokenized"] += 1
+        else:
+            stats["reused"] += 1
+        doc_counts.append(counts)
+
+    terms = np.array(sorted(set().union(*doc_counts)) or [""])
+    term_index = {term: i for i, term in enumerate(terms.tolist())}
+    rows, cols, values = [], [], []
+    for j, counts in enumerate(doc_counts):
+        rows.extend(term_index[term] for term in counts)
+        cols.extend([j] * len(counts))
+        values.extend(counts.values())
+    tf = sparse.csr_matrix((np.array(values, dtype=np.float32), (rows, cols)), shape=(len(terms), len(docs)))
+    tf.sort_indices()
+
+    # BM25 (як у Lucene): idf = ln(1 + (N - df + 0.5) / (df + 0.5)), tf насичується k1 і нормується за довжиною b
+    doc_len = np.asarray(tf.sum(axis=0)).ravel()
+    avgdl = float(doc_len.mean()) if len(docs) else 0.0
+    df = np.diff(tf.indptr)
+    idf = np.log1p((len(docs) - df + 0.5) / (df + 0.5))
+    row_of = np.repeat(np.arange(len(terms)), df)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[tf.indices] / (avgdl or 1.0))
+    weights = (idf[row_of] * tf.data * (BM25_K1 + 1) / (tf.data + norm)).astype(np.float32)
+
+    version = datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%S%fZ")
+    manifest = {"version": version, "docs": len(docs), "terms": int(len(terms)), "avgdl": avgdl,
+                "k1": BM25_K1, "b": BM25_B, "built_at": datetime.now(timezone.utc).isoformat()}
+    target = os.path.join(root, version)
+    staging = target + ".tmp"
+    os.makedirs(staging, exist_ok=True)
+    for name, array in (("terms", terms), ("indptr", tf.indptr.astype(np.int32)), ("indices", tf.indices.astype(np.int32)),
+                        ("weights", weights), ("tf", tf.data.astype(np.float32))):
+        np.save(os.path.join(staging, f"{name}.npy"), array)
+    with open(os.path.join(staging, "docs.json"), "w", encoding="utf-8") as f:
+        json.dump(docs, f, ensure_ascii=False)
+    with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(staging, target)
+    _write_current(root, version)
+    _prune(root, keep)
+    stats.update(version=version, terms=int(len(terms)), elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+    return stats
+
+
+def _write_current(root: str, version: str):
+    tmp = os.path.join(root, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(root, "CURRENT"))
+
+
+def _prune(root: str, keep: int):
+    # Старі версії можуть ще бути замаплені воркерами — лишаємо кілька останніх
+    versions = sorted(name for name in os.listdir(root) if name.startswith("v") and not name.endswith(".tmp"))
+    for name in versions[:-keep]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def current_version(root: str = LOCAL_SEARCH_INDEX_PATH):
+    try:
+        with open(os.path.join(root, "CURRENT"), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_current(root: str = LOCAL_SEARCH_INDEX_PATH):
+    version = current_version(root)
+    return LocalSearchIndex.load(os.path.join(root, version)) if version else None
+
+
+_index = None
+_checked_at = 0.0
+
+
+def get_index():
+    """
+    Активна версія локального індексу для воркера; раз на LOCAL_SEARCH_RELOAD_S перевіряє CURRENT.
+    None, якщо snapshot немає або numpy/scipy недоступні.
+    """
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < LOCAL_SEARCH_RELOAD_S:
+        return _index
+    _checked_at = now
+    try:
+        version = current_version()
+        if version is None:
+            return None
+        if _index is None or _index.version != version:
+            _index = LocalSearchIndex.load(os.path.join(LOCAL_SEARCH_INDEX_PATH, version))
+            logging.info(f"[LocalSearch] Loaded index {version}: {_index.manifest['docs']} docs, {_index.manifest['terms']} terms")
+    except Exception as e:
+        logging.error(f"[LocalSearch] Failed to load index: {e}")
+    return _index
+
+
+def search(query: str, top: int = LOCAL_SEARCH_TOP, min_score: float = LOCAL_SEARCH_MIN_SCORE):
+    """
+    Результат локального індексу або None (індексу немає / нічого достатньо релевантного) — тоді fallback на сервіс.
+    Документи з нормованим score нижче min_score відкидаються; "@search.backend": "local" каже
+    retrieve_context не застосовувати до них відносний поріг від top-score пошукового сервісу.
+    query — лише текст питання й історії, без службових слів шаблону.
+    """
+    index = get_index()
+    if index is None:
+        return None
+    try:
+        result = index.search(query, top)
+    except Exception as e:
+        logging.error(f"[LocalSearch] Search failed: {e}")
+        return None
+    docs = [doc for doc in result["value"] if doc["@search.score"] >= min_score]
+    if not docs:
+        return None
+    return {"value": docs, "@search.backend": "local"}
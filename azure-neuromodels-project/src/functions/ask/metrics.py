@@ -0,0 +1,47 @@
+import math
+import bisect
+from collections import deque
+
+# Межі бакетів гістограми латентності, мс
+DEFAULT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """
+    Гістограма латентності з фіксованими бакетами плюс ковзне вікно останніх
+    вимірів для оцінки перцентилів (p50/p95 тощо).
+    """
+
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS, window: int = 512):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self._window = deque(maxlen=window)
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+        self._window.append(ms)
+
+    def percentile(self, p: float):
+        """
+        Перцентиль (0..100) по ковзному вікну; None, якщо вимірів ще немає.
+        """
+        if not self._window:
+            return None
+        values = sorted(self._window)
+        idx = min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))
+        return values[idx]
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b}" for b in self.buckets_ms] + ["inf"]
+        return {
+            "count": self.total,
+            "avg_ms": round(self.sum_ms / self.total, 1) if self.total else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": dict(zip(labels, self.counts)),
+        }
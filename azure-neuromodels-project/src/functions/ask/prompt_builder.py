@@ -0,0 +1,162 @@
+import os
+import logging
+from typing import List, Tuple
+
+# Бюджети токенів на секції промпта
+HISTORY_TOKEN_BUDGET = int(os.environ.get("PROMPT_HISTORY_TOKENS", "600"))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("PROMPT_SUMMARY_TOKENS", "200"))
+KB_TOKEN_BUDGET = int(os.environ.get("PROMPT_KB_TOKENS", "1500"))
+QUESTION_TOKEN_BUDGET = int(os.environ.get("PROMPT_QUESTION_TOKENS", "300"))
+# Скільки останніх пар максимум показуємо дослівно
+MAX_HISTORY_TURNS = int(os.environ.get("PROMPT_MAX_HISTORY_TURNS", "5"))
+# Згортання в summary — не після кожної відповіді, а коли поза промптом набралось стільки пар або токенів
+SUMMARY_MIN_OVERFLOW_TURNS = int(os.environ.get("PROMPT_SUMMARY_MIN_OVERFLOW_TURNS", "3"))
+SUMMARY_MIN_OVERFLOW_TOKENS = int(os.environ.get("PROMPT_SUMMARY_MIN_OVERFLOW_TOKENS", "400"))
+# Кодування токенізатора для gpt-4o / gpt-4o-mini
+TOKENIZER_ENCODING = os.environ.get("PROMPT_TOKENIZER_ENCODING", "o200k_base")
+
+TURN_SEPARATOR = "\n\n---\n\n"
+
+_encoding = None
+
+
+def get_encoding():
+    """
+    Лінивий токенізатор tiktoken (перше завантаження словника — відчутне, тому один раз на воркер).
+    """
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+        _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return len(get_encoding().encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    tokens = get_encoding().encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return get_encoding().decode(tokens[:max_tokens])
+
+
+def format_turn(question: str, answer: str) -> str:
+    return f"User: {question}\nServantus: {answer}"
+
+
+def budget_signature() -> str:
+    """
+    Рядок із параметрами бюджету — входить у хеш шаблону для кешу відповідей.
+    """
+    return f"{TOKENIZER_ENCODING}:{HISTORY_TOKEN_BUDGET}:{SUMMARY_TOKEN_BUDGET}:{KB_TOKEN_BUDGET}:{QUESTION_TOKEN_BUDGET}:{MAX_HISTORY_TURNS}"
+
+
+def select_history(turns: List[Tuple[str, str]], budget: int = HISTORY_TOKEN_BUDGET) -> List[Tuple[str, str]]:
+    """
+    Вибирає найновіші пари (turns — від найновішої), що вміщаються в бюджет.
+    Повертає їх у хронологічному порядку.
+    """
+    selected = []
+    used = 0
+    for question, answer in turns[:MAX_HISTORY_TURNS]:
+        cost = count_tokens(format_turn(question, answer)) + count_tokens(TURN_SEPARATOR)
+        if used + cost > budget:
+            break
+        selected.append((question, answer))
+        used += cost
+    selected.reverse()
+    return selected
+
+
+def history_overflow(turns: List[dict], budget: int = HISTORY_TOKEN_BUDGET, max_turns: int = MAX_HISTORY_TURNS) -> List[dict]:
+    """
+    Для документа історії (turns у хронологічному порядку) повертає найстаріші пари,
+    які вже не потрапляють у промпт і мають бути згорнуті в rolling summary.
+    """
+    kept = 0
+    used = 0
+    for turn in reversed(turns):
+        cost = count_tokens(format_turn(turn["question"], turn["answer"])) + count_tokens(TURN_SEPARATOR)
+        if kept >= max_turns or used + cost > budget:
+            break
+        kept += 1
+        used += cost
+    return turns[:len(turns) - kept]
+
+
+def summary_due(overflow: List[dict], doc_full: bool = False) -> bool:
+    """
+    Чи час згортати overflow у summary: пар або токенів поза промптом набралось досить.
+    doc_full — документ історії заповнений, і наступна пара витіснить найстарішу незгорнуту.
+    """
+    if not overflow:
+        return False
+    if doc_full or len(overflow) >= SUMMARY_MIN_OVERFLOW_TURNS:
+        return True
+    tokens = sum(count_tokens(format_turn(t["question"], t["answer"])) for t in overflow)
+    return tokens >= SUMMARY_MIN_OVERFLOW_TOKENS
+
+
+def select_docs(docs: List[dict], budget: int = KB_TOKEN_BUDGET) -> List[str]:
+    """
+    Бере фрагменти бази знань за спаданням score, поки вміщаються в бюджет;
+    останній фрагмент обрізається до залишку бюджету.
+    """
+    chunks = []
+    used = 0
+    separator_cost = count_tokens(TURN_SEPARATOR)
+    for doc in sorted(docs, key=lambda d: d.get("@search.score", 0), reverse=True):
+        content = (doc.get("content") or "").strip()
+        if not content:
+            continue
+        separator = separator_cost if chunks else 0
+        remaining = budget - used - separator
+        if remaining <= 0:
+            break
+        cost = count_tokens(content)
+        if cost > remaining:
+            chunks.append(truncate_tokens(content, remaining))
+            break
+        chunks.append(content)
+        used += cost + separator
+    return chunks
+
+
+class Prompt:
+    def __init__(self, text: str, section_tokens: dict):
+        self.text = text
+        self.section_tokens = section_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.section_tokens.values())
+
+
+def build(header: str, question: str, turns: List[Tuple[str, str]], summary: str, docs: List[dict]) -> Prompt:
+    """
+    Збирає промпт з бюджетом токенів для кожної секції: header, summary, history, knowledge base, question.
+    turns — пари (question, answer) від найновішої.
+    """
+    summary = truncate_tokens(summary.strip(), SUMMARY_TOKEN_BUDGET) if summary else ""
+    history = TURN_SEPARATOR.join(format_turn(q, a) for q, a in select_history(turns))
+    kb_chunks = select_docs(docs)
+    question = truncate_tokens(question, QUESTION_TOKEN_BUDGET)
+
+    sections = {"header": header}
+    if summary:
+        sections["summary"] = "[Dialog summary]\n" + summary + "\n\n"
+    if history:
+        sections["history"] = "[Dialog history]\n" + history.strip() + "\n\n"
+    if kb_chunks:
+        sections["knowledge_base"] = "[Knowledge base]\n" + TURN_SEPARATOR.join(kb_chunks).strip() + "\n\n"
+    sections["question"] = f"Customer question: {question}\nServantus's answer:"
+
+    section_tokens = {name: count_tokens(text) for name, text in sections.items()}
+    logging.info(f"[Prompt] tokens={section_tokens} total={sum(section_tokens.values())}")
+    return Prompt("".join(sections.values()), section_tokens)
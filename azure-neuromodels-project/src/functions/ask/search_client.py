@@ -0,0 +1,175 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from .answer_cache import LRUCache
+from .metrics import LatencyHistogram
+from .settings import get_settings
+
+SEARCH_API_VERSION = "2023-07-01-Preview"
+# Таймаут однієї спроби; загальний таймаут етапу пошуку (з повторами) задає ASK_SEARCH_TIMEOUT_S
+SEARCH_REQUEST_TIMEOUT_S = float(os.environ.get("SEARCH_REQUEST_TIMEOUT_S", "2"))
+SEARCH_MAX_RETRIES = int(os.environ.get("SEARCH_MAX_RETRIES", "2"))
+SEARCH_BACKOFF_BASE_S = float(os.environ.get("SEARCH_BACKOFF_BASE_S", "0.2"))
+# Hedging: якщо відповіді немає довше за цей перцентиль латентності — шлемо дубль запиту
+SEARCH_HEDGE_PERCENTILE = float(os.environ.get("SEARCH_HEDGE_PERCENTILE", "95"))
+SEARCH_HEDGE_ENABLED = os.environ.get("SEARCH_HEDGE_ENABLED", "false").lower() == "true"
+# Мінімум вимірів, після якого довіряємо перцентилю для hedging
+SEARCH_HEDGE_MIN_SAMPLES = 50
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL_S = float(os.environ.get("SEARCH_CACHE_TTL_S", "300"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# aiohttp імпортується при створенні першого клієнта: холодний старт і відповіді з кешу
+# чи локального індексу його не потребують
+aiohttp = None
+
+
+def load_sdk():
+    global aiohttp
+    if aiohttp is None:
+        import aiohttp
+
+
+class SearchError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Search service returned {status}: {message}")
+        self.status = status
+
+
+class SearchClient:
+    """
+    Перевикористовуваний клієнт пошукового сервісу: одна aiohttp-сесія з keep-alive,
+    таймаути, повтори з jitter на 429/5xx, опційний hedging і TTL-кеш результатів
+    за фінальним рядком search_query.
+    """
+
+    def __init__(self, endpoint: str, api_key: str, index_name: str, top: int = 3):
+        self.url = f"{endpoint}/indexes/{index_name}/docs/search?api-version={SEARCH_API_VERSION}"
+        self.headers = {"Content-Type": "application/json", "api-key": api_key}
+        self.top = top
+        load_sdk()
+        self.loop = asyncio.get_running_loop()
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=60, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=SEARCH_REQUEST_TIMEOUT_S),
+        )
+        self.metrics = {"requests": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "cache_hits": 0,
+                        "cache_misses": 0, "evictions": 0, "expired": 0, "errors": 0}
+        self.cache = LRUCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL_S, self.metrics)
+        self.latency = LatencyHistogram()
+
+    async def search(self, search_query: str) -> dict:
+        cached = self.cache.get(search_query)
+        if cached is not None:
+            self.metrics["cache_hits"] += 1
+            return cached
+        self.metrics["cache_misses"] += 1
+        started = time.perf_counter()
+        result = await self._hedged(search_query)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.latency.observe(elapsed_ms)
+        self.cache.set(search_query, result)
+        logging.info(f"[Search] {elapsed_ms:.0f} ms, p95={self.latency.percentile(95)}, metrics={self.metrics}")
+        return result
+
+    async def _hedged(self, search_query: str) -> dict:
+        threshold_ms = self.latency.percentile(SEARCH_HEDGE_PERCENTILE)
+        if not SEARCH_HEDGE_ENABLED or threshold_ms is None or self.latency.total < SEARCH_HEDGE_MIN_SAMPLES:
+            return await self._with_retries(search_query)
+        primary = asyncio.ensure_future(self._with_retries(search_query))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=threshold_ms / 1000)
+            if done:
+                return primary.result()
+            self.metrics["hedged"] += 1
+            hedge = asyncio.ensure_future(self._with_retries(search_query))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.metrics["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Скасування виклику (таймаут ask, відключення клієнта) не повинно лишати запити у фоні
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def fetch_page(self, skip: int, page_size: int) -> list:
+        """
+        Сторінка всіх документів індексу (search="*") — для синхронізації локального індексу, минаючи кеш.
+        """
+        result = await self._with_retries("*", top=page_size, skip=skip)
+        return result.get("value", [])
+
+    async def _with_retries(self, search_query: str, **extra) -> dict:
+        payload = {"search": search_query, "top": self.top, **extra}
+        for attempt in range(SEARCH_MAX_RETRIES + 1):
+            self.metrics["requests"] += 1
+            try:
+                async with self.session.post(self.url, headers=self.headers, json=payload) as response:
+                    if response.status < 400:
+                        return await response.json()
+                    message = await response.text()
+                    if response.status not in RETRY_STATUSES or attempt == SEARCH_MAX_RETRIES:
+                        self.metrics["errors"] += 1
+                        raise SearchError(response.status, message[:200])
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == SEARCH_MAX_RETRIES:
+                    self.metrics["errors"] += 1
+                    raise
+                retry_after = None
+            self.metrics["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: str = None) -> float:
+        # Full jitter: випадкова пауза в межах експоненційного вікна
+        delay = random.uniform(0, SEARCH_BACKOFF_BASE_S * (2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return min(delay, SEARCH_REQUEST_TIMEOUT_S)
+
+    def stats(self) -> dict:
+        return {**self.metrics, "latency": self.latency.snapshot()}
+
+    async def close(self):
+        await self.session.close()
+
+
+_client = None
+
+
+def get_client() -> SearchClient:
+    """
+    Повертає клієнт пошуку для поточного event loop (aiohttp-сесія прив'язана до loop).
+    """
+    global _client
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.loop is not loop or _client.session.closed:
+        settings = get_settings()
+        _client = SearchClient(settings.search_endpoint, settings.search_api_key, settings.search_index)
+    return _client
+
+
+async def close():
+    """
+    Закриває клієнт, якщо його створено (для CLI-скриптів); сесію заради закриття не відкриває.
+    """
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
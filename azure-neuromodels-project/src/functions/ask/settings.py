@@ -0,0 +1,53 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class AskSettings:
+    """
+    Налаштування функції ask: підключення і таймаути етапів (секунди).
+    Читаються з оточення один раз на воркер (get_settings); розміри кешів лишаються константами модулів.
+    """
+    openai_api_key: str
+    cosmos_endpoint: str
+    cosmos_key: str
+    cosmos_database: str
+    cosmos_container: str
+    search_endpoint: str
+    search_api_key: str
+    search_index: str
+    history_timeout_s: float = 2.0
+    search_timeout_s: float = 5.0
+    llm_timeout_s: float = 30.0
+    summary_timeout_s: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> "AskSettings":
+        return cls(
+            openai_api_key=os.environ.get("OPENAI_API_KEY", ""),
+            cosmos_endpoint=os.environ.get("COSMOSDB_ENDPOINT", ""),
+            cosmos_key=os.environ.get("COSMOSDB_KEY", ""),
+            cosmos_database=os.environ.get("COSMOSDB_DATABASE", ""),
+            cosmos_container=os.environ.get("COSMOSDB_CONTAINER", ""),
+            search_endpoint=os.environ.get("SEARCH_SERVICE_ENDPOINT", ""),
+            search_api_key=os.environ.get("SEARCH_API_KEY", ""),
+            search_index=os.environ.get("SEARCH_INDEX_NAME", ""),
+            history_timeout_s=float(os.environ.get("ASK_HISTORY_TIMEOUT_S", "2")),
+            search_timeout_s=float(os.environ.get("ASK_SEARCH_TIMEOUT_S", "5")),
+            llm_timeout_s=float(os.environ.get("ASK_LLM_TIMEOUT_S", "30")),
+            summary_timeout_s=float(os.environ.get("ASK_SUMMARY_TIMEOUT_S", "10")),
+        )
+
+    @property
+    def cosmos_configured(self) -> bool:
+        return all([self.cosmos_endpoint, self.cosmos_key, self.cosmos_database, self.cosmos_container])
+
+
+_settings = None
+
+
+def get_settings() -> AskSettings:
+    global _settings
+    if _settings is None:
+        _settings = AskSettings.from_env()
+    return _settings
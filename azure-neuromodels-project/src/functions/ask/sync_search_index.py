@@ -0,0 +1,52 @@
+"""
+Синхронізує локальний BM25-індекс (local_index.py) з пошуковим сервісом.
+
+Вичитує всі документи індексу і, якщо набір документів змінився, будує нову версію snapshot
+(незмінені документи не токенізуються повторно) та атомарно перемикає на неї CURRENT.
+Запуск з каталогу src/functions (змінні SEARCH_* як для функції; потрібні numpy, scipy):
+    python -m ask.sync_search_index [--output PATH] [--page-size N] [--force]
+"""
+import sys
+import json
+import asyncio
+import logging
+import argparse
+from . import local_index
+from . import search_client
+
+
+async def fetch_documents(page_size: int) -> list:
+    client = search_client.get_client()
+    try:
+        documents, skip = [], 0
+        while True:
+            page = await client.fetch_page(skip, page_size)
+            documents.extend(page)
+            if len(page) < page_size:
+                return documents
+            skip += page_size
+    finally:
+        await client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the local search index snapshot from the search service.")
+    parser.add_argument("--output", default=local_index.LOCAL_SEARCH_INDEX_PATH, help="Snapshot root directory")
+    parser.add_argument("--page-size", type=int, default=1000, help="Documents per search request")
+    parser.add_argument("--keep", type=int, default=2, help="Snapshot versions to keep")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if no document changed")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    documents = asyncio.run(fetch_documents(args.page_size))
+    logging.info(f"[SyncIndex] Fetched {len(documents)} documents from the search service")
+    if not documents:
+        logging.error("[SyncIndex] Search service returned no documents, keeping the current snapshot")
+        return 1
+    stats = local_index.build_snapshot(documents, args.output, keep=args.keep, force=args.force)
+    print(json.dumps(stats, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+
+
+class Trace:
+    """
+    Легкий трейсинг одного запиту: час кожного етапу (cosmos_enqueue, history, search, llm) і total, мс.
+    Значення пишуться в meta подій, а звідти конвеєр sentiment відправляє їх у Kusto як рядки latency.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages_ms = {}
+
+    def record(self, stage: str, ms: float, accumulate: bool = False):
+        if accumulate:
+            ms += self.stages_ms.get(stage, 0.0)
+        self.stages_ms[stage] = round(ms, 1)
+
+    @contextmanager
+    def stage(self, name: str, accumulate: bool = False):
+        started = time.perf_counter()
+        cancelled = False
+        try:
+            yield
+        except asyncio.CancelledError:
+            # Скасований етап (напр. непотрібний спекулятивний пошук) не рахуємо
+            cancelled = True
+            raise
+        finally:
+            if not cancelled:
+                self.record(name, (time.perf_counter() - started) * 1000, accumulate)
+
+    async def timed(self, name: str, coro):
+        """
+        Обгортка для корутин, що виконуються паралельно з іншими етапами.
+        """
+        with self.stage(name):
+            return await coro
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def snapshot(self) -> dict:
+        return {**self.stages_ms, "total": self.total_ms()}
+
+    def log(self, dialog_id: str):
+        logging.info(f"[Trace] dialog_id={dialog_id} stages_ms={self.snapshot()}")
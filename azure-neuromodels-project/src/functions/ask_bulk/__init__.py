@@ -0,0 +1,38 @@
+"""
+POST /api/ask/bulk — bulk-режим ask (див. ask/bulk.py): JSON-масив, {"questions": [...]} або JSON lines,
+відповідь — NDJSON з результатом на кожне унікальне питання і summary останнім рядком.
+Опції concurrency і cache приймаються в тілі або query string.
+Не більше ASK_BULK_HTTP_MAX_QUESTIONS питань за запит; більші прогони — CLI python -m ask.bulk.
+"""
+import json
+import logging
+import importlib
+import azure.functions as func
+
+# Хост завантажує функції як __app__.<папка>: bulk має ділити з ask той самий екземпляр пакета
+# (admission controller, singleflight, клієнти), а не імпортувати власну копію `ask`
+_app_package = __name__.rpartition(".")[0]
+bulk = importlib.import_module(f"{_app_package}.ask.bulk" if _app_package else "ask.bulk")
+
+
+def error_response(message: str, status_code: int) -> func.HttpResponse:
+    return func.HttpResponse(json.dumps({"error": message}), status_code=status_code, mimetype="application/json")
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        items, options = bulk.load_payload(req.get_body().decode("utf-8"))
+        items = bulk.parse_items(items, options.get("user_id") or req.params.get("user_id"))
+        concurrency, cache_mode = bulk.parse_options(options, req.params)
+    except (UnicodeDecodeError, ValueError) as e:
+        return error_response(str(e), 400)
+    if len(items) > bulk.ASK_BULK_HTTP_MAX_QUESTIONS:
+        return error_response(
+            f"Too many questions: {len(items)} > {bulk.ASK_BULK_HTTP_MAX_QUESTIONS}; "
+            "split the batch or run larger ones with the CLI (python -m ask.bulk)", 413
+        )
+    logging.info(f"[Bulk] {len(items)} questions, concurrency={concurrency}, cache={cache_mode}")
+    # Класична модель (function.json) буферизує тіло, тож рядки збираються в одне тіло
+    # у порядку завершення; для інкрементальної доставки — CLI python -m ask.bulk
+    lines = [json.dumps(line, ensure_ascii=False) + "\n" async for line in bulk.run_bulk(items, concurrency, cache_mode)]
+    return func.HttpResponse("".join(lines), mimetype="application/x-ndjson", headers={"Cache-Control": "no-cache"})
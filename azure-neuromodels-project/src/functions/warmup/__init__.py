@@ -0,0 +1,83 @@
+"""
+Прогрів воркера: імпортує SDK і створює спільні клієнти/з'єднання, які інакше з'являються
+лише на першому запиті (Cosmos, пошук, OpenAI, токенізатор, локальні індекси, Kusto).
+Викликається після деплою/scale-out (GET /api/warmup?targets=ask,proxy); кожен крок незалежний,
+помилка одного не зупиняє решту. Усі функції застосунку виконуються в одному воркері,
+тож прогріте тут перевикористовують ask, analyze_sentiment і analytics_proxy.
+"""
+import json
+import time
+import asyncio
+import logging
+import importlib
+import azure.functions as func
+
+WARMUP_TARGETS = ("ask", "sentiment", "proxy")
+
+
+def function_module(name: str):
+    """
+    Модуль іншої функції застосунку — той самий екземпляр, який завантажив хост.
+    Воркер імпортує функції як __app__.<папка>, а `import ask` створив би другу копію пакета
+    з власними клієнтами, і прогрів пройшов би повз них. Поза хостом (benchmarks, тести) — звичайний імпорт.
+    """
+    app_package = __name__.rpartition(".")[0]
+    return importlib.import_module(f"{app_package}.{name}" if app_package else name)
+
+
+async def warm_ask() -> dict:
+    ask = function_module("ask")
+    container = await ask.cosmos_pool.get_container()
+    ask.search_client.get_client()
+    ask.get_openai_client()
+    ask.prompt_builder.get_encoding()
+    index = ask.local_index.get_index() if ask.local_index.SEARCH_BACKEND != "remote" else None
+    ask.answer_cache.get_cache()
+    return {"cosmos": container is not None, "local_index": index.version if index is not None else None}
+
+
+async def warm_sentiment() -> dict:
+    core = function_module("analyze_sentiment.analyze_sentiment_core")
+    kusto_ingest = function_module("analyze_sentiment.kusto_ingest")
+    sentiment_backend = function_module("analyze_sentiment.sentiment_backend")
+    core.load_sdk()
+    ingestor = await asyncio.to_thread(kusto_ingest.get_ingestor)
+    model = sentiment_backend.get_local_model() if sentiment_backend.SENTIMENT_BACKEND != "cloud" else None
+    return {"kusto_ingest": ingestor is not None, "local_model": model is not None}
+
+
+async def warm_proxy() -> dict:
+    # Пакет реекспортує функцію main, тож модуль беремо через import_module
+    proxy = function_module("analytics_proxy.main")
+    await asyncio.to_thread(proxy.get_kusto_client)
+    return {"kusto": True}
+
+
+STEPS = {"ask": warm_ask, "sentiment": warm_sentiment, "proxy": warm_proxy}
+
+
+async def run_step(name: str) -> dict:
+    started = time.perf_counter()
+    try:
+        result = {"ok": True, **await STEPS[name]()}
+    except Exception as e:
+        logging.error(f"[Warmup] {name} failed: {e}")
+        result = {"ok": False, "error": str(e)}
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    requested = req.params.get("targets")
+    targets = [t.strip() for t in requested.split(",") if t.strip()] if requested else list(WARMUP_TARGETS)
+    unknown = [t for t in targets if t not in STEPS]
+    if unknown:
+        return func.HttpResponse(
+            json.dumps({"error": f"Unknown targets: {', '.join(unknown)}", "available": list(STEPS)}),
+            status_code=400, mimetype="application/json"
+        )
+    started = time.perf_counter()
+    results = dict(zip(targets, await asyncio.gather(*(run_step(t) for t in targets))))
+    body = {"results": results, "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+    logging.info(f"[Warmup] {body}")
+    return func.HttpResponse(json.dumps(body, ensure_ascii=False), status_code=200, mimetype="application/json")
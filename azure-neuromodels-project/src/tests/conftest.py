@@ -0,0 +1,23 @@
+import os
+import sys
+import importlib.util
+import importlib.machinery
+
+import pytest
+
+# Як і в benchmarks: модулі функцій імпортуються з src/functions за назвою папки
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "functions")
+sys.path.insert(0, FUNCTIONS_DIR)
+
+
+@pytest.fixture
+def host_app(monkeypatch):
+    """
+    Пакет __app__, як його створює Python-воркер Functions: функції імпортуються як __app__.<папка>.
+    """
+    spec = importlib.machinery.ModuleSpec("__app__", None, is_package=True)
+    spec.submodule_search_locations = [FUNCTIONS_DIR]
+    monkeypatch.setitem(sys.modules, "__app__", importlib.util.module_from_spec(spec))
+    yield
+    for name in [name for name in sys.modules if name.startswith("__app__.")]:
+        del sys.modules[name]
@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+
+from ask import admission
+from ask.admission import AdmissionController, Overloaded, Singleflight
+
+
+def make_controller(**kwargs):
+    options = {"enabled": True, "initial_limit": 2, "min_limit": 1, "max_limit": 8, "queue_timeout_s": 1.0, "max_queue": 10}
+    return AdmissionController(**{**options, **kwargs})
+
+
+def test_requests_over_the_limit_wait_in_fifo_order():
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire()
+        await controller.acquire()
+        order = []
+
+        async def waiter(name):
+            await controller.acquire()
+            order.append(name)
+
+        waiters = [asyncio.ensure_future(waiter(name)) for name in ("a", "b")]
+        await asyncio.sleep(0.01)
+        assert controller.waiting == 2 and order == []
+        await controller.release()
+        await asyncio.sleep(0.01)
+        await controller.release()
+        await asyncio.gather(*waiters)
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+    assert order == ["a", "b"]
+    assert controller.in_flight == 2
+    assert (controller.metrics["admitted"], controller.metrics["queued"], controller.metrics["max_queue_depth"]) == (4, 2, 2)
+
+
+def test_queue_timeout_sheds_with_retry_after():
+    async def scenario():
+        controller = make_controller(initial_limit=1, queue_timeout_s=0.02)
+        await controller.acquire()
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire()
+        return controller, shed.value
+
+    controller, error = asyncio.run(scenario())
+    assert error.reason == "timeout" and error.retry_after >= 1
+    assert controller.waiting == 0 and controller.metrics["shed_timeout"] == 1
+    assert controller.report()["shed"] == 1
+    # report() віддає скинуті запити один раз
+    assert controller.report()["shed"] == 0
+
+
+def test_full_queue_sheds_immediately():
+    async def scenario():
+        controller = make_controller(initial_limit=1, max_queue=1)
+        await controller.acquire()
+        queued = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire()
+        queued.cancel()
+        return controller, shed.value
+
+    controller, error = asyncio.run(scenario())
+    assert error.reason == "queue_full"
+    assert controller.metrics["shed_queue_full"] == 1
+
+
+def test_throttling_halves_the_limit_down_to_the_minimum():
+    async def scenario():
+        return make_controller(initial_limit=8, min_limit=2)
+
+    controller = asyncio.run(scenario())
+    controller.on_throttled()
+    assert int(controller.limit) == 4
+    for _ in range(5):
+        controller.on_throttled()
+    assert int(controller.limit) == 2
+    assert controller.metrics["throttled"] == 6
+
+
+def test_limit_grows_with_stable_latency_and_shrinks_when_it_degrades():
+    async def scenario():
+        return make_controller(initial_limit=4, max_limit=5)
+
+    controller = asyncio.run(scenario())
+    for _ in range(4):
+        controller.on_latency(100)
+    assert int(controller.limit) == 5
+    for _ in range(10):
+        controller.on_latency(100)
+    assert int(controller.limit) == 5
+    # Медіана вікна перевищила baseline більш ніж у ASK_ADMISSION_LATENCY_TOLERANCE раз
+    for _ in range(200):
+        controller.on_latency(1000)
+    assert controller.limit < 5 and controller.metrics["decreases"] >= 1
+
+
+def test_disabled_controller_admits_everything():
+    async def scenario():
+        controller = make_controller(enabled=False, initial_limit=1)
+        for _ in range(5):
+            await controller.acquire()
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller.in_flight == 5 and controller.metrics["queued"] == 0
+
+
+def test_get_controller_is_per_event_loop(monkeypatch):
+    monkeypatch.setattr(admission, "_controller", None)
+
+    async def controller():
+        return admission.get_controller(), admission.get_controller()
+
+    first, same = asyncio.run(controller())
+    second, _ = asyncio.run(controller())
+    assert first is same and second is not first
+
+
+def test_singleflight_shares_one_call_between_concurrent_callers():
+    flight = Singleflight("test", enabled=True)
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("key", factory) for _ in range(3)))
+        # Після завершення ключ звільнено: наступний виклик іде в upstream знову
+        results.append(await flight.do("key", factory))
+        return results
+
+    assert asyncio.run(scenario()) == ["result"] * 4
+    assert len(calls) == 2
+    assert flight.metrics == {"calls": 4, "shared": 2}
+
+
+def test_singleflight_shares_errors_and_survives_a_waiter_timeout():
+    flight = Singleflight("test", enabled=True)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream failed")
+
+    async def scenario():
+        impatient = asyncio.ensure_future(asyncio.wait_for(flight.do("key", failing), 0.01))
+        patient = asyncio.ensure_future(flight.do("key", failing))
+        with pytest.raises(asyncio.TimeoutError):
+            await impatient
+        # Таймаут одного очікувача не скасував спільний виклик для інших
+        with pytest.raises(RuntimeError, match="upstream failed"):
+            await patient
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+
+
+def test_disabled_singleflight_calls_every_time():
+    flight = Singleflight("test", enabled=False)
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        return len(calls)
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("key", factory) for _ in range(3)))
+
+    assert sorted(asyncio.run(scenario())) == [1, 2, 3]
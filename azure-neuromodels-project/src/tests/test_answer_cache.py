@@ -0,0 +1,34 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("azure.cosmos")
+
+from ask import answer_cache  # noqa: E402
+
+
+def test_sqlite_store_runs_off_event_loop(tmp_path, monkeypatch):
+    store = answer_cache.SqliteStore(str(tmp_path / "answers.sqlite"), ttl_s=60, max_entries=1, metrics={"evictions": 0})
+    threads = set()
+    execute = store._connect().execute
+
+    class TracingConnection:
+        def execute(self, *args):
+            threads.add(threading.get_ident())
+            return execute(*args)
+
+        def commit(self):
+            pass
+
+    store._conn = TracingConnection()
+
+    async def run():
+        await store.set("a", {"answer": "1"})
+        await store.set("b", {"answer": "2"})
+        return threading.get_ident(), await store.get("a"), await store.get("b")
+
+    loop_thread, evicted, kept = asyncio.run(run())
+    assert (evicted, kept) == (None, {"answer": "2"})
+    assert store.metrics["evictions"] == 1
+    assert threads and loop_thread not in threads
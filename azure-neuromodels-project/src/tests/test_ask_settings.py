@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import FUNCTIONS_DIR
+
+pytest.importorskip("azure.functions")
+pytest.importorskip("azure.cosmos")
+
+from ask.settings import AskSettings  # noqa: E402
+
+
+def test_stage_timeouts_come_from_settings(monkeypatch):
+    monkeypatch.setenv("ASK_HISTORY_TIMEOUT_S", "0.5")
+    monkeypatch.setenv("ASK_SEARCH_TIMEOUT_S", "1.5")
+    monkeypatch.delenv("ASK_LLM_TIMEOUT_S", raising=False)
+    settings = AskSettings.from_env()
+    assert (settings.history_timeout_s, settings.search_timeout_s, settings.llm_timeout_s) == (0.5, 1.5, 30.0)
+
+
+def test_ask_import_does_not_load_aiohttp():
+    code = "import sys; import ask; print('aiohttp' in sys.modules)"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([FUNCTIONS_DIR] + sys.path)}
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+
+@pytest.mark.parametrize("module", ["ask", "ask_bulk", "analyze_sentiment.analyze_sentiment_core"])
+def test_entry_modules_do_not_load_cosmos(module):
+    code = f"import sys; import {module}; print('azure.cosmos' in sys.modules)"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([FUNCTIONS_DIR] + sys.path)}
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
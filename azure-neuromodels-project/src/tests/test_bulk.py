@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("azure.functions")
+pytest.importorskip("azure.cosmos")
+
+from ask import bulk, search_client  # noqa: E402
+
+
+def test_parse_options_defaults():
+    assert bulk.parse_options({}, {}) == (bulk.ASK_BULK_CONCURRENCY, "use")
+
+
+def test_parse_options_body_wins_over_query():
+    assert bulk.parse_options({"concurrency": 2, "cache": "off"}, {"concurrency": "5", "cache": "refresh"}) == (2, "off")
+    assert bulk.parse_options({}, {"concurrency": "5", "cache": "refresh"}) == (5, "refresh")
+
+
+def test_parse_options_caps_concurrency():
+    assert bulk.parse_options({"concurrency": 10 ** 6})[0] == bulk.ASK_BULK_MAX_CONCURRENCY
+
+
+@pytest.mark.parametrize("options, params", [
+    ({"concurrency": 0}, {}),
+    ({"concurrency": -3}, {}),
+    ({}, {"concurrency": "0"}),
+    ({"concurrency": "many"}, {}),
+    ({"cache": ""}, {}),
+])
+def test_parse_options_rejects_invalid_values(options, params):
+    with pytest.raises(ValueError):
+        bulk.parse_options(options, params)
+
+
+def test_search_client_close_does_not_create_a_client(monkeypatch):
+    monkeypatch.setattr(search_client, "_client", None)
+    monkeypatch.setattr(search_client, "SearchClient", lambda *args: pytest.fail("client created on close"))
+    asyncio.run(search_client.close())
+    assert search_client._client is None
+
+
+class RecordingSink:
+    def __init__(self):
+        self.events = []
+
+    async def write_many(self, events):
+        self.events.extend(events)
+        return {"written": len(events), "failed": 0}
+
+
+def test_run_bulk_flags_every_event(monkeypatch):
+    sink = RecordingSink()
+    monkeypatch.setattr(bulk.event_sink, "get_sink", lambda: sink)
+
+    async def answer_job(job, cache_mode, events):
+        events.append({"step": "question", "meta": {}})
+        events.append({"step": "search_result"})
+        events.append({"step": "answer", "meta": {"cache_hit": False}})
+        return {"status": "ok", "latency_ms": 1.0}
+
+    monkeypatch.setattr(bulk, "answer_job", answer_job)
+
+    async def collect():
+        return [line async for line in bulk.run_bulk(bulk.parse_items(["a", "b"]), concurrency=2)]
+
+    lines = asyncio.run(collect())
+    assert lines[-1]["events"] == {"written": 6, "failed": 0}
+    assert len(sink.events) == 6 and all(event["meta"]["bulk"] is True for event in sink.events)
+
+
+def test_http_route_caps_batch_size(monkeypatch):
+    import azure.functions as func
+    import ask_bulk
+
+    monkeypatch.setattr(bulk, "ASK_BULK_HTTP_MAX_QUESTIONS", 2)
+    req = func.HttpRequest("POST", "/api/ask/bulk", body=json.dumps(["a", "b", "c"]).encode("utf-8"))
+    response = asyncio.run(ask_bulk.main(req))
+    assert response.status_code == 413
+    assert "python -m ask.bulk" in response.get_body().decode("utf-8")
@@ -0,0 +1,182 @@
+"""
+Change feed сентименту проти справжнього azure-cosmos з підміненим HTTP-транспортом:
+continuation token (непрозорий, формат залежить від версії SDK) продовжує feed з місця зупинки,
+а checkpoint не рухається після невдалого batch-у.
+"""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("azure.cosmos")
+
+from azure.core.pipeline.transport import AsyncHttpResponse, AsyncHttpTransport  # noqa: E402
+from azure.cosmos.aio import CosmosClient  # noqa: E402
+
+from analyze_sentiment import analyze_sentiment_core as core  # noqa: E402
+from analyze_sentiment import change_feed, settings  # noqa: E402
+
+ENDPOINT = "https://test.documents.azure.com:443/"
+PAGE_SIZE = 2
+CONTAINER_PROPERTIES = {"id": "messages", "_rid": "bXNncw==", "_self": "dbs/ZGI=/colls/bXNncw==/",
+                        "partitionKey": {"paths": ["/user_id"], "kind": "Hash"}}
+PARTITION_KEY_RANGE = {"id": "0", "minInclusive": "", "maxExclusive": "FF", "parents": []}
+
+
+class FakeResponse(AsyncHttpResponse):
+    def __init__(self, request, status, body=None, headers=None):
+        super().__init__(request, None)
+        self.status_code = status
+        self.headers = headers or {}
+        self.content_type = "application/json"
+        self._body = json.dumps(body).encode() if body is not None else b""
+
+    def body(self):
+        return self._body
+
+
+class FakeCosmosTransport(AsyncHttpTransport):
+    """
+    Мінімальний Cosmos: change feed контейнера повідомлень з одним partition key range
+    (ETag = _ts останнього документа сторінки, If-None-Match — звідки продовжувати),
+    властивості контейнера і його pkranges (потрібні новішим SDK) і контейнер leases для checkpoint-а.
+    """
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.leases = {}
+        self.feed_requests = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def send(self, request, **kwargs):
+        headers = {k.lower(): v for k, v in request.headers.items()}
+        path = request.url.split(":443", 1)[-1]
+        if path.rstrip("/") == "/dbs/db/colls/messages":
+            return FakeResponse(request, 200, CONTAINER_PROPERTIES)
+        if path.rstrip("/").endswith("/pkranges"):
+            if headers.get("if-none-match"):
+                return FakeResponse(request, 304, headers={"etag": "1"})
+            return FakeResponse(request, 200, {"PartitionKeyRanges": [PARTITION_KEY_RANGE], "_count": 1},
+                                {"etag": "1"})
+        if (headers.get("a-im") or "").lower() == "incremental feed":
+            since = int(headers.get("if-none-match") or 0)
+            self.feed_requests.append(headers.get("if-none-match"))
+            page = [d for d in self.docs if d["_ts"] > since][:PAGE_SIZE]
+            if not page:
+                return FakeResponse(request, 304, headers={"etag": str(since)})
+            return FakeResponse(request, 200, {"Documents": page, "_count": len(page)}, {"etag": str(page[-1]["_ts"])})
+        if path.startswith("/dbs/db/colls/leases/docs"):
+            if request.method == "POST":
+                doc = json.loads(request.body)
+                self.leases[doc["id"]] = doc
+                return FakeResponse(request, 201, doc)
+            doc = self.leases.get(path.rstrip("/").rsplit("/", 1)[-1])
+            if doc is None:
+                return FakeResponse(request, 404, {"code": "NotFound", "message": "not found"})
+            return FakeResponse(request, 200, doc)
+        # Запит властивостей акаунта при відкритті клієнта
+        return FakeResponse(request, 200, {"id": "test", "writableLocations": [], "readableLocations": []})
+
+
+def make_docs(count):
+    return [{"id": f"m{i}", "step": "question", "content": f"question {i}", "_ts": i} for i in range(1, count + 1)]
+
+
+def test_continuation_token_round_trip():
+    transport = FakeCosmosTransport(make_docs(5))
+
+    async def run():
+        async with CosmosClient(ENDPOINT, "a2V5", transport=transport) as client:
+            container = client.get_database_client("db").get_container_client("messages")
+            first = []
+            async for items, token in change_feed.iter_change_pages(container, None, PAGE_SIZE):
+                first.append(([d["id"] for d in items], token))
+                break
+            resumed = []
+            async for items, token in change_feed.iter_change_pages(container, first[0][1], PAGE_SIZE):
+                resumed.append(([d["id"] for d in items], token))
+            return first, resumed
+
+    first, resumed = asyncio.run(run())
+    # Token непрозорий (ETag у 4.7.x, base64-стан у новіших SDK), але продовжує з ETag першої сторінки
+    assert [ids for ids, _ in first] == [["m1", "m2"]]
+    assert [ids for ids, _ in resumed] == [["m3", "m4"], ["m5"]]
+    assert all(isinstance(token, str) and token for _, token in first + resumed)
+    assert transport.feed_requests[1] == "2"
+
+
+@pytest.fixture
+def sentiment_env(monkeypatch):
+    for name, value in {
+        "COSMOSDB_ENDPOINT": ENDPOINT,
+        "COSMOSDB_KEY": "a2V5",
+        "COSMOSDB_DATABASE": "db",
+        "COSMOSDB_CONTAINER": "messages",
+        "TEXT_ANALYTICS_ENDPOINT": "https://test.cognitiveservices.azure.com/",
+        "TEXT_ANALYTICS_KEY": "key",
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(settings, "_settings", None)
+    monkeypatch.setattr(core, "ingest_data_to_kusto", lambda records, flush=False: None)
+    monkeypatch.setattr(core, "spool_depth_record", lambda: {"metric": "spool_depth_bytes", "value": 0})
+
+
+def run_change_feed(monkeypatch, transport, fail_on_batch=None):
+    monkeypatch.setattr(core, "CosmosClient", lambda url, key: CosmosClient(url, key, transport=transport))
+    # Text Analytics сюди не доходить (analyze_items підмінено), тож load_sdk() не має його імпортувати
+    monkeypatch.setattr(core, "TextAnalyticsClient", object)
+    monkeypatch.setattr(core, "AzureKeyCredential", object)
+    batches = []
+
+    async def fake_analyze_items(container, items):
+        batches.append([item["id"] for item in items])
+        if len(batches) == fail_on_batch:
+            return {"processed": 0}
+        return {"processed": len(items)}
+
+    monkeypatch.setattr(core, "analyze_items", fake_analyze_items)
+    summary = asyncio.run(core.process_change_feed(time_budget_s=60, batch_size=PAGE_SIZE))
+    return summary, batches
+
+
+def test_checkpoint_advances_after_each_batch(sentiment_env, monkeypatch):
+    transport = FakeCosmosTransport(make_docs(5))
+    summary, batches = run_change_feed(monkeypatch, transport)
+    assert batches == [["m1", "m2"], ["m3", "m4"], ["m5"]]
+    assert summary["caught_up"] is True
+    assert transport.leases[change_feed.CHECKPOINT_ID]["last_ts"] == 5
+
+    # Наступний запуск продовжує з checkpoint-а: лише нові зміни
+    transport.docs = make_docs(7)
+    summary, batches = run_change_feed(monkeypatch, transport)
+    assert batches == [["m6", "m7"]]
+
+
+def test_failed_flush_keeps_previous_checkpoint(sentiment_env, monkeypatch):
+    transport = FakeCosmosTransport(make_docs(6))
+    summary, batches = run_change_feed(monkeypatch, transport, fail_on_batch=2)
+    assert batches == [["m1", "m2"], ["m3", "m4"]]
+    assert summary["caught_up"] is False
+    # Сторінка 2 не записалась — checkpoint лишається на сторінці 1, наступний запуск прочитає її знову
+    assert transport.leases[change_feed.CHECKPOINT_ID]["last_ts"] == 2
+
+    summary, batches = run_change_feed(monkeypatch, transport)
+    assert batches == [["m3", "m4"], ["m5", "m6"]]
+    assert transport.leases[change_feed.CHECKPOINT_ID]["last_ts"] == 6
+
+
+def test_bulk_events_are_not_pending():
+    item = {"step": "question", "content": "Як подати заявку?", "meta": {}}
+    assert change_feed.is_pending_message(item)
+    assert not change_feed.is_pending_message({**item, "meta": {"bulk": True}})
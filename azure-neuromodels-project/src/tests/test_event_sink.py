@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("azure.cosmos")
+
+from ask import cosmos_pool  # noqa: E402
+from ask.event_sink import EventSink  # noqa: E402
+
+
+class FakeContainer:
+    def __init__(self, batch_error=None, failing_ids=()):
+        self.batches = []
+        self.upserts = []
+        self.batch_error = batch_error
+        self.failing_ids = set(failing_ids)
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        if self.batch_error is not None:
+            raise self.batch_error
+        self.batches.append((partition_key, [args[0]["id"] for _, args in batch_operations]))
+
+    async def upsert_item(self, event):
+        if event["id"] in self.failing_ids:
+            raise RuntimeError("write failed")
+        self.upserts.append(event["id"])
+
+
+@pytest.fixture
+def container(monkeypatch):
+    holder = {"container": FakeContainer()}
+
+    async def get_container(container_name=None):
+        value = holder["container"]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    async def invalidate(error=None):
+        pass
+
+    monkeypatch.setattr(cosmos_pool, "get_container", get_container)
+    monkeypatch.setattr(cosmos_pool, "invalidate", invalidate)
+    return holder
+
+
+def events(count, users=("u1", "u2")):
+    return [{"id": f"e{i}", "user_id": users[i % len(users)]} for i in range(count)]
+
+
+def test_events_are_written_in_per_partition_batches(container):
+    async def run():
+        sink = EventSink(batch_size=4, flush_interval=60)
+        for event in events(6):
+            assert await sink.put(event)
+        await sink.close()
+        return sink
+
+    sink = asyncio.run(run())
+    batches = container["container"].batches
+    assert sorted(pk for pk, _ in batches) == ["u1", "u1", "u2", "u2"]
+    assert sorted(i for _, ids in batches for i in ids) == [f"e{i}" for i in range(6)]
+    assert all(len(ids) <= 4 for _, ids in batches)
+    assert sink.stats()["flushed"] == 6 and sink.stats()["pending"] == 0
+
+
+def test_full_batch_flushes_before_interval(container):
+    async def run():
+        sink = EventSink(batch_size=3, flush_interval=60)
+        for event in events(3, users=("u1",)):
+            await sink.put(event)
+        for _ in range(50):
+            if sink.counters["flushed"] == 3:
+                break
+            await asyncio.sleep(0.01)
+        flushed = sink.counters["flushed"]
+        await sink.close()
+        return flushed
+
+    assert asyncio.run(run()) == 3
+
+
+def test_failed_batch_falls_back_to_single_writes(container):
+    container["container"] = FakeContainer(batch_error=RuntimeError("batch rejected"), failing_ids={"e1"})
+
+    async def run():
+        sink = EventSink(batch_size=10, flush_interval=60)
+        for event in events(3, users=("u1",)):
+            await sink.put(event)
+        await sink.close()
+        return sink
+
+    sink = asyncio.run(run())
+    assert sorted(container["container"].upserts) == ["e0", "e2"]
+    assert (sink.counters["flushed"], sink.counters["failed"]) == (2, 1)
+
+
+def test_unavailable_cosmos_requeues_events(container):
+    container["container"] = ConnectionError("cosmos unavailable")
+
+    async def run():
+        sink = EventSink(batch_size=10, flush_interval=60)
+        for event in events(2):
+            await sink.put(event)
+        with pytest.raises(ConnectionError):
+            await sink.flush()
+        pending = sink.stats()["pending"]
+        container["container"] = FakeContainer()
+        await sink.close()
+        return pending, sink
+
+    pending, sink = asyncio.run(run())
+    assert pending == 2
+    assert sink.counters["flushed"] == 2
+
+
+def test_put_drops_event_when_queue_stays_full(container):
+    async def run():
+        sink = EventSink(batch_size=10, flush_interval=60, max_queue=1, put_timeout=0.01)
+        accepted = [await sink.put(event) for event in events(2)]
+        dropped = sink.counters["dropped"]
+        await sink.close()
+        return accepted, dropped
+
+    assert asyncio.run(run()) == ([True, False], 1)
+
+
+def test_write_latency_measures_the_cosmos_write_not_the_enqueue(container):
+    class SlowContainer(FakeContainer):
+        async def execute_item_batch(self, batch_operations, partition_key):
+            await asyncio.sleep(0.05)
+            await super().execute_item_batch(batch_operations, partition_key)
+
+    container["container"] = SlowContainer()
+
+    async def run():
+        sink = EventSink(batch_size=10, flush_interval=60)
+        for event in events(4):
+            await sink.put(event)
+        assert sink.report()["write_p95_ms"] is None
+        await sink.close()
+        return sink
+
+    sink = asyncio.run(run())
+    assert sink.write_latency.total == 2
+    assert sink.report()["write_p50_ms"] >= 50
+    assert sink.stats()["write_latency_ms"]["count"] == 2
@@ -0,0 +1,108 @@
+import functools
+import gzip
+import json
+import types
+
+import pytest
+
+kusto_ingest = pytest.importorskip("analyze_sentiment.kusto_ingest")
+
+
+def decode(compressed):
+    return [json.loads(line) for line in gzip.decompress(compressed).splitlines()]
+
+
+def records(count, width=10):
+    return [{"metric": "m", "value": i, "pad": "x" * width} for i in range(count)]
+
+
+def line_size(record):
+    return len((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+def test_chunks_respect_max_bytes_and_keep_every_record():
+    items = records(10)
+    max_bytes = 3 * line_size(items[0])
+    chunks = list(kusto_ingest.iter_gzip_chunks(items, max_bytes=max_bytes))
+    assert [rows for _, _, rows in chunks] == [3, 3, 3, 1]
+    assert all(raw_size <= max_bytes for _, raw_size, _ in chunks)
+    assert [record for compressed, _, _ in chunks for record in decode(compressed)] == items
+    assert sum(raw_size for _, raw_size, _ in chunks) == sum(line_size(r) for r in items)
+
+
+def test_oversized_record_gets_its_own_chunk():
+    items = records(1) + records(1, width=500) + records(1)
+    chunks = list(kusto_ingest.iter_gzip_chunks(items, max_bytes=100))
+    assert [rows for _, _, rows in chunks] == [1, 1, 1]
+    assert decode(chunks[1][0]) == [items[1]]
+
+
+def test_no_records_no_chunks():
+    assert list(kusto_ingest.iter_gzip_chunks([], max_bytes=100)) == []
+
+
+def test_non_ascii_is_counted_in_utf8_bytes():
+    item = {"metric": "sentiment", "label": "позитивний"}
+    [(compressed, raw_size, rows)] = kusto_ingest.iter_gzip_chunks([item], max_bytes=1000)
+    assert raw_size == line_size(item) > len(json.dumps(item, ensure_ascii=False)) + 1
+    assert decode(compressed) == [item]
+
+
+class RecordingClient:
+    def __init__(self, failing_chunks=()):
+        self.failing_chunks = set(failing_chunks)
+        self.calls = 0
+        self.rows = []
+
+    def ingest_from_stream(self, descriptor, ingestion_properties=None):
+        self.calls += 1
+        if self.calls in self.failing_chunks:
+            raise RuntimeError("ingestion unavailable")
+        self.rows.extend(decode(descriptor.stream.read()))
+
+
+@pytest.fixture
+def make_ingestor(monkeypatch):
+    pytest.importorskip("azure.kusto.ingest")
+    kusto_ingest.load_sdk()
+    iter_gzip_chunks = kusto_ingest.iter_gzip_chunks
+
+    def make(client, chunk_bytes):
+        monkeypatch.setattr(kusto_ingest, "iter_gzip_chunks", functools.partial(iter_gzip_chunks, max_bytes=chunk_bytes))
+        ingestor = kusto_ingest.KustoIngestor.__new__(kusto_ingest.KustoIngestor)
+        ingestor.mode = "queued"
+        ingestor.client = client
+        ingestor.properties = types.SimpleNamespace(database="db", table="DialogMetrics")
+        ingestor.totals = {"rows": 0, "chunks": 0, "raw_bytes": 0, "compressed_bytes": 0, "failed_rows": 0}
+        return ingestor
+
+    return make
+
+
+def test_ingest_sends_every_chunk_and_totals_add_up(make_ingestor):
+    items = records(7)
+    client = RecordingClient()
+    ingestor = make_ingestor(client, 2 * line_size(items[0]))
+    stats = ingestor.ingest(items)
+    assert stats["ok"] is True
+    assert (stats["rows"], stats["chunks"]) == (7, 4)
+    assert client.rows == items
+    assert ingestor.totals["rows"] == 7 and ingestor.totals["raw_bytes"] == stats["raw_bytes"]
+    assert stats["compression_ratio"] == round(stats["raw_bytes"] / stats["compressed_bytes"], 2)
+
+
+def test_failed_chunk_is_skipped_unless_stop_on_error(make_ingestor):
+    items = records(6)
+    chunk_bytes = 2 * line_size(items[0])
+
+    stats = make_ingestor(RecordingClient(failing_chunks={2}), chunk_bytes).ingest(items)
+    assert stats["ok"] is False
+    assert (stats["rows"], stats["chunks"]) == (4, 2)
+
+    client = RecordingClient(failing_chunks={2})
+    ingestor = make_ingestor(client, chunk_bytes)
+    stats = ingestor.ingest(items, stop_on_error=True)
+    # rows — лише перші записи, що точно відправлені: replay spool-у продовжить з третього
+    assert (stats["ok"], stats["rows"]) == (False, 2)
+    assert client.rows == items[:2] and client.calls == 2
+    assert ingestor.totals["failed_rows"] == 2
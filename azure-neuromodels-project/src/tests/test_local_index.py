@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+pytest.importorskip("azure.cosmos")
+
+import ask  # noqa: E402
+from ask import local_index  # noqa: E402
+
+DOCS = [
+    {"id": "1", "title": "Оплата", "content": "Оплата рахунку карткою або через банк"},
+    {"id": "2", "title": "Доставка", "content": "Доставка замовлення кур'єром по місту"},
+    {"id": "3", "title": "Повернення", "content": "Повернення товару протягом 14 днів, оплата повертається на картку"},
+]
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    local_index.build_snapshot(DOCS, str(tmp_path))
+    loaded = local_index.load_current(str(tmp_path))
+    monkeypatch.setattr(local_index, "get_index", lambda: loaded)
+    return loaded
+
+
+def test_scores_are_normalized_per_query(index):
+    short = index.search("доставка")["value"]
+    long = index.search("доставка замовлення кур'єром по місту")["value"]
+    # Сирий BM25 довшого запиту в рази більший; нормований — ні
+    assert short[0]["id"] == long[0]["id"] == "2"
+    assert short[0]["@search.score"] == pytest.approx(1.0)
+    assert long[0]["@search.score"] == pytest.approx(1.0)
+    assert all(0 < doc["@search.score"] <= 1 for doc in index.search("оплата картка повернення")["value"])
+
+
+def test_min_score_filters_each_document(index):
+    result = local_index.search("повернення оплата", min_score=0.6)
+    assert result["@search.backend"] == "local"
+    assert [doc["id"] for doc in result["value"]] == ["3"]
+    assert local_index.search("погода", min_score=0.1) is None
+
+
+def test_local_query_has_no_template_words(index, monkeypatch):
+    queries = []
+    monkeypatch.setattr(local_index, "SEARCH_BACKEND", "local")
+    monkeypatch.setattr(local_index, "search", lambda query: queries.append(query) or None)
+    asyncio.run(ask.get_search_results("а доставка?", previous_qa="Як оплатити? Карткою"))
+    assert queries == ["Як оплатити? Карткою а доставка?"]
+
@@ -0,0 +1,111 @@
+import functools
+import gzip
+import json
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+from analyze_sentiment import metric_spool
+from analyze_sentiment.metric_spool import MetricSpool, read_segment
+
+
+class FlakyIngestClient:
+    """
+    Приймає перші ok_chunks чанків, далі падає.
+    """
+
+    def __init__(self, ok_chunks):
+        self.ok_chunks = ok_chunks
+        self.rows = []
+
+    def ingest_from_stream(self, descriptor, ingestion_properties=None):
+        if self.ok_chunks == 0:
+            raise RuntimeError("ingestion unavailable")
+        self.ok_chunks -= 1
+        self.rows.extend(json.loads(line) for line in gzip.decompress(descriptor.stream.read()).splitlines())
+
+
+def make_ingestor(monkeypatch, client):
+    kusto_ingest = pytest.importorskip("analyze_sentiment.kusto_ingest")
+    pytest.importorskip("azure.kusto.ingest")
+    kusto_ingest.load_sdk()
+    # Малі чанки: кожен рядок метрики (~30 байт) — окремий чанк
+    monkeypatch.setattr(kusto_ingest, "iter_gzip_chunks", functools.partial(kusto_ingest.iter_gzip_chunks, max_bytes=40))
+    ingestor = kusto_ingest.KustoIngestor.__new__(kusto_ingest.KustoIngestor)
+    ingestor.mode = "queued"
+    ingestor.client = client
+    ingestor.properties = types.SimpleNamespace(database="db", table="DialogMetrics")
+    ingestor.totals = {"rows": 0, "chunks": 0, "raw_bytes": 0, "compressed_bytes": 0, "failed_rows": 0}
+    return ingestor
+
+
+def rows(start, count):
+    return [{"metric": "m", "value": i} for i in range(start, start + count)]
+
+
+def test_replay_does_not_resend_ingested_chunks(tmp_path, monkeypatch):
+    spool = MetricSpool(str(tmp_path), segment_bytes=1)
+    spool.append(rows(0, 3))
+    spool.append(rows(3, 3))
+    client = FlakyIngestClient(ok_chunks=4)
+    ingestor = make_ingestor(monkeypatch, client)
+
+    stats = spool.replay(ingestor.ingest)
+    assert stats["ok"] is False
+    assert stats["rows"] == 4 and stats["segments"] == 1
+    segments = sorted(p for p in os.listdir(tmp_path) if p.endswith(".seg"))
+    assert [list(read_segment(os.path.join(tmp_path, p))) for p in segments] == [rows(4, 2)]
+
+    client.ok_chunks = 10
+    stats = spool.replay(ingestor.ingest)
+    assert stats["ok"] is True
+    assert client.rows == rows(0, 6)
+    assert os.listdir(tmp_path) == []
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_seal_only_abandoned_segments_of_this_instance(tmp_path):
+    def touch(name):
+        with open(tmp_path / name, "wb") as f:
+            f.write(metric_spool.encode_record({"metric": "m", "value": 1}))
+
+    here = metric_spool.INSTANCE_ID
+    dead = dead_pid()
+    touch(f"{1:020d}-{here}-{dead}-0a1b2c3d.open")
+    touch(f"{2:020d}-{here}-{os.getppid()}-0a1b2c3d.open")
+    touch(f"{3:020d}-otherinstance-{dead}-0a1b2c3d.open")
+    touch(f"{4:020d}.replaying-{here}-{dead}-0a1b2c3d")
+    # Імена без мітки запуску (до її появи) теж розбираються
+    touch(f"{5:020d}-{here}-{dead}.open")
+
+    spool = MetricSpool(str(tmp_path))
+    spool._seal_stale()
+    assert sorted(os.listdir(tmp_path)) == [
+        f"{1:020d}-{here}-{dead}-0a1b2c3d.seg",
+        f"{2:020d}-{here}-{os.getppid()}-0a1b2c3d.open",
+        f"{3:020d}-otherinstance-{dead}-0a1b2c3d.open",
+        f"{4:020d}.seg",
+        f"{5:020d}-{here}-{dead}.seg",
+    ]
+
+
+def test_seal_segments_of_a_previous_start_with_the_same_pid(tmp_path):
+    spool = MetricSpool(str(tmp_path), segment_bytes=10 ** 6)
+    spool.append([{"metric": "m", "value": 1}])
+    ours = os.path.basename(spool._active_path)
+    # Попередній запуск воркера з тим самим pid (типово для контейнера): мітка запуску інша
+    previous = f"{1:020d}-{metric_spool.INSTANCE_ID}-{os.getpid()}-ffffffff.open"
+    with open(tmp_path / previous, "wb") as f:
+        f.write(metric_spool.encode_record({"metric": "m", "value": 0}))
+
+    spool._seal_stale()
+    assert sorted(os.listdir(tmp_path)) == sorted([previous[:-len(".open")] + ".seg", ours])
+    assert metric_spool.owner_of(ours) == (metric_spool.INSTANCE_ID, os.getpid(), metric_spool.PROCESS_START_ID)
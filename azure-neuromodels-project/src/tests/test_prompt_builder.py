@@ -0,0 +1,207 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from ask import prompt_builder
+
+
+class CharEncoding:
+    """
+    Токенізатор "символ = токен": бюджети в тестах рахуються без завантаження словника tiktoken.
+    """
+
+    def encode(self, text):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture(autouse=True)
+def char_tokens(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "_encoding", CharEncoding())
+
+
+def turn_cost(question, answer):
+    return len(prompt_builder.format_turn(question, answer)) + len(prompt_builder.TURN_SEPARATOR)
+
+
+def make_turns(count):
+    return [{"question": f"q{i}", "answer": f"a{i}"} for i in range(count)]
+
+
+def test_select_history_keeps_newest_turns_within_budget_in_chronological_order():
+    turns = [("q3", "a3"), ("q2", "a2"), ("q1", "a1")]
+    budget = turn_cost("q3", "a3") + turn_cost("q2", "a2")
+    assert prompt_builder.select_history(turns, budget=budget) == [("q2", "a2"), ("q3", "a3")]
+    assert prompt_builder.select_history(turns, budget=budget - 1) == [("q3", "a3")]
+
+
+def test_select_history_caps_turn_count(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "MAX_HISTORY_TURNS", 2)
+    turns = [(f"q{i}", f"a{i}") for i in range(5)]
+    assert prompt_builder.select_history(turns, budget=10 ** 6) == [("q1", "a1"), ("q0", "a0")]
+
+
+def test_history_overflow_returns_oldest_turns_outside_the_prompt():
+    turns = make_turns(4)
+    budget = 2 * turn_cost("q0", "a0")
+    assert prompt_builder.history_overflow(turns, budget=budget) == turns[:2]
+    assert prompt_builder.history_overflow(turns, budget=10 ** 6, max_turns=3) == turns[:1]
+    assert prompt_builder.history_overflow(turns, budget=10 ** 6) == []
+
+
+def test_select_docs_orders_by_score_and_truncates_the_last_chunk():
+    docs = [
+        {"content": "low" * 10, "@search.score": 0.1},
+        {"content": "high", "@search.score": 0.9},
+        {"content": "   ", "@search.score": 1.0},
+    ]
+    budget = len("high") + len(prompt_builder.TURN_SEPARATOR) + 5
+    assert prompt_builder.select_docs(docs, budget=budget) == ["high", "lowlo"]
+
+
+def test_build_respects_section_budgets(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "SUMMARY_TOKEN_BUDGET", 10)
+    monkeypatch.setattr(prompt_builder, "QUESTION_TOKEN_BUDGET", 8)
+    prompt = prompt_builder.build("H\n", "q" * 50, [("old", "answer")], "s" * 50, [{"content": "kb"}])
+    assert list(prompt.section_tokens) == ["header", "summary", "history", "knowledge_base", "question"]
+    assert "s" * 10 + "\n" in prompt.text and "s" * 11 not in prompt.text
+    assert "q" * 8 + "\n" in prompt.text and "q" * 9 not in prompt.text
+    assert prompt.total_tokens == len(prompt.text)
+
+
+def test_build_omits_empty_sections():
+    prompt = prompt_builder.build("H\n", "q", [], "", [])
+    assert list(prompt.section_tokens) == ["header", "question"]
+
+
+def test_summary_due_waits_for_enough_overflow(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "SUMMARY_MIN_OVERFLOW_TURNS", 3)
+    monkeypatch.setattr(prompt_builder, "SUMMARY_MIN_OVERFLOW_TOKENS", 10 ** 6)
+    assert not prompt_builder.summary_due([])
+    assert not prompt_builder.summary_due(make_turns(2))
+    assert prompt_builder.summary_due(make_turns(3))
+    # Повний документ історії: наступна пара витіснила б незгорнуту — згортаємо одразу
+    assert prompt_builder.summary_due(make_turns(1), doc_full=True)
+
+
+def test_summary_due_on_token_threshold(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "SUMMARY_MIN_OVERFLOW_TURNS", 10)
+    monkeypatch.setattr(prompt_builder, "SUMMARY_MIN_OVERFLOW_TOKENS", 100)
+    assert not prompt_builder.summary_due([{"question": "q", "answer": "a"}])
+    assert prompt_builder.summary_due([{"question": "q" * 60, "answer": "a" * 60}])
+
+
+class FakeHistoryContainer:
+    pass
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def ask_module(monkeypatch):
+    pytest.importorskip("azure.functions")
+    pytest.importorskip("azure.cosmos")
+    import ask
+    from ask import cosmos_pool, history_store
+
+    state = {"folded": []}
+
+    async def get_container():
+        return FakeHistoryContainer()
+
+    async def fold_into_summary(container, user_id, folded_turns, summary):
+        state["folded"].append((folded_turns, summary))
+
+    monkeypatch.setattr(cosmos_pool, "get_container", get_container)
+    monkeypatch.setattr(history_store, "fold_into_summary", fold_into_summary)
+    monkeypatch.setattr(prompt_builder, "SUMMARY_MIN_OVERFLOW_TURNS", 3)
+    monkeypatch.setattr(prompt_builder, "SUMMARY_MIN_OVERFLOW_TOKENS", 10 ** 6)
+    monkeypatch.setattr(ask.admission, "_controller", None)
+    return ask, state
+
+
+def long_turns(count):
+    # Кожна пара ~270 "токенів": у бюджет історії за замовчуванням (600) вміщаються дві останні
+    return [{"question": f"q{i}", "answer": "a" * 250} for i in range(count)]
+
+
+def with_turns(monkeypatch, ask, count):
+    async def append_turn(container, user_id, turn):
+        return {"turns": long_turns(count), "summary": ""}
+
+    monkeypatch.setattr(ask.history_store, "append_turn", append_turn)
+
+
+def fake_openai(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_small_overflow_is_not_summarized(monkeypatch, ask_module):
+    ask, state = ask_module
+    with_turns(monkeypatch, ask, 4)
+
+    async def create(**kwargs):
+        pytest.fail("summary requested for a small overflow")
+
+    monkeypatch.setattr(ask, "_openai_client", fake_openai(create))
+    asyncio.run(ask.append_user_history("u", "d", "q", "a"))
+    assert state["folded"] == []
+
+
+def test_summary_runs_through_admission_and_folds_overflow(monkeypatch, ask_module):
+    ask, state = ask_module
+    with_turns(monkeypatch, ask, 5)
+    seen = {}
+
+    async def create(**kwargs):
+        seen["in_flight"] = ask.admission.get_controller().in_flight
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=" summary "))])
+
+    monkeypatch.setattr(ask, "_openai_client", fake_openai(create))
+
+    async def scenario():
+        await ask.append_user_history("u", "d", "q", "a")
+        return ask.admission.get_controller()
+
+    controller = asyncio.run(scenario())
+    assert seen["in_flight"] == 1 and controller.in_flight == 0
+    assert state["folded"] == [(long_turns(3), "summary")]
+
+
+def test_summary_throttling_lowers_the_admission_limit(monkeypatch, ask_module):
+    ask, state = ask_module
+    with_turns(monkeypatch, ask, 5)
+
+    async def create(**kwargs):
+        raise RateLimited()
+
+    monkeypatch.setattr(ask, "_openai_client", fake_openai(create))
+
+    async def scenario():
+        controller = ask.admission.get_controller()
+        before = controller.limit
+        await ask.append_user_history("u", "d", "q", "a")
+        return before, controller
+
+    before, controller = asyncio.run(scenario())
+    assert controller.limit == max(controller.min_limit, before / 2)
+    assert controller.metrics["throttled"] == 1 and controller.in_flight == 0
+    assert state["folded"] == []
+
+
+def test_summary_timeout_defers_folding(monkeypatch, ask_module):
+    ask, state = ask_module
+    with_turns(monkeypatch, ask, 5)
+    monkeypatch.setattr(ask, "get_settings", lambda: SimpleNamespace(summary_timeout_s=0.01))
+
+    async def create(**kwargs):
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(ask, "_openai_client", fake_openai(create))
+    asyncio.run(ask.append_user_history("u", "d", "q", "a"))
+    assert state["folded"] == []
@@ -0,0 +1,74 @@
+import asyncio
+
+from analyze_sentiment import result_writer
+from analyze_sentiment.result_writer import ResultWriter, build_patch_operations
+
+
+class FakeContainer:
+    def __init__(self, batch_error=None, failing_ids=(), charge="2.5"):
+        self.batches = []
+        self.patches = []
+        self.batch_error = batch_error
+        self.failing_ids = set(failing_ids)
+        self.charge = charge
+
+    async def execute_item_batch(self, batch_operations, partition_key, response_hook=None):
+        if self.batch_error is not None:
+            raise self.batch_error
+        self.batches.append((partition_key, [args[0] for _, args in batch_operations]))
+        response_hook({"x-ms-request-charge": self.charge})
+
+    async def patch_item(self, item, partition_key, patch_operations, response_hook=None):
+        if item in self.failing_ids:
+            raise RuntimeError("patch failed")
+        self.patches.append((partition_key, item))
+        response_hook({"x-ms-request-charge": self.charge})
+
+
+def analyzed(item_id, user_id, **meta):
+    return {"id": item_id, "user_id": user_id, "meta": {"sentiment": "positive", **meta}}
+
+
+def test_patch_operations_touch_only_result_fields():
+    item = analyzed("m1", "u1", lang="uk", source="search", score=None)
+    assert build_patch_operations(item) == [
+        {"op": "set", "path": "/meta/sentiment", "value": "positive"},
+        {"op": "set", "path": "/meta/lang", "value": "uk"},
+    ]
+    assert build_patch_operations(item, meta_existed=False) == [
+        {"op": "set", "path": "/meta", "value": {"sentiment": "positive", "lang": "uk"}}
+    ]
+    assert build_patch_operations({"id": "m2", "meta": {"source": "search"}}) == []
+
+
+def test_patches_are_batched_per_partition_key(monkeypatch):
+    monkeypatch.setattr(result_writer, "MAX_TRANSACTIONAL_BATCH", 2)
+    container = FakeContainer()
+    items = [analyzed(f"a{i}", "u1") for i in range(3)] + [analyzed("b0", "u2"), {"id": "c0", "user_id": "u3"}]
+    stats = asyncio.run(ResultWriter(container).write(items))
+    assert sorted(container.batches) == [("u1", ["a0", "a1"])]
+    # Одиночний patch для партицій з одним документом: batch з однієї операції не потрібен
+    assert sorted(container.patches) == [("u1", "a2"), ("u2", "b0")]
+    assert (stats["written"], stats["skipped"], stats["batches"], stats["failed"]) == (4, 1, 1, 0)
+    assert stats["request_charge"] == 7.5
+
+
+def test_failed_batch_falls_back_to_single_patches():
+    container = FakeContainer(batch_error=RuntimeError("batch failed"), failing_ids={"a1"})
+    writer = ResultWriter(container)
+    stats = asyncio.run(writer.write([analyzed(f"a{i}", "u1") for i in range(3)]))
+    assert sorted(item for _, item in container.patches) == ["a0", "a2"]
+    assert (stats["written"], stats["failed"]) == (2, 1)
+    assert writer.failed_ids == {"a1"}
+
+
+def test_missing_meta_sets_the_whole_meta_object():
+    container = FakeContainer()
+    operations = {}
+
+    async def patch_item(item, partition_key, patch_operations, response_hook=None):
+        operations[item] = patch_operations
+
+    container.patch_item = patch_item
+    asyncio.run(ResultWriter(container).write([analyzed("m1", "u1")], missing_meta={"m1"}))
+    assert operations["m1"] == [{"op": "set", "path": "/meta", "value": {"sentiment": "positive"}}]
@@ -0,0 +1,73 @@
+import asyncio
+
+from ask import search_client
+from ask.metrics import LatencyHistogram
+
+
+class SlowSearch:
+    """
+    Заміна _with_retries: кожен виклик висить, доки його не скасують.
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+
+    async def __call__(self, search_query, **extra):
+        self.started += 1
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def make_client(monkeypatch, slow: SlowSearch) -> search_client.SearchClient:
+    monkeypatch.setattr(search_client, "SEARCH_HEDGE_ENABLED", True)
+    client = object.__new__(search_client.SearchClient)
+    client.metrics = {"hedged": 0, "hedge_wins": 0}
+    client.latency = LatencyHistogram()
+    for _ in range(search_client.SEARCH_HEDGE_MIN_SAMPLES):
+        client.latency.observe(1)
+    client._with_retries = slow
+    return client
+
+
+def test_hedged_cancels_primary_and_hedge_when_caller_is_cancelled(monkeypatch):
+    slow = SlowSearch()
+    client = make_client(monkeypatch, slow)
+
+    async def scenario():
+        caller = asyncio.ensure_future(client._hedged("q"))
+        while slow.started < 2:
+            await asyncio.sleep(0.005)
+        caller.cancel()
+        try:
+            await caller
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0)
+        # Перевіряємо до виходу з asyncio.run, який сам скасовує завислі задачі
+        assert slow.cancelled == 2
+
+    asyncio.run(scenario())
+    assert client.metrics["hedged"] == 1
+
+
+def test_hedged_cancels_primary_when_caller_times_out_before_hedge(monkeypatch):
+    slow = SlowSearch()
+    client = make_client(monkeypatch, slow)
+    client.latency = LatencyHistogram()
+    for _ in range(search_client.SEARCH_HEDGE_MIN_SAMPLES):
+        client.latency.observe(10_000)
+
+    async def scenario():
+        try:
+            await asyncio.wait_for(client._hedged("q"), timeout=0.05)
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(0)
+        assert slow.started == slow.cancelled == 1
+
+    asyncio.run(scenario())
+    assert client.metrics["hedged"] == 0
@@ -0,0 +1,108 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from analyze_sentiment import text_analytics_batcher
+from analyze_sentiment.text_analytics_batcher import AdaptiveLimiter, TextAnalyticsBatcher
+
+
+class HttpError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"Retry-After": retry_after} if retry_after else {})
+
+
+class FakeLanguageClient:
+    """
+    analyze_sentiment з чергою заготовлених помилок; рахує максимум одночасних запитів.
+    """
+
+    def __init__(self, errors=(), delay=0.0):
+        self.errors = list(errors)
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def analyze_sentiment(self, documents):
+        self.calls.append([d["id"] for d in documents])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.errors:
+                raise self.errors.pop(0)
+            return [f"result-{d['id']}" for d in documents]
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(text_analytics_batcher, "TEXT_ANALYTICS_BACKOFF_BASE_S", 0.001)
+
+
+def documents(count):
+    return [{"id": str(i), "text": f"text {i}"} for i in range(count)]
+
+
+def test_limiter_halves_on_throttle_and_recovers_after_successes():
+    limiter = AdaptiveLimiter(8)
+    limiter.on_throttled()
+    limiter.on_throttled()
+    assert limiter.limit == 2
+    for _ in range(text_analytics_batcher.RECOVERY_SUCCESSES - 1):
+        limiter.on_success()
+    assert limiter.limit == 2
+    limiter.on_success()
+    assert limiter.limit == 3
+    for _ in range(10):
+        limiter.on_throttled()
+    assert limiter.limit == 1
+
+
+def test_results_are_aligned_with_documents_across_batches():
+    client = FakeLanguageClient()
+    batcher = TextAnalyticsBatcher(client)
+    results = asyncio.run(batcher.analyze_sentiment(documents(25)))
+    assert results == [f"result-{i}" for i in range(25)]
+    assert [len(call) for call in client.calls] == [10, 10, 5]
+    assert batcher.stats()["documents"] == 25
+
+
+def test_concurrency_never_exceeds_the_limit():
+    client = FakeLanguageClient(delay=0.01)
+    batcher = TextAnalyticsBatcher(client, max_concurrency=2)
+    asyncio.run(batcher.analyze_sentiment(documents(60)))
+    assert client.max_in_flight == 2
+    assert len(client.calls) == 6
+
+
+def test_throttled_batch_is_retried_and_lowers_the_limit():
+    client = FakeLanguageClient(errors=[HttpError(429, retry_after="0")])
+    batcher = TextAnalyticsBatcher(client, max_concurrency=4)
+    results = asyncio.run(batcher.analyze_sentiment(documents(3)))
+    assert results == ["result-0", "result-1", "result-2"]
+    stats = batcher.stats()
+    assert (stats["throttled"], stats["retries"], stats["requests"]) == (1, 1, 2)
+    assert stats["concurrency_limit"] == 2
+
+
+def test_failed_batch_yields_none_for_its_documents_only():
+    client = FakeLanguageClient(errors=[HttpError(400)])
+    batcher = TextAnalyticsBatcher(client, max_concurrency=1)
+    results = asyncio.run(batcher.analyze_sentiment(documents(12)))
+    assert results == [None] * 10 + ["result-10", "result-11"]
+    assert batcher.stats()["failed_batches"] == 1
+
+
+def test_retries_give_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(text_analytics_batcher, "TEXT_ANALYTICS_MAX_RETRIES", 2)
+    client = FakeLanguageClient(errors=[HttpError(503)] * 5)
+    batcher = TextAnalyticsBatcher(client)
+    assert asyncio.run(batcher.analyze_sentiment(documents(2))) == [None, None]
+    assert len(client.calls) == 3
+    # 5xx — не throttling: ліміт паралельності не зменшується
+    assert batcher.stats()["concurrency_limit"] == text_analytics_batcher.TEXT_ANALYTICS_CONCURRENCY
@@ -0,0 +1,49 @@
+import asyncio
+import importlib
+import sys
+
+import pytest
+
+pytest.importorskip("azure.functions")
+pytest.importorskip("azure.cosmos")
+pytest.importorskip("aiohttp")
+pytest.importorskip("openai")
+
+
+@pytest.fixture
+def ask_env(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "key")
+    monkeypatch.setenv("SEARCH_SERVICE_ENDPOINT", "https://test.search.windows.net")
+    monkeypatch.setenv("SEARCH_API_KEY", "key")
+    monkeypatch.setenv("SEARCH_INDEX_NAME", "kb")
+    for name in ("COSMOSDB_ENDPOINT", "COSMOSDB_KEY"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_warmed_clients_are_the_ones_ask_uses(host_app, ask_env, monkeypatch):
+    top_level_ask = sys.modules.get("ask")
+    warmup = importlib.import_module("__app__.warmup")
+    ask = importlib.import_module("__app__.ask")
+    # Токенізатор завантажує словник з мережі — тут не потрібен
+    monkeypatch.setattr(ask.prompt_builder, "get_encoding", lambda: None)
+
+    async def run():
+        result = await warmup.warm_ask()
+        client = ask.search_client.get_client()
+        warmed = ask.search_client._client
+        await client.close()
+        return result, client, warmed
+
+    result, client, warmed = asyncio.run(run())
+    assert result["cosmos"] is False
+    assert client is warmed
+    assert ask._openai_client is not None
+    # Прогрів не створив окремої копії пакета ask поза __app__
+    assert sys.modules.get("ask") is top_level_ask
+
+
+def test_bulk_shares_admission_with_ask(host_app):
+    ask_bulk = importlib.import_module("__app__.ask_bulk")
+    ask = importlib.import_module("__app__.ask")
+    assert ask_bulk.bulk is ask.bulk
+    assert ask.bulk.admission is ask.admission
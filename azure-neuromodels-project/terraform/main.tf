@@ -46,6 +46,11 @@ module "function_app" {
     COSMOSDB_KEY            = module.cosmosdb_serverless.cosmosdb_account_primary_key
     COSMOSDB_DATABASE       = "neuromodels-dialogs"
     COSMOSDB_CONTAINER      = "dialog_events"
+    ANSWER_CACHE_L2         = "cosmos"
+    ANSWER_CACHE_CONTAINER  = "answer_cache"
+    SENTIMENT_MODE          = "changefeed"
+    SENTIMENT_LEASES_CONTAINER = "leases"
+    KUSTO_SPOOL_DIR         = "/home/data/kusto_spool"
     TEXT_ANALYTICS_ENDPOINT = module.cognitive_services.endpoint
     TEXT_ANALYTICS_KEY      = module.cognitive_services.primary_key
 
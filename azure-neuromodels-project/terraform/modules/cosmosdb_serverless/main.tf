@@ -29,3 +29,22 @@ resource "azurerm_cosmosdb_sql_container" "this" {
   database_name       = azurerm_cosmosdb_sql_database.this.name
   partition_key_paths = ["/user_id"]
 }
+
+# Спільний кеш відповідей ask (L2). default_ttl = -1 вмикає TTL на рівні документа
+resource "azurerm_cosmosdb_sql_container" "answer_cache" {
+  name                = var.answer_cache_container_name
+  resource_group_name = var.resource_group_name
+  account_name        = azurerm_cosmosdb_account.this.name
+  database_name       = azurerm_cosmosdb_sql_database.this.name
+  partition_key_paths = ["/id"]
+  default_ttl         = -1
+}
+
+# Checkpoint-и (continuation token) обробки change feed для sentiment
+resource "azurerm_cosmosdb_sql_container" "leases" {
+  name                = var.leases_container_name
+  resource_group_name = var.resource_group_name
+  account_name        = azurerm_cosmosdb_account.this.name
+  database_name       = azurerm_cosmosdb_sql_database.this.name
+  partition_key_paths = ["/id"]
+}
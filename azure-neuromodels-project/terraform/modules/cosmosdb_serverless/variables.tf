@@ -22,3 +22,15 @@ variable "container_name" {
   description = "Cosmos DB container name"
   type        = string
 }
+
+variable "answer_cache_container_name" {
+  description = "Cosmos DB container for the shared answer cache"
+  type        = string
+  default     = "answer_cache"
+}
+
+variable "leases_container_name" {
+  description = "Cosmos DB container for change feed checkpoints"
+  type        = string
+  default     = "leases"
+}
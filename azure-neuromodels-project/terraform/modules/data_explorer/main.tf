@@ -24,3 +24,42 @@ output "kusto_uri" {
 output "kusto_database_name" {
   value = azurerm_kusto_database.main.name
 }
+
+# Схема DialogMetrics: колонка stage для рядків metric='latency' (етапи функції ask).
+# .create-merge лише додає відсутні колонки і не чіпає наявні.
+resource "azurerm_kusto_script" "dialog_metrics_schema" {
+  name                       = "dialog-metrics-schema"
+  database_id                = azurerm_kusto_database.main.id
+  continue_on_errors_enabled = false
+  script_content             = <<-KQL
+    .create-merge table DialogMetrics (stage:string)
+  KQL
+}
+
+# Погодинні rollup-и для дашборду: analytics_proxy читає їх замість сирих рядків DialogMetrics,
+# тож вартість запиту залежить від вікна часу, а не від усієї історії.
+# label — значення для sentiment/language/keyword і етап для latency; digest — t-digest числових метрик
+# (latency, backlog_lag_s, spool_depth_bytes) для p50/p95 за довільне вікно.
+resource "azurerm_kusto_script" "dialog_metrics_rollups" {
+  name                       = "dialog-metrics-rollups"
+  database_id                = azurerm_kusto_database.main.id
+  continue_on_errors_enabled = false
+  script_content             = <<-KQL
+    .create ifnotexists materialized-view with (backfill=true) DialogMetricsHourly on table DialogMetrics
+    {
+        DialogMetrics
+        | extend label = case(metric == 'latency', tostring(stage), metric in ('sentiment', 'language', 'keyword'), tostring(value), '')
+        | extend number = iff(metric in ('sentiment', 'language', 'keyword'), real(null), todouble(value))
+        | summarize value = count(), digest = tdigest(number) by hour = bin(TimeGenerated, 1h), metric, label
+    }
+
+    .create ifnotexists materialized-view with (backfill=true) DialogUsersHourly on table DialogMetrics
+    {
+        DialogMetrics
+        | where metric in ('sentiment', 'language', 'keyword') and isnotempty(user_id)
+        | summarize value = count() by hour = bin(TimeGenerated, 1h), user_id
+    }
+  KQL
+
+  depends_on = [azurerm_kusto_script.dialog_metrics_schema]
+}